@@ -0,0 +1,156 @@
+import csv
+import gzip
+import os
+import re
+import sys
+import threading
+import time
+
+
+# Local airport database (ICAO, IATA, name, position) so waypoints are
+# validated, translated and placed without a network call. The seed file is
+# data/airports.csv.gz, from the airportsdata package (see
+# data/airports.LICENSE); AEROBRIEF_AIRPORTS points at another CSV with the
+# same columns, gzipped or not.
+AIRPORTS_PATH = os.environ.get(
+    "AEROBRIEF_AIRPORTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "airports.csv.gz"))
+SUGGESTIONS = 8
+# Letter plus three letters or digits, e.g. KSFO, K0Q5.
+ICAO_CODE = re.compile(r"[A-Z][A-Z0-9]{3}")
+
+
+class Airport:
+    __slots__ = ("icao", "iata", "name", "city", "country", "lat", "lon")
+
+    def __init__(self, row):
+        self.icao = sys.intern(row["icao"].upper())
+        self.iata = sys.intern(row["iata"].upper()) if row.get("iata") else None
+        self.name = row["name"]
+        self.city = row.get("city", "")
+        self.country = sys.intern(row.get("country", ""))
+        self.lat = float(row["lat"])
+        self.lon = float(row["lon"])
+
+    def label(self):
+        codes = f"{self.icao}/{self.iata}" if self.iata else self.icao
+        return f"{codes} – {self.name}" + (f", {self.city}" if self.city else "")
+
+    def __repr__(self):
+        return f"Airport({self.icao!r})"
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children = None
+        self.top = []
+
+
+class AirportIndex:
+    # Prefix trie over ICAO and IATA codes. Every node keeps its best
+    # SUGGESTIONS airports (ICAO matches before IATA ones, then airports with
+    # an IATA code, i.e. scheduled service), so completing a prefix is a walk
+    # of at most four nodes. Completions list the ICAO-prefix matches first,
+    # so "KSF" offers KSFO before Kassel (IATA KSF).
+
+    def __init__(self, airports):
+        self.airports = airports
+        self._codes = {}
+        self._root = _Node()
+        # Inserting in rank order means each node's first SUGGESTIONS
+        # airports are its best ones.
+        by_rank = sorted(airports, key=lambda a: (a.iata is None, a.icao))
+        entries = [(a.icao, a) for a in by_rank] + sorted((a.iata, a) for a in by_rank if a.iata)
+        for code, airport in entries:
+            self._codes.setdefault(code, airport)
+            node = self._root
+            for char in code:
+                if node.children is None:
+                    node.children = {}
+                node = node.children.get(char) or node.children.setdefault(char, _Node())
+                if len(node.top) < SUGGESTIONS and airport not in node.top:
+                    node.top.append(airport)
+
+    def lookup(self, code):
+        # The airport for an ICAO or IATA code, or None.
+        return self._codes.get(code.strip().upper())
+
+    def complete(self, prefix, limit=SUGGESTIONS):
+        prefix = prefix.strip().upper()
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char) if node.children else None
+            if node is None:
+                return []
+        exact = self._codes.get(prefix)
+        icao = [a for a in node.top if a.icao.startswith(prefix)]
+        icao.sort(key=lambda a: a.icao != prefix)
+        matches = icao + ([exact] if exact else []) + node.top
+        return list(dict.fromkeys(matches))[:limit]
+
+    def suggest(self, code, limit=SUGGESTIONS):
+        # Closest codes for a typo: completions of the longest prefix (of two
+        # characters or more) that still matches something.
+        code = code.strip().upper()
+        for end in range(len(code), 1, -1):
+            matches = self.complete(code[:end], limit)
+            if matches:
+                return matches
+        return []
+
+    def resolve(self, code):
+        # ICAO code for an ICAO or IATA code. A well-formed ICAO code the
+        # database lacks (small fields) is passed through with a warning and
+        # left to the airport API; anything else is a ValueError with
+        # suggestions.
+        airport = self.lookup(code)
+        if airport is not None:
+            return airport.icao
+        code = code.strip().upper()
+        if ICAO_CODE.fullmatch(code):
+            print(f"Airport {code} is not in the local database, looking it up upstream")
+            return code
+        suggestions = ", ".join(a.icao for a in self.suggest(code))
+        hint = f" (did you mean {suggestions}?)" if suggestions else ""
+        raise ValueError(f"Unknown airport '{code}'{hint}")
+
+
+def load_airports(path=AIRPORTS_PATH):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        return [Airport(row) for row in csv.DictReader(f)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def airport_index():
+    # Built on first use (~0.2 s), then shared. None without a database file,
+    # in which case callers fall back to the aviationweather.gov airport API.
+    global _index
+    with _index_lock:
+        if _index is None and os.path.exists(AIRPORTS_PATH):
+            _index = AirportIndex(load_airports(AIRPORTS_PATH))
+        return _index
+
+
+def to_icao(code):
+    # IATA codes become ICAO; anything the database does not know is
+    # returned as typed and left for lat_log to reject.
+    index = airport_index()
+    airport = index.lookup(code) if index is not None else None
+    return airport.icao if airport is not None else code.strip().upper()
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    index = airport_index()
+    print(f"{len(index.airports)} airports indexed in {(time.perf_counter() - start) * 1e3:.0f} ms")
+    queries = sys.argv[1:] or ["K", "KS", "KSF", "SFO", "EGL", "KSFX"]
+    for query in queries:
+        start = time.perf_counter()
+        matches = index.complete(query) or index.suggest(query)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(f"{query:6s} {elapsed:7.1f} µs  " + "; ".join(a.label() for a in matches[:4]))
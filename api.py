@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import upstream
+from airports import airport_index, to_icao
+from briefing import BriefingGraph, airport_stage, run_briefing
+from helper import lat_log
+
+try:
+    from fastapi import FastAPI, HTTPException, Response
+except ImportError:
+    FastAPI = None
+
+
+# The briefing pipeline as an HTTP service, for dispatch systems and EFBs
+# (and the Streamlit app, with AEROBRIEF_API_URL set):
+#
+#   python api.py serve --port 8000
+#
+#   GET /airports?prefix=KSF                 autocomplete (ICAO or IATA)
+#   GET /airports/KSFO                       position
+#   GET /stations/KSFO                       decoded METAR and TAF, flight category
+#   GET /route-weather?route=KSFO:8500,KRNO  en-route weather warnings
+#   GET /hazards?route=...                   PIREPs, SIGMETs and route weather
+#   GET /briefing?route=...&summary=1        everything, plus the LLM summary
+#
+# Identical requests within API_CACHE_TTL are answered from memory, and
+# identical requests in flight share one computation. At most
+# API_MAX_BRIEFINGS briefings (API_MAX_SUMMARIES with an LLM summary) run at
+# once; a request that cannot start within API_QUEUE_TIMEOUT gets a 503.
+API_CACHE_TTL = float(os.environ.get("AEROBRIEF_API_CACHE_TTL", 60))
+API_CACHE_SIZE = 2000
+API_MAX_BRIEFINGS = int(os.environ.get("AEROBRIEF_API_MAX_BRIEFINGS", 16))
+API_MAX_SUMMARIES = int(os.environ.get("AEROBRIEF_API_MAX_SUMMARIES", 4))
+API_QUEUE_TIMEOUT = float(os.environ.get("AEROBRIEF_API_QUEUE_TIMEOUT", 10))
+API_GRAPHS = 200
+
+_pool = ThreadPoolExecutor(max_workers=API_MAX_BRIEFINGS + API_MAX_SUMMARIES, thread_name_prefix="api")
+_briefings = asyncio.Semaphore(API_MAX_BRIEFINGS)
+_summaries = asyncio.Semaphore(API_MAX_SUMMARIES)
+
+_responses = OrderedDict()
+_inflight = {}
+_counters = Counter()
+
+# One graph per route, shared by requests with and without a summary, so a
+# repeated route reuses every unchanged node and only asks the LLM again when
+# the weather changed.
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+
+class Busy(Exception):
+    pass
+
+
+def parse_route(route):
+    # "KSFO:8500,KRNO:9500 KSLC" -> waypoints
+    waypoints = []
+    for token in route.replace(",", " ").split():
+        icao, _, altitude = token.partition(":")
+        waypoints.append({"airport_id": to_icao(icao), "altitude": altitude.strip()})
+    return waypoints
+
+
+def route_param(waypoints):
+    return ",".join(f"{w['airport_id']}:{w['altitude']}" if w["altitude"] else w["airport_id"] for w in waypoints)
+
+
+def _graph(key):
+    with _graphs_lock:
+        graph = _graphs.pop(key, None) or BriefingGraph()
+        _graphs[key] = graph
+        while len(_graphs) > API_GRAPHS:
+            _graphs.popitem(last=False)
+        return graph
+
+
+def _briefing(waypoints, summarize):
+    key = tuple((w["airport_id"], w["altitude"]) for w in waypoints)
+    return run_briefing(_graph(key), waypoints, summarize=summarize)
+
+
+def _station(icao):
+    airport = airport_stage(BriefingGraph(), {"airport_id": icao})
+    if "error" in airport:
+        raise ValueError(airport["error"])
+    airport.pop("altitude")
+    return airport
+
+
+async def _compute(key, limit, fn, args):
+    try:
+        await asyncio.wait_for(limit.acquire(), API_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _counters["rejected"] += 1
+        raise Busy()
+    try:
+        _counters["computed"] += 1
+        result = await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+    finally:
+        limit.release()
+    _responses[key] = (time.monotonic() + API_CACHE_TTL, result)
+    while len(_responses) > API_CACHE_SIZE:
+        _responses.popitem(last=False)
+    return result
+
+
+async def cached(key, fn, *args, limit=_briefings):
+    _counters["requests"] += 1
+    hit = _responses.get(key)
+    if hit is not None and hit[0] > time.monotonic():
+        _counters["cache_hits"] += 1
+        return hit[1]
+
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_compute(key, limit, fn, args))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        _counters["coalesced"] += 1
+    # shield: one client hanging up does not cancel the others' result.
+    return await asyncio.shield(task)
+
+
+async def _serve(key, fn, *args, limit=_briefings):
+    try:
+        return await cached(key, fn, *args, limit=limit)
+    except Busy:
+        raise HTTPException(503, "Too many briefings in progress, retry shortly",
+                            headers={"Retry-After": str(int(API_QUEUE_TIMEOUT))})
+    except ValueError as e:
+        raise HTTPException(404, str(e))
+    except upstream.UpstreamUnavailable as e:
+        raise HTTPException(503, f"Upstream unavailable: {e}")
+    except requests.exceptions.RequestException as e:
+        raise HTTPException(502, f"Upstream error: {e}")
+
+
+def _waypoints(route):
+    waypoints = parse_route(route)
+    if not waypoints:
+        raise HTTPException(422, "route needs at least one airport, e.g. KSFO:8500,KRNO:9500")
+    return waypoints
+
+
+def stats():
+    return {"api": dict(_counters, cached=len(_responses), in_flight=len(_inflight)), "upstream": upstream.stats()}
+
+
+def create_app():
+    if FastAPI is None:
+        raise RuntimeError("The briefing API needs fastapi and uvicorn: pip install fastapi uvicorn")
+    app = FastAPI(title="AeroBrief")
+
+    def cache_headers(response):
+        response.headers["Cache-Control"] = f"max-age={int(API_CACHE_TTL)}"
+
+    @app.get("/airports")
+    def airport_search(prefix: str, limit: int = 8):
+        # Autocomplete over ICAO and IATA codes; answered from memory.
+        index = airport_index()
+        if index is None:
+            raise HTTPException(404, "No local airport database")
+        return [{"icao": a.icao, "iata": a.iata, "name": a.name, "city": a.city, "country": a.country,
+                 "lat": a.lat, "lon": a.lon} for a in index.complete(prefix, limit) or index.suggest(prefix, limit)]
+
+    @app.get("/airports/{icao}")
+    async def airport(icao: str, response: Response):
+        icao = to_icao(icao)
+        lat, lon = await _serve(("airport", icao), lat_log, icao)
+        cache_headers(response)
+        return {"airport_id": icao, "lat": lat, "lon": lon}
+
+    @app.get("/stations/{icao}")
+    async def station(icao: str, response: Response):
+        icao = to_icao(icao)
+        result = await _serve(("station", icao), _station, icao)
+        cache_headers(response)
+        return result
+
+    @app.get("/route-weather")
+    async def route_weather(route: str, response: Response):
+        waypoints = _waypoints(route)
+        result = await _serve(("route", route_param(waypoints)), _briefing, waypoints, False)
+        cache_headers(response)
+        return {"warnings": result["warnings"]}
+
+    @app.get("/hazards")
+    async def hazards(route: str, response: Response):
+        waypoints = _waypoints(route)
+        result = await _serve(("route", route_param(waypoints)), _briefing, waypoints, False)
+        cache_headers(response)
+        return {"pireps": result["pireps"], "sigmet": result["sigmet"], "warnings": result["warnings"]}
+
+    @app.get("/briefing")
+    async def briefing(route: str, response: Response, summary: bool = True):
+        waypoints = _waypoints(route)
+        if summary:
+            result = await _serve(("summary", route_param(waypoints)), _briefing, waypoints, True, limit=_summaries)
+        else:
+            result = await _serve(("route", route_param(waypoints)), _briefing, waypoints, False)
+            result = {k: v for k, v in result.items() if k != "summary_prompt"}
+        cache_headers(response)
+        return result
+
+    @app.get("/healthz")
+    async def healthz():
+        return stats()
+
+    return app
+
+
+app = create_app() if FastAPI is not None else None
+
+
+def _start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def load_test(args, app):
+    # API in this process, upstream served by fixtures.serve from an archive
+    # recorded off the bench synthetic upstream, so nothing leaves the machine.
+    import tempfile
+
+    import briefing
+    import helper
+    from bench import ROUTE, STATIONS, synthetic_upstream
+    from fixtures import MockServerTransport, Recorder, Replayer, serve
+
+    briefing.ask_llm = lambda final: time.sleep(args.llm_latency) or final[:200]
+    helper.OPEN_METEO_DELAY = 0
+
+    stations = sorted(STATIONS)
+    rng = random.Random(1)
+    routes = [",".join(f"{s}:{rng.choice(['', '6500', '9500', '35000'])}" for s in rng.sample(stations, rng.randint(2, 4)))
+              for _ in range(args.routes)]
+    routes.append(",".join(ROUTE))
+
+    archive = os.path.join(tempfile.mkdtemp(), "upstream.jsonl.gz")
+    recorder = upstream.set_transport(Recorder(archive, fetch=synthetic_upstream))
+    for route in routes:
+        _briefing(parse_route(route), False)
+    recorder.save()
+    upstream.clear()
+    _graphs.clear()
+
+    mock = serve(Replayer(archive, latency=args.latency, jitter=args.latency / 2), port=args.mock_port)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    upstream.set_transport(MockServerTransport(f"http://127.0.0.1:{args.mock_port}"))
+    server, thread = _start_server(app, args.port)
+
+    base = f"http://127.0.0.1:{args.port}"
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    def one(i):
+        rng = random.Random(i)
+        route = rng.choice(routes)
+        kind = rng.random()
+        if kind < 0.3:
+            path, params = f"/stations/{rng.choice(stations)}", None
+        elif kind < 0.6:
+            path, params = "/hazards", {"route": route}
+        elif kind < 1 - args.summary_share:
+            path, params = "/briefing", {"route": route, "summary": 0}
+        else:
+            path, params = "/briefing", {"route": route}
+        start = time.perf_counter()
+        try:
+            status = session.get(base + path, params=params, timeout=60).status_code
+        except requests.exceptions.RequestException:
+            status = "error"
+        return status, time.perf_counter() - start
+
+    fetched = upstream.stats()["upstream_calls"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds for _, seconds in results)
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    s = stats()
+    print(f"{args.requests} requests in {elapsed:.2f} s ({args.requests / elapsed:.0f} req/s), "
+          f"concurrency {args.concurrency}, {len(routes)} routes, upstream latency {args.latency * 1000:.0f} ms")
+    print(f"latency p50 {pct(0.5):.1f} ms  p95 {pct(0.95):.1f} ms  p99 {pct(0.99):.1f} ms  max {latencies[-1] * 1000:.1f} ms")
+    print("status:", dict(Counter(status for status, _ in results)))
+    print(f"api: {s['api'].get('cache_hits', 0)} cache hits, {s['api'].get('coalesced', 0)} coalesced, "
+          f"{s['api'].get('computed', 0)} computed, {s['api'].get('rejected', 0)} rejected")
+    print(f"upstream: {s['upstream']['calls']} lookups, {s['upstream']['upstream_calls'] - fetched} requests to the mock")
+
+    server.should_exit = True
+    thread.join()
+    mock.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AeroBrief briefing API")
+    sub = parser.add_subparsers(dest="command", required=True)
+    srv = sub.add_parser("serve", help="run the API")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8000)
+    load = sub.add_parser("loadtest", help="load-test the API against a local mock upstream")
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--routes", type=int, default=50, help="distinct routes in the request mix")
+    load.add_argument("--latency", type=float, default=0.05, help="mock upstream latency (seconds)")
+    load.add_argument("--llm-latency", type=float, default=0.5, help="stand-in LLM latency (seconds)")
+    load.add_argument("--summary-share", type=float, default=0.1, help="share of requests asking for a summary")
+    load.add_argument("--port", type=int, default=8001)
+    load.add_argument("--mock-port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server_app = app if app is not None else create_app()
+    if args.command == "serve":
+        import uvicorn
+        uvicorn.run(server_app, host=args.host, port=args.port)
+    else:
+        load_test(args, server_app)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import json
+import os
 import uuid
-from helper import * 
+from briefing import BriefingGraph
+from jobs import BriefingJob, RemoteBriefingJob
+from map_render import render_map
+from upstream import PRODUCT_TTL
+from prefetch import start_prefetcher
+from tracing import span, start_metrics_server, tracing
+from profiling import profile_requested
+from airports import ICAO_CODE, airport_index
 
 
 def get_dropdown_styles(color_name):
@@ -11,7 +19,97 @@ def get_dropdown_styles(color_name):
     print(type(color_name))
     return colors[color_name-1]
 
+def render_card(label, text, warning_level):
+    style = get_dropdown_styles(warning_level)
+    st.markdown(f"""
+                    <style>
+                    .custom-expander > summary {{
+                        background-color: {style['primary']};
+                        color: white;
+                        padding: 10px;
+                        border-radius: 10px;
+                        cursor: pointer;
+                        font-size: 18px;
+                        font-weight: bold;
+                    }}
+
+                    .custom-expander[open] > summary {{
+                        border-bottom-left-radius: 0;
+                        border-bottom-right-radius: 0;
+                    }}
+
+                    .custom-expander {{
+                        border: 2px solid {style['primary']};
+                        border-radius: 10px;
+                        margin-bottom: 1rem;
+                    }}
+                    </style>
+                """, unsafe_allow_html=True)
+    st.markdown(f"""
+                <details class="custom-expander">
+                <summary>{label}</summary>
+                <div style='padding: 15px; color: black; background-color: {style['light']}; border-top: 2px solid {style['primary']};'>
+                    <p>{text.replace('\n', '<br>')}</p>
+                </div>
+                </details>
+                """, unsafe_allow_html=True)
+
+def render_waterfall(trace):
+    import altair as alt
+    import pandas as pd
+
+    rows = pd.DataFrame(trace.rows())
+    if rows.empty:
+        return
+    rows["label"] = (rows["span"] + " " + rows["detail"]).str.strip()
+    rows["ms"] = (rows["seconds"] * 1000).round(1)
+    st.sidebar.header("Performance")
+    chart = alt.Chart(rows).mark_bar().encode(
+        x=alt.X("start:Q", title="seconds"),
+        x2="end:Q",
+        y=alt.Y("label:N", sort=None, title=None),
+        color=alt.Color("span:N", legend=None),
+        tooltip=["span", "detail", "ms", "thread"],
+    ).properties(height=max(200, 14 * len(rows)))
+    st.sidebar.altair_chart(chart)
+    totals = sorted(trace.totals().items(), key=lambda item: -item[1][1])
+    st.sidebar.table(pd.DataFrame(
+        [{"span": name, "count": count, "total ms": round(seconds * 1000, 1)} for name, (count, seconds) in totals]))
+
+def render_airport_hint(code):
+    # Instant feedback from the local airport database as codes are typed.
+    index = airport_index()
+    if index is None or not code.strip():
+        return
+    airport = index.lookup(code)
+    if airport is not None:
+        st.caption(f"✅ {airport.label()}")
+        return
+    matches = index.complete(code) or index.suggest(code)
+    if matches:
+        st.caption("Did you mean: " + " · ".join(a.label() for a in matches[:5]))
+    elif ICAO_CODE.fullmatch(code.strip().upper()):
+        st.caption(f"⚠️ {code.strip().upper()} is not in the local database; it will be looked up on Submit")
+    else:
+        st.caption(f"❌ Unknown airport '{code.strip().upper()}'")
+
+def resolve_airport(code):
+    index = airport_index()
+    return index.resolve(code) if index is not None else code.strip().upper()
+
+def render_age(age, ttl):
+    if age is not None and age > ttl:
+        st.caption(f"⚠️ Served from cache, {age / 60:.0f} min old – refreshing in the background")
+
+
+# With AEROBRIEF_API_URL set the app is a thin client of api.py; the
+# briefings, caches and prefetching live in the API service.
+API_URL = os.environ.get("AEROBRIEF_API_URL")
+
 st.set_page_config(layout="wide", page_title="Flight Weather Planning Tool")
+if not API_URL:
+    start_prefetcher()
+    start_metrics_server()
 
 airports=[]
 st.title("✈️ AI Powered Weather Summaries")
@@ -28,6 +126,10 @@ if 'airport_data' not in st.session_state:
     st.session_state.airport_data = []
 if 'report' not in st.session_state:
     st.session_state.report = ''
+if 'graph' not in st.session_state:
+    st.session_state.graph = BriefingGraph()
+if 'job' not in st.session_state:
+    st.session_state.job = None
 
 
 if st.session_state.add_airport:
@@ -48,6 +150,7 @@ for i, airport in enumerate(st.session_state.airports):
         st.text_input("ICAO", value=airport["icao"], key=f"icao_{airport['id']}", 
                       on_change=lambda a_id=airport["id"], field="icao": setattr(
                           st.session_state, f"icao_{a_id}", st.session_state[f"icao_{a_id}"]))
+        render_airport_hint(st.session_state.get(f"icao_{airport['id']}", airport["icao"]))
     
     with cols[1]:
         st.text_input("Altitude (ft)", value=airport["altitude"], key=f"alt_{airport['id']}", 
@@ -61,315 +164,57 @@ for i, airport in enumerate(st.session_state.airports):
                 st.rerun()
 
 if st.button("Submit"):
+    waypoints = []
+    invalid = []
     for airport in st.session_state.airports:
         airport["icao"] = st.session_state[f"icao_{airport['id']}"]
         airport["altitude"] = st.session_state[f"alt_{airport['id']}"]
 
-
-        lat, lon= lat_log(airport["icao"])
-        airports.append({
-        "airport_id": airport["icao"],
-        "altitude": airport["altitude"],
-        "lat": lat,
-        "lon": lon,
-        "warning_level": warning_level(airport["icao"])
-        })
-
-    output_data = {"waypoints": airports}
-    with open("airports_st.json", "w") as f:
-        json.dump(output_data, f, indent=2)
-    
-    st.session_state.airport_data = []
-    for airport in st.session_state.airports:
         if airport["icao"]:
-            k = parse_metar(airport["icao"])
-            l = get_formatted_taf(airport["icao"])
-            mock_data = {
-                "icao": airport["icao"],
-                "altitude": airport["altitude"],
-                "metar":k,
-                "taf": l,
-                "warning_level": warning_level(airport["icao"])
-            }
-            st.session_state.report += '\n'
-            st.session_state.report += k
-            st.session_state.report += '\n'
-            st.session_state.report += l
-            st.session_state.airport_data.append(mock_data)
-            
-            
-    
+            # IATA codes are accepted and translated; unknown codes stop the
+            # submit here instead of failing a fetch.
+            try:
+                airport_id = resolve_airport(airport["icao"])
+            except ValueError as e:
+                invalid.append(str(e))
+                continue
+            waypoints.append({
+            "airport_id": airport_id,
+            "altitude": airport["altitude"],
+            })
+
+    for message in invalid:
+        st.error(message)
+    if invalid:
+        st.stop()
+
+    if st.session_state.job is not None:
+        st.session_state.job.cancel()
+    if API_URL:
+        st.session_state.job = RemoteBriefingJob(API_URL, waypoints).start()
+    else:
+        st.session_state.job = BriefingJob(st.session_state.graph, waypoints,
+                                           profile=profile_requested(st.query_params)).start()
+    st.session_state.airport_data = []
     st.session_state.submitted = True
     st.rerun()
 
-if st.session_state.submitted and st.session_state.airport_data:
-    num_airports = len(st.session_state.airport_data)
-    
+job = st.session_state.job
+if st.session_state.submitted and job is not None and job.waypoints:
+    num_airports = len(job.waypoints)
+
     airport_cols = st.columns(num_airports)
-    
     for i, col in enumerate(airport_cols):
-        if i < len(st.session_state.airport_data):
-            airport = st.session_state.airport_data[i]
-            col.subheader(f"{airport['icao']} ({airport['altitude']} ft)")
-    
-    metar_cols = st.columns(num_airports)
-    for i, col in enumerate(metar_cols):
-        if i < len(st.session_state.airport_data):
-            airport = st.session_state.airport_data[i]
-            with col:
-                style = get_dropdown_styles(airport["warning_level"])
-                st.markdown(f"""
-                                <style>
-                                .custom-expander > summary {{
-                                    background-color: {style['primary']};
-                                    color: white;
-                                    padding: 10px;
-                                    border-radius: 10px;
-                                    cursor: pointer;
-                                    font-size: 18px;
-                                    font-weight: bold;
-                                }}
-
-                                .custom-expander[open] > summary {{
-                                    border-bottom-left-radius: 0;
-                                    border-bottom-right-radius: 0;
-                                }}
-
-                                .custom-expander {{
-                                    border: 2px solid {style['primary']};
-                                    border-radius: 10px;
-                                    margin-bottom: 1rem;
-                                }}
-                                </style>
-                            """, unsafe_allow_html=True)
-
-                st.markdown(f"""
-                            <details class="custom-expander">
-                            <summary>METAR</summary>
-                            <div style='padding: 15px; color: black; background-color: {style['light']}; border-top: 2px solid {style['primary']};'>
-                                <p>{airport['metar'].replace('\n', '<br>')}</p>
-                            </div>
-                            </details>
-                            """, unsafe_allow_html=True)
-    
-    taf_cols = st.columns(num_airports)
-    for i, col in enumerate(taf_cols):
-        if i < len(st.session_state.airport_data):
-            airport = st.session_state.airport_data[i]
-            with col:
-                style = get_dropdown_styles(airport["warning_level"])
-                st.markdown(f"""
-                                <style>
-                                .custom-expander > summary {{
-                                    background-color: {style['primary']};
-                                    color: white;
-                                    padding: 10px;
-                                    border-radius: 10px;
-                                    cursor: pointer;
-                                    font-size: 18px;
-                                    font-weight: bold;
-                                }}
-
-                                .custom-expander[open] > summary {{
-                                    border-bottom-left-radius: 0;
-                                    border-bottom-right-radius: 0;
-                                }}
-
-                                .custom-expander {{
-                                    border: 2px solid {style['primary']};
-                                    border-radius: 10px;
-                                    margin-bottom: 1rem;
-                                }}
-                                </style>
-                            """, unsafe_allow_html=True)
-                st.markdown(f"""
-                            <details class="custom-expander">
-                            <summary>TAF</summary>
-                            <div style='padding: 15px;color: black; background-color: {style['light']}; border-top: 2px solid {style['primary']};'>
-                                <p>{airport['taf'].replace('\n', '<br>')}</p>
-                            </div>
-                            </details>
-                            """, unsafe_allow_html=True) ##########
-
-
-    x=generate_quick('airports_st.json')
-        
-
-
-    
+        waypoint = job.waypoints[i]
+        col.subheader(f"{waypoint['airport_id']} ({waypoint['altitude']} ft)")
 
-    with open('pireps.json', 'r', encoding='utf-8') as f:
-        pirep_data = json.load(f)
-    if not pirep_data.get('pireps'):
-        st.warning("No significant PIREPs found near the flight path.")
-        
-    with open('route_weather.json', 'r', encoding='utf-8') as f:
-        route_weather_data = json.load(f)
-
-    if not route_weather_data.get('warnings'):
-            st.warning("No significant weather conditions detected near the flight path.")
-
-
-    sigmet_json_generator('airports_st.json')
-    with open('sigmets_new.json', 'r', encoding='utf-8') as f:
-        sigmet_data = json.load(f)
-
-
-    with open('airports_st.json', 'r', encoding='utf-8') as f:
-        airports_data = json.load(f)
-
-
-    with open('index.html', 'r', encoding='utf-8') as file:
-        html_content = file.read()
-
-    split_point = html_content.find('////hellow olrd')
-    if split_point == -1:
-        split_point = html_content.find('var map = L.map')  # Try to find map initialization
-        if split_point == -1:
-            st.error("Could not find the insertion point in HTML")
-            split_point = len(html_content)
-
-    html_first_part = html_content[:split_point]
-
-    html_last_part = html_content[split_point:]
-
-
-    new_js = f"""
-        // Function to create a slightly upward curved line between two points
-        function createCurvedLine(startPoint, endPoint) {{
-            const latlngs = [];
-            const points = 20; // Number of points to create a smooth curve
-            
-            // Calculate control point (for upward curve)
-            const midLat = (startPoint[0] + endPoint[0]) / 2;
-            const midLon = (startPoint[1] + endPoint[1]) / 2;
-            const distance = Math.sqrt(
-                Math.pow(endPoint[0] - startPoint[0], 2) + 
-                Math.pow(endPoint[1] - startPoint[1], 2)
-            );
-            
-            // Make the curve higher for longer distances
-            const curveHeight = distance * 0.15;
-            
-            // Create a quadratic Bezier curve
-            for (let i = 0; i <= points; i++) {{
-                const t = i / points;
-                const lat = (1-t)*(1-t)*startPoint[0] + 
-                            2*(1-t)*t*(midLat + curveHeight) + 
-                            t*t*endPoint[0];
-                const lon = (1-t)*(1-t)*startPoint[1] + 
-                            2*(1-t)*t*midLon + 
-                            t*t*endPoint[1];
-                latlngs.push([lat, lon]);
-            }}
-            return latlngs;
-        }}
-
-        function getSeverityColor(severity) {{
-            if (severity === 0) return "gray";
-            if (severity <= 2) return "yellow";
-            if (severity <= 4) return "orange";
-            if (severity === 5) return "red";
-            return "blue"; // fallback
-        }}
-
-
-        // PIREP data
-        const pireps = {json.dumps(pirep_data.get('pireps', []))};
-        pireps.forEach(p => {{
-            if (!p.lat || !p.lon) return;
-            const info = `${{p.summary || 'N/A'}}`;
-            L.circleMarker([p.lat, p.lon], {{
-                radius: 5,
-                fillColor: "blue",
-                color: "black",
-                weight: 1,
-                fillOpacity: 0.8
-            }}).addTo(map).bindPopup(info);
-        }});
-
-        // Route weather warnings
-        const warnings = {json.dumps(route_weather_data.get('warnings', []))};
-        warnings.forEach(p => {{
-            if (!p.lat || !p.lon) return;
-            const info = `Description: ${{p.description || 'N/A'}}<br>Temp: ${{p.temperature}}°C<br>Windspeed: ${{p.windspeed}}kt<br>code: ${{p.code}}`;
-            L.circleMarker([p.lat, p.lon], {{
-                radius: 7,
-                fillColor: "purple",
-                color: "purple",
-                weight: 1,
-                fillOpacity: 0.8
-            }}).addTo(map).bindPopup(info);
-        }});
-
-        // SIGMET data
-        const sigmets = {json.dumps(sigmet_data.get('sigmet', []))};
-        sigmets.forEach(p => {{
-            if (!p.coords || p.coords.length < 3) return;
-            const info = `${{p.sigmet_eng || 'N/A'}}`;
-            const latlngs = p.coords.map(c => [c.lat, c.lon]);
-            const c = getSeverityColor(p.severity);
-            L.polygon(latlngs, {{
-                color: c,
-                weight: 2,
-                fillOpacity: 0.4
-            }}).addTo(map).bindPopup(info);
-        }});
-
-        // Airport data
-        const waypoints = {json.dumps(airports_data.get('waypoints', []))};
-        const allAirports = [...waypoints];
-
-        // Add markers and circles for airports
-        allAirports.forEach(airport => {{
-            // Marker
-            L.marker([airport.lat, airport.lon]).addTo(map).bindPopup(`${{airport.airport_id}}<br>Altitude: ${{airport.altitude}} ft`);
-            
-            // Circle for flight rules
-            const warningLevel = airport.warning_level || 5;
-            let circleColor = 'grey';
-            let circleLabel = 'UNKNOWN';
-            
-            switch(warningLevel) {{
-                case 1: circleColor = '#00FF00'; circleLabel = 'VFR'; break;
-                case 2: circleColor = '#FFFF00'; circleLabel = 'MVFR'; break;
-                case 3: circleColor = '#FF9900'; circleLabel = 'IFR'; break;
-                case 4: circleColor = '#FF0000'; circleLabel = 'LIFR'; break;
-            }}
-            
-            L.circle([airport.lat, airport.lon], {{
-                color: circleColor,
-                fillColor: circleColor,
-                fillOpacity: 0.2,
-                radius: 50000,
-                weight: 1
-            }}).addTo(map).bindTooltip(circleLabel);
-        }});
-
-        // Draw curved lines between low altitude airports
-        const lowAltitudeAirports = allAirports.filter(a => a.altitude < 9000);
-        if (lowAltitudeAirports.length >= 2) {{
-            lowAltitudeAirports.sort((a, b) => a.lon - b.lon);
-            for (let i = 0; i < lowAltitudeAirports.length - 1; i++) {{
-                const start = [lowAltitudeAirports[i].lat, lowAltitudeAirports[i].lon];
-                const end = [lowAltitudeAirports[i+1].lat, lowAltitudeAirports[i+1].lon];
-                const latlngs = createCurvedLine(start, end);
-                L.polyline(latlngs, {{
-                    color: 'black',
-                    weight: 3,
-                    opacity: 0.7
-                }}).addTo(map);
-            }}
-        }}
-    """
-
-    final_html = html_first_part + new_js + html_last_part
+    metar_slots = [col.empty() for col in st.columns(num_airports)]
+    taf_slots = [col.empty() for col in st.columns(num_airports)]
 
+    warning_slot = st.empty()
     st.subheader("Flight Route Map")
-    components.html(final_html, height=600, scrolling=True)
+    map_slot = st.empty()
 
-
-    
     st.sidebar.header("Map Information")
     st.sidebar.info("""
     - Markers: All Airports
@@ -377,7 +222,6 @@ if st.session_state.submitted and st.session_state.airport_data:
     - Colored polygons: SIGMET warnings
     - Yellow circles: en-route warnings
     """)
-    st.subheader("Flight Route Map")
     st.sidebar.header("KEY VALUES")
     st.sidebar.info("""
     - VFR: GREEN
@@ -386,17 +230,98 @@ if st.session_state.submitted and st.session_state.airport_data:
     - LIFR: RED
     - UNKOWN: GREY 
                     """)
-    
-    
-    st.subheader("Flight Summary")
-    with st.container(border=True):
-        final = summary()
-        st.markdown(
-        f"""
-        <div style="background-color: #E3F2FD; padding: 15px; border-radius: 10px; color: #0D47A1; font-family: 'Courier New', monospace;">
-        <pre style="white-space: pre-wrap; word-wrap: break-word;">{final}</pre>
-        </div>
-        """,
-        unsafe_allow_html=True
-        )
 
+    st.subheader("Flight Summary")
+    summary_slot = st.empty()
+    status_slot = st.empty()
+
+    # Fill the page in as the background job publishes each stage. If the user
+    # interacts meanwhile, Streamlit reruns the script and we pick up again
+    # from whatever the job has finished so far.
+    shown_airports = set()
+    shown_map = False
+    seen = -1
+    while True:
+        seen = job.wait(seen, timeout=0.5)
+
+        for i, airport in enumerate(job.airports):
+            if airport is None or i in shown_airports:
+                continue
+            shown_airports.add(i)
+            with metar_slots[i].container():
+                render_card("METAR", airport["metar"], airport["warning_level"])
+                render_age(airport["age"]["metar"], PRODUCT_TTL["/metar"])
+                if airport.get("history"):
+                    st.caption(airport["history"])
+            with taf_slots[i].container():
+                render_card("TAF", airport["taf"], airport["warning_level"])
+                render_age(airport["age"]["taf"], PRODUCT_TTL["/taf"])
+
+        if job.geometry is not None and not shown_map:
+            shown_map = True
+            with warning_slot.container():
+                if not job.geometry["pireps"]:
+                    st.warning("No significant PIREPs found near the flight path.")
+                if not job.geometry["warnings"]:
+                    st.warning("No significant weather conditions detected near the flight path.")
+            with map_slot, tracing(job.trace), span("map", "render"):
+                components.html(render_map(job.geometry), height=600, scrolling=True)
+
+        if job.done:
+            break
+        done_stages = ", ".join(name for name, _ in job.stages) or "starting"
+        status_slot.info(f"⏳ Briefing in progress ({done_stages} done)…")
+
+    status_slot.empty()
+    if job.profile_path:
+        st.sidebar.success(f"Profile saved to {job.profile_path}")
+        with open(job.profile_path, "rb") as f:
+            st.sidebar.download_button("Download profile", f.read(), file_name=os.path.basename(job.profile_path))
+    if job.error is not None:
+        st.error(f"Briefing failed: {job.error}")
+
+    if job.summary is not None:
+        final = job.summary
+        with summary_slot.container(border=True):
+            st.markdown(
+            f"""
+            <div style="background-color: #E3F2FD; padding: 15px; border-radius: 10px; color: #0D47A1; font-family: 'Courier New', monospace;">
+            <pre style="white-space: pre-wrap; word-wrap: break-word;">{final}</pre>
+            </div>
+            """,
+            unsafe_allow_html=True
+            )
+
+    if not st.session_state.airport_data and all(a is not None for a in job.airports):
+        # Only the current briefing is kept; earlier submits are dropped
+        # rather than appended to for the life of the session.
+        report = ''
+        for airport in job.airports:
+            mock_data = {
+                "icao": airport["airport_id"],
+                "altitude": airport["altitude"],
+                "metar": airport["metar"],
+                "taf": airport["taf"],
+                "warning_level": airport["warning_level"]
+            }
+            report += '\n'
+            report += airport["metar"]
+            report += '\n'
+            report += airport["taf"]
+            st.session_state.airport_data.append(mock_data)
+        st.session_state.report = report
+
+    if st.sidebar.checkbox("Performance panel", value="debug" in st.query_params):
+        render_waterfall(job.trace)
+
+    timing = job.timing
+    with st.expander(f"Briefing reuse: {len(timing['reused'])} reused, {len(timing['computed'])} recomputed"):
+        st.write(f"Incremental run: {timing['elapsed']:.2f} s (full run ≈ {timing['full_cost']:.2f} s)")
+        st.write(" · ".join(f"{name}: {seconds:.2f} s" for name, seconds in job.stages))
+        reuse_cols = st.columns(2)
+        with reuse_cols[0]:
+            st.markdown("**Reused**")
+            st.text("\n".join(timing["reused"]) or "-")
+        with reuse_cols[1]:
+            st.markdown("**Recomputed**")
+            st.text("\n".join(timing["computed"]) or "-")
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+from airports import to_icao
+from briefing import BriefingGraph, route_legs, run_briefing
+from helper import (
+    altitude_band,
+    ask_llm,
+    fetch_pirep_corridor,
+    fetch_sigmet_feed,
+    fetch_stations,
+    interpolate_points,
+    lat_log,
+    route_weather,
+)
+
+
+# Headless briefings for a list of flights:
+#
+#   python batch.py flights.csv -o briefings.jsonl
+#
+# CSV rows are "flight,waypoints" with waypoints like "KSFO:8500 KRNO:9500
+# KSLC"; JSON is [{"flight": ..., "waypoints": [{"airport_id", "altitude"}]}]
+# or {flight: waypoints} as for watch.py.
+#
+# 1. every distinct upstream product is fetched once, concurrently (asyncio
+#    over the shared upstream cache),
+# 2. the briefings themselves run in a process pool forked from the warm
+#    cache, so they are pure CPU,
+# 3. the LLM summaries are requested concurrently again.
+FETCH_CONCURRENCY = 16
+OPEN_METEO_CONCURRENCY = 4
+LLM_CONCURRENCY = 4
+# How long to wait for background threads to finish before forking workers.
+FORK_WAIT = 10
+
+
+def _parse_waypoint(token):
+    icao, _, altitude = token.partition(":")
+    return {"airport_id": to_icao(icao), "altitude": altitude.strip()}
+
+
+def load_flights(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [{"flight": k, "waypoints": v} for k, v in data.items()]
+        return [{"flight": str(d.get("flight", i)),
+                 "waypoints": [{"airport_id": to_icao(w["airport_id"]), "altitude": w.get("altitude", "")}
+                               for w in d["waypoints"]]}
+                for i, d in enumerate(data)]
+
+    flights = []
+    with open(path, newline="") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            waypoints = [_parse_waypoint(t) for t in row["waypoints"].replace(",", " ").split()]
+            flights.append({"flight": row.get("flight") or str(i), "waypoints": waypoints})
+    return flights
+
+
+async def warm_cache(flights):
+    # Fetch everything the briefings will ask for, once per distinct request.
+    limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+    open_meteo = asyncio.Semaphore(OPEN_METEO_CONCURRENCY)
+
+    async def fetch(fn, *args, semaphore=limit):
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(fn, *args)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print("Prefetch failed:", fn.__name__, args[:1], e, file=sys.stderr)
+                return None
+
+    stations = list(dict.fromkeys(w["airport_id"] for f in flights for w in f["waypoints"]))
+    positions = await asyncio.gather(*[fetch(lat_log, s) for s in stations])
+    positions = dict(zip(stations, positions))
+    await asyncio.gather(
+        fetch(fetch_sigmet_feed),
+        fetch(fetch_stations, stations),
+    )
+
+    points = {}
+    corridors = []
+    for flight in flights:
+        routes = []
+        for a, b, _ in route_legs(flight["waypoints"]):
+            if positions.get(a) is None or positions.get(b) is None:
+                continue
+            route = interpolate_points(tuple(positions[a]), tuple(positions[b]))
+            routes.append(route)
+            points.update((pt, None) for pt in route)
+        if routes:
+            corridors.append([tuple(pt) for route in routes for pt in route])
+    await asyncio.gather(
+        *[fetch(fetch_pirep_corridor, c) for c in corridors],
+        *[fetch(route_weather, [pt], semaphore=open_meteo) for pt in points],
+    )
+    return len(stations), len(points)
+
+
+def brief_flight(flight):
+    try:
+        result = run_briefing(BriefingGraph(), flight["waypoints"], summarize=False)
+    except Exception as e:
+        return {"flight": flight["flight"], "error": str(e)}
+    return {
+        "flight": flight["flight"],
+        "route": [w["airport_id"] for w in flight["waypoints"]],
+        "band": altitude_band(*[w["altitude"] for w in flight["waypoints"]]),
+        "waypoints": [{k: a[k] for k in ("airport_id", "altitude", "lat", "lon", "metar", "taf", "warning_level", "history")}
+                      for a in result["waypoints"]],
+        "pireps": result["pireps"],
+        "warnings": result["warnings"],
+        "sigmets": [{k: s.get(k) for k in ("id", "type", "hazard", "severity", "sigmet_eng")}
+                    for s in result["sigmet"]],
+        "summary_prompt": result["summary_prompt"],
+    }
+
+
+def _threads_done(timeout=FORK_WAIT):
+    # A child forked while another thread holds a lock (upstream's cache
+    # lock during a background refresh, say) inherits it locked for good.
+    # asyncio.run has already shut down warm_cache's executor; wait for
+    # anything else still running.
+    deadline = time.monotonic() + timeout
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread():
+            thread.join(max(0.0, deadline - time.monotonic()))
+    return threading.active_count() == 1
+
+
+def _executor(workers):
+    # Forked workers start with the parent's warm cache. Where fork is not
+    # available, or some thread is still alive, use threads instead.
+    if "fork" in multiprocessing.get_all_start_methods() and _threads_done():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    print("Briefing on threads instead of forked workers", file=sys.stderr)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+async def summarize(results):
+    limit = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def one(result):
+        async with limit:
+            result["summary"] = await asyncio.to_thread(ask_llm, result.pop("summary_prompt"))
+
+    await asyncio.gather(*[one(r) for r in results if "summary_prompt" in r])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Brief many flights without the Streamlit app")
+    parser.add_argument("flights", help="CSV or JSON file of flights")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output (default stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-summary", action="store_true", help="skip the LLM summaries")
+    args = parser.parse_args()
+
+    flights = load_flights(args.flights)
+    start = time.perf_counter()
+
+    stations, points = asyncio.run(warm_cache(flights))
+    fetched = time.perf_counter()
+
+    with _executor(args.workers) as pool:
+        results = list(pool.map(brief_flight, flights, chunksize=max(1, len(flights) // (4 * args.workers))))
+    briefed = time.perf_counter()
+
+    if args.no_summary:
+        for result in results:
+            result.pop("summary_prompt", None)
+    else:
+        asyncio.run(summarize(results))
+    done = time.perf_counter()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = done - start
+    print(f"{len(flights)} routes in {elapsed:.2f} s ({len(flights) / elapsed:.1f} routes/s): "
+          f"fetch {fetched - start:.2f} s for {stations} stations and {points} route points, "
+          f"brief {briefed - fetched:.2f} s, summaries {done - briefed:.2f} s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import briefing
+import helper
+import upstream
+from airports import AIRPORTS_PATH, AirportIndex, airport_index, load_airports
+from briefing import BriefingGraph, run_briefing
+from fixtures import ARCHIVE_PATH, Replayer
+from pirep import decode_pireps
+from records import metar_records, taf_records
+
+
+# Benchmarks for the parsing, geometry and briefing hot paths. Every corpus is
+# fixed, so numbers are comparable between runs on the same machine:
+#
+#   python bench.py            compare against bench_baseline.json (the first
+#                              run on a machine writes it)
+#   python bench.py --save     record a new baseline
+#   python bench.py --check    also exit 1 on a regression
+#   python bench.py --only import
+#                              only benchmarks whose name contains "import"
+#
+# Baselines are per machine and not checked in. A benchmark more than
+# REGRESSION_FACTOR slower than its baseline is reported as a regression.
+# It fails the run (exit status 1) only with --check. A benchmark that
+# cannot run at all always fails it.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+REGRESSION_FACTOR = 1.5
+REPEAT = 7
+ROUND_SECONDS = 0.1
+
+METARS = [
+    "KORD 190451Z 27010KT 10SM FEW250 12/08 A3003 RMK AO2 SLP168",
+    "KSFO 190456Z 28016G24KT 10SM FEW008 BKN200 16/12 A2998",
+    "KDEN 190453Z VRB04KT 2 1/2SM -SN BR OVC009 M02/M03 A3012",
+    "KBOS 190454Z 05012KT 1/2SM FG VV002 09/09 A2987",
+    "KSEA 190453Z 18008KT 6SM -RA BKN015 OVC030 11/09 A2990",
+    "KJFK 190451Z 31015G22KT 10SM SCT045 14/03 A3001",
+    "KATL 190452Z 00000KT 3SM HZ SCT004 BKN012 19/18 A3008",
+    "KLAX 190453Z 25006KT 10SM CLR 18/14 A2995",
+]
+
+TAF = ("TAF KORD 190520Z 1906/2012 27012KT P6SM SCT025 BKN080 TEMPO 1908/1912 4SM -SHRA BKN025 "
+       "FM191400 29015G25KT P6SM BKN040 FM200000 30010KT P6SM SCT050 FM200600 31008KT P6SM FEW250")
+
+PIREPS = [
+    "SAC UA /OV SAC090020/TM 1850/FL080/TP C172/SK BKN030-TOP060/TB LGT/IC NEG/RM SMOOTH",
+    "DEN UUA /OV DEN270040/TM 2105/FL350/TP B738/TB SEV 330-370/RM TOPS 390",
+    "ORD UA /OV ORD180015/TM 1402/FL120/TP E145/SK OVC020-TOP110/TA M08/IC MOD RIME 090-120",
+    "SFO UA /OV OAK/TM 0315/FLDURD/TP A320/WX FV03SM HZ/TB MOD-SEV 040-060",
+]
+
+SIGMET = ("CONVECTIVE SIGMET 45C VALID UNTIL 2055Z KS OK TX FROM 30W SLN-40E OKC-20S SPS-50W GAG-30W SLN "
+          "DMSHG AREA TS MOV FROM 24025KT. TOPS TO FL450. OUTLOOK VALID 192055-200055 "
+          "FROM ICT-TUL-DFW-ABI-ICT WST ISSUANCES EXPD.")
+
+# Station positions for the synthetic upstream used by the briefing runs.
+STATIONS = {
+    "KSFO": (37.619, -122.375), "KSMF": (38.695, -121.591), "KRNO": (39.499, -119.768),
+    "KSLC": (40.788, -111.978), "KDEN": (39.862, -104.673), "KOMA": (41.303, -95.894),
+    "KORD": (41.960, -87.932), "KCLE": (41.411, -81.850), "KPIT": (40.492, -80.233),
+    "KJFK": (40.640, -73.779),
+}
+STARTUP_MODULES = ["helper", "briefing", "jobs", "api"]
+ROUTE = ["KSFO", "KRNO", "KSLC", "KDEN", "KOMA", "KORD", "KJFK"]
+
+
+def _polygon(lat, lon, radius, n=64):
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    return [{"lat": float(lat + radius * np.sin(a)), "lon": float(lon + radius * 1.3 * np.cos(a))} for a in angles]
+
+
+POLYGON = _polygon(39.0, -105.0, 3.0)
+POINTS = [(38.0 + i * 0.01, -106.0 + i * 0.02) for i in range(200)]
+
+
+def synthetic_upstream(url, params, timeout):
+    # Deterministic stand-in for aviationweather.gov and open-meteo, shaped
+    # like the real payloads.
+    params = params or {}
+    if "open-meteo" in url:
+        code = 95 if int(params["latitude"] * 10) % 7 == 0 else 3
+        return {"current_weather": {"weathercode": code, "temperature": 8.5, "windspeed": 14}}
+    if "airsigmet" in url:
+        return [{"airSigmetId": i, "receiptTime": "2026-10-19 04:55:00", "hazard": "CONVECTIVE",
+                 "airSigmetType": "SIGMET", "severity": 3, "altitudeLow1": 0, "altitudeHi1": 45000,
+                 "validTimeTo": 1760856900, "rawAirSigmet": SIGMET, "coords": _polygon(36 + i, -120 + 4 * i, 1.5)}
+                for i in range(12)]
+    if "pirep" in url:
+        lat0, lon0, lat1, lon1 = (float(v) for v in params["bbox"].split(","))
+        lats = np.linspace(lat0, lat1, 40)
+        lons = np.linspace(lon0, lon1, 40)
+        return [{"lat": float(la), "lon": float(lo), "rawOb": PIREPS[i % len(PIREPS)], "fltLvl": "080"}
+                for i, (la, lo) in enumerate(zip(lats, lons))]
+
+    ids = url.split("ids=")[1].split("&")[0]
+    return [entry for icao in ids.split(",") for entry in _synthetic_station(url, icao)]
+
+
+def _synthetic_station(url, icao):
+    # Like the real API, an unknown station is simply missing from the reply.
+    if icao not in STATIONS:
+        return []
+    lat, lon = STATIONS[icao]
+    if "/airport" in url:
+        return [{"icaoId": icao, "lat": lat, "lon": lon}]
+    if "/metar" in url:
+        raw = METARS[sorted(STATIONS).index(icao) % len(METARS)]
+        return [{"icaoId": icao, "rawOb": raw, "reportTime": "2026-10-19 05:00:00", "metarType": "METAR",
+                 "lat": lat, "lon": lon, "wdir": 270, "wspd": 10, "visib": "10+", "temp": 12.2, "dewp": 8.3,
+                 "altim": 1016.9, "clouds": [{"cover": "BKN", "base": 2500}]}]
+    if "/taf" in url:
+        return [{"icaoId": icao, "rawTAF": TAF.replace("KORD", icao), "issueTime": "2026-10-19 05:20:00",
+                 "lat": lat, "lon": lon}]
+    return []
+
+
+class CountingTransport:
+    def __init__(self, transport):
+        self.transport = transport
+        self.calls = 0
+
+    def __call__(self, url, params, timeout):
+        self.calls += 1
+        return self.transport(url, params, timeout)
+
+
+def best_of(fn, repeat=REPEAT):
+    # Best per-call time over `repeat` rounds of about ROUND_SECONDS each.
+    start = time.perf_counter()
+    fn()
+    number = max(1, int(ROUND_SECONDS / max(time.perf_counter() - start, 1e-7)))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+def _cold():
+    upstream.clear()
+    helper._pirep_cache.clear()
+    helper._sigmet_feed.update(stamp=None, advisories=[])
+    helper._sigmet_translations.clear()
+
+
+def micro_benchmarks():
+    metar_list = metar_records(synthetic_upstream("https://aviationweather.gov/api/data/metar?ids=KORD", {}, 10))
+    taf_list = taf_records(synthetic_upstream("https://aviationweather.gov/api/data/taf?ids=KORD", {}, 10))
+    route = helper.interpolate_points(STATIONS["KSFO"], STATIONS["KJFK"])
+    pireps = decode_pireps(synthetic_upstream("https://aviationweather.gov/api/data/pirep",
+                                              {"bbox": "30,-125,45,-70"}, 10) * 25)
+    metars = metar_list * 500
+    index = airport_index()
+
+    return {
+        "parse_metar_new": lambda: [helper.parse_metar_new(m) for m in METARS],
+        "format_taf": lambda: helper.format_taf(taf_list, "KORD"),
+        "get_formatted_taf (cached)": lambda: helper.get_formatted_taf("KORD"),
+        "summarize_pirep": lambda: [helper.summarize_pirep(p) for p in PIREPS],
+        "parse_sigmet": lambda: helper.parse_sigmet(SIGMET),
+        "translate_sigmet": lambda: helper.translate_sigmet(SIGMET),
+        "warning_level (cached)": lambda: helper.warning_level("KORD"),
+        "warning_level_from_raw": lambda: [helper.warning_level_from_raw(m) for m in METARS],
+        "flight_categories x500": lambda: helper.flight_categories(metars),
+        "is_point_in_polygon x200": lambda: [helper.is_point_in_polygon(la, lo, POLYGON) for la, lo in POINTS],
+        "interpolate_points": lambda: helper.interpolate_points(STATIONS["KSFO"], STATIONS["KJFK"]),
+        "pireps_near_route x1000": lambda: helper.pireps_near_route(route, pireps),
+        "airport complete x6": lambda: [index.complete(q) for q in ("K", "KS", "KSF", "SFO", "EGL", "KSFX")],
+        "airport resolve x7": lambda: [index.resolve(s) for s in ROUTE],
+    }
+
+
+def import_time(module, repeat=3):
+    # Cumulative import time of `module` in a fresh interpreter, best of
+    # `repeat`, as reported by -X importtime.
+    # RuntimeError if the import fails or is not reported.
+    best = None
+    for _ in range(repeat):
+        run = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True, cwd=os.path.dirname(BASELINE_PATH))
+        if run.returncode != 0:
+            error = run.stderr.strip().splitlines()[-1:] or ["no output"]
+            raise RuntimeError(f"import {module} failed: {error[0]}")
+        seconds = None
+        for line in run.stderr.splitlines():
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) == 3 and parts[2] == module:
+                seconds = int(parts[1]) / 1e6
+        if seconds is None:
+            raise RuntimeError(f"-X importtime did not report {module}")
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def briefing_benchmark(route, transport):
+    # Cold: empty caches, new graph. Warm: same graph and caches, i.e. a
+    # resubmit of an unchanged plan. The airport database is static and
+    # loaded once per process, so it is not part of either.
+    airport_index()
+    waypoints = [{"airport_id": s, "altitude": "9500"} for s in route]
+    counting = upstream.set_transport(CountingTransport(transport))
+    results = {}
+    try:
+        _cold()
+        graph = BriefingGraph()
+        start = time.perf_counter()
+        run_briefing(graph, waypoints)
+        results["briefing cold"] = (time.perf_counter() - start, counting.calls)
+
+        counting.calls = 0
+        start = time.perf_counter()
+        run_briefing(graph, waypoints)
+        results["briefing warm"] = (time.perf_counter() - start, counting.calls)
+
+        _cold()
+        gc.collect()
+        tracemalloc.start()
+        run_briefing(BriefingGraph(), waypoints)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        upstream.set_transport(None)
+    return results, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AeroBrief benchmarks")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on a regression")
+    parser.add_argument("--only", help="run only benchmarks whose name contains this")
+    parser.add_argument("--route", help="waypoint file to brief against the recorded archive instead of the synthetic upstream")
+    args = parser.parse_args()
+
+    # No LLM, no rate limiting: we are timing our own code.
+    briefing.ask_llm = lambda final: final[:200]
+    helper.OPEN_METEO_DELAY = 0
+    upstream.set_transport(synthetic_upstream)
+
+    def selected(name):
+        return not args.only or args.only in name
+
+    results = {}
+    failed = []
+    for name, fn in micro_benchmarks().items():
+        if not selected(name):
+            continue
+        fn()
+        results[name] = best_of(fn)
+        print(f"{name:32s} {results[name] * 1e6:12.1f} µs")
+
+    if selected("airport index build"):
+        results["airport index build"] = best_of(lambda: AirportIndex(load_airports(AIRPORTS_PATH)), repeat=3)
+        print(f"{'airport index build':32s} {results['airport index build'] * 1e3:12.1f} ms")
+
+    for module in STARTUP_MODULES:
+        name = f"import {module}"
+        if not selected(name):
+            continue
+        try:
+            results[name] = import_time(module)
+        except RuntimeError as e:
+            failed.append(name)
+            print(f"{name:32s} FAILED: {e}")
+            continue
+        print(f"{name:32s} {results[name] * 1e3:12.1f} ms")
+
+    if selected("briefing cold") or selected("briefing warm"):
+        route, transport = ROUTE, synthetic_upstream
+        if args.route:
+            with open(args.route) as f:
+                route = [w["airport_id"] for w in json.load(f)["waypoints"]]
+            transport = Replayer(ARCHIVE_PATH)
+        runs, peak = briefing_benchmark(route, transport)
+        for name, (seconds, calls) in runs.items():
+            results[name] = seconds
+            print(f"{name:32s} {seconds * 1e3:12.1f} ms  ({calls} upstream requests)")
+        print(f"{'briefing peak memory':32s} {peak / 1024:12.1f} KiB")
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    if args.save or not baseline:
+        baseline.update(results)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {BASELINE_PATH}")
+        return 1 if failed else 0
+
+    regressions = [name for name, seconds in results.items()
+                   if name in baseline and seconds > baseline[name] * REGRESSION_FACTOR]
+    for name in regressions:
+        print(f"REGRESSION: {name} {results[name] / baseline[name]:.2f}x slower than baseline")
+    return 1 if failed or (args.check and regressions) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+import time
+import itertools
+import threading
+from functools import partial
+
+import requests
+
+from tracing import span
+from airports import to_icao
+from history import station_history
+from map_render import payload_json
+
+from helper import (
+    fetch_metar,
+    fetch_taf,
+    fetch_stations,
+    fetch_pirep_corridor,
+    lat_log,
+    format_metar,
+    format_taf,
+    flight_categories,
+    interpolate_points,
+    route_weather,
+    pireps_near_route,
+    fetch_sigmet_feed,
+    sigmets_near_route,
+    sigmets_over_waypoints,
+    altitude_band,
+    pireps_in_band,
+    sigmets_in_band,
+    route_weather_in_band,
+    ask_llm,
+    product_age,
+)
+
+
+# Upstream products are refetched once they are older than this (seconds).
+SOURCE_MAX_AGE = 300
+
+_versions = itertools.count(1)
+
+
+class Node:
+    def __init__(self, value, deps, version, computed_at, cost):
+        self.value = value
+        self.deps = deps
+        self.version = version
+        self.computed_at = computed_at
+        self.cost = cost
+
+
+class BriefingGraph:
+    # Dependency-tracked cache for the briefing pipeline:
+    #   airport -> METAR/TAF -> category
+    #   leg -> route samples -> hazards
+    # A node is recomputed only when one of its dependencies changed version
+    # (or, for upstream sources, when it is older than max_age). A recomputed
+    # node that produces an equal value keeps its version, so unchanged
+    # weather does not ripple down to the legs or the LLM summary.
+
+    def __init__(self, max_age=SOURCE_MAX_AGE):
+        self.max_age = max_age
+        self.nodes = {}
+        self.reused = []
+        self.computed = []
+        self.elapsed = 0.0
+        self._live = set()
+        self._started = None
+        # Nodes are filled from worker threads by BriefingJob; run_lock keeps
+        # two briefings from interleaving on the same graph.
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.run_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.reused = []
+            self.computed = []
+            self._live = set()
+            self._started = time.perf_counter()
+
+    def finish(self, prune=True):
+        # Drop nodes for waypoints/legs that are no longer part of the plan.
+        with self._lock:
+            if prune:
+                for key in list(self.nodes):
+                    if key not in self._live:
+                        del self.nodes[key]
+                        self._key_locks.pop(key, None)
+            self.elapsed = time.perf_counter() - self._started
+
+    def keep(self, key):
+        # Keep an existing node through finish() without running it, e.g. the
+        # LLM summary on a run that only wants the hazards.
+        with self._lock:
+            if key in self.nodes:
+                self._live.add(key)
+
+    def invalidate(self, key):
+        entry = self.nodes.get(key)
+        if entry is not None:
+            entry.computed_at = float("-inf")
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def node(self, key, deps, fn, max_age=None):
+        # Concurrent requests for the same node wait for the first one
+        # instead of computing (and fetching) it twice.
+        with self._key_lock(key):
+            return self._node(key, deps, fn, max_age)
+
+    def _node(self, key, deps, fn, max_age):
+        with self._lock:
+            self._live.add(key)
+            dep_versions = tuple(self.nodes[d].version for d in deps)
+            dep_values = [self.nodes[d].value for d in deps]
+            entry = self.nodes.get(key)
+            if entry is not None and entry.deps == dep_versions:
+                if max_age is None or time.time() - entry.computed_at < max_age:
+                    if key not in self.reused:
+                        self.reused.append(key)
+                    return entry.value
+
+        t0 = time.perf_counter()
+        with span(key[0], node_label(key[1:])):
+            value = fn(*dep_values)
+        cost = time.perf_counter() - t0
+
+        with self._lock:
+            if entry is not None and entry.value == value:
+                version = entry.version
+            else:
+                version = next(_versions)
+            self.nodes[key] = Node(value, dep_versions, version, time.time(), cost)
+            self.computed.append(key)
+        return value
+
+    def input(self, key, value):
+        # A plain value from the user's plan (e.g. an altitude band). Only a
+        # different value invalidates the nodes that depend on it.
+        with self._lock:
+            self._live.add(key)
+            entry = self.nodes.get(key)
+            if entry is not None and entry.value == value:
+                if key not in self.reused:
+                    self.reused.append(key)
+                return value
+            self.nodes[key] = Node(value, (), next(_versions), time.time(), 0.0)
+            self.computed.append(key)
+        return value
+
+    def source(self, key, fn):
+        return self.node(key, (), fn, max_age=self.max_age)
+
+    def value(self, key):
+        with self._lock:
+            entry = self.nodes.get(key)
+            return None if entry is None else entry.value
+
+    def snapshot(self, keys):
+        # {key: (version, value)} for whichever of keys currently exist.
+        with self._lock:
+            return {k: (self.nodes[k].version, self.nodes[k].value) for k in keys if k in self.nodes}
+
+    def report(self):
+        # full_cost is what a from-scratch run would have taken, using the
+        # last measured compute time of every node in the current plan.
+        with self._lock:
+            return {
+                "elapsed": self.elapsed,
+                "full_cost": sum(n.cost for n in self.nodes.values()),
+                "reused": [node_label(k) for k in self.reused],
+                "computed": [node_label(k) for k in self.computed],
+            }
+
+
+def node_label(key):
+    return " ".join(str(k) for k in key)
+
+
+def _summary_prompt(*parts):
+    final = ""
+    for part in parts:
+        if isinstance(part, list):
+            for pirep in part:
+                final += pirep["summary"] + ' '
+        else:
+            final += part
+            final += '\n'
+    return final
+
+
+def _leg_pireps(route_points, pireps, band):
+    return pireps_near_route(route_points, pireps_in_band(pireps, band))
+
+
+def _corridor_pireps(*routes):
+    return fetch_pirep_corridor([tuple(pt) for route in routes for pt in route])
+
+
+def station_stage(waypoints):
+    # One batched METAR and one TAF request for the distinct stations of the
+    # plan; airport_stage then reads them station by station from the cache.
+    # If the batch fails each station is retried on its own there.
+    try:
+        with span("stations", str(len(waypoints))):
+            fetch_stations([to_icao(w["airport_id"]) for w in waypoints])
+    except requests.exceptions.RequestException as e:
+        print("Batched METAR/TAF fetch failed:", e)
+
+
+def airport_stage(graph, waypoint):
+    icao = to_icao(waypoint["airport_id"])
+
+    airport = {
+        "airport_id": icao,
+        "altitude": waypoint.get("altitude", ""),
+        "lat": None,
+        "lon": None,
+        "metar": f"METAR temporarily unavailable for {icao}.",
+        "taf": f"TAF temporarily unavailable for {icao}.",
+        "warning_level": 5,
+        "history": None,
+    }
+
+    # An airport that cannot be placed (unknown code, airport API down)
+    # fails its own card; its legs are left out of the briefing.
+    try:
+        airport["lat"], airport["lon"] = graph.node(("position", icao), (), partial(lat_log, icao))
+    except (ValueError, requests.exceptions.RequestException) as e:
+        print("Airport lookup failed:", icao, e)
+        airport.update(metar=str(e), taf=str(e), error=str(e), age={"metar": None, "taf": None})
+        return airport
+
+    # A dead upstream with nothing cached only blanks this card; the rest of
+    # the briefing carries on.
+    try:
+        graph.source(("metar_raw", icao), partial(fetch_metar, icao))
+        airport["metar"] = graph.node(("metar", icao), (("metar_raw", icao),), partial(_format_metar, icao=icao))
+        airport["warning_level"] = graph.node(("category", icao), (("metar_raw", icao),), _category)
+        # Read from the local history store; a new METAR is what adds to it.
+        airport["history"] = graph.node(("history", icao), (("metar_raw", icao),), lambda _: station_history(icao))
+    except requests.exceptions.RequestException as e:
+        print("METAR fetch failed:", icao, e)
+    try:
+        graph.source(("taf_raw", icao), partial(fetch_taf, icao))
+        airport["taf"] = graph.node(("taf", icao), (("taf_raw", icao),), partial(_format_taf, icao=icao))
+    except requests.exceptions.RequestException as e:
+        print("TAF fetch failed:", icao, e)
+
+    airport["age"] = {"metar": product_age("metar", icao), "taf": product_age("taf", icao)}
+    return airport
+
+
+def _format_metar(metar_list, icao):
+    return format_metar(metar_list, icao)
+
+
+def _format_taf(taf_list, icao):
+    return format_taf(taf_list, icao)
+
+
+def _category(metar_list):
+    if not metar_list or not isinstance(metar_list, list):
+        return 5
+    return int(flight_categories(metar_list[:1])[2][0])
+
+
+def route_legs(airports):
+    # One leg per pair of airports, in the direction first flown: an
+    # A-B-A-B plan briefs A-B once, over all the altitudes planned for it.
+    # Legs to an airport that could not be placed are skipped.
+    legs = {}
+    for a, b in zip(airports, airports[1:]):
+        if a["airport_id"] == b["airport_id"] or a.get("error") or b.get("error"):
+            continue
+        band = altitude_band(a["altitude"], b["altitude"])
+        key = frozenset((a["airport_id"], b["airport_id"]))
+        if key in legs:
+            start, end, seen = legs[key]
+            if band is not None and seen is not None:
+                band = (min(band[0], seen[0]), max(band[1], seen[1]))
+            else:
+                band = None
+            legs[key] = (start, end, band)
+        else:
+            legs[key] = (a["airport_id"], b["airport_id"], band)
+    return list(legs.values())
+
+
+def _route_node(graph, a, b):
+    route_key = ("route", a, b)
+    graph.node(route_key, (("position", a), ("position", b)),
+               lambda start, end: interpolate_points(tuple(start), tuple(end)))
+    return route_key
+
+
+def pirep_corridor_stage(graph, airports):
+    # One PIREP query covering every leg of the route.
+    route_keys = tuple(_route_node(graph, a, b) for a, b, _ in route_legs(airports))
+    key = ("pirep_corridor",) + _stations(airports)
+    graph.node(key, route_keys, _corridor_pireps, max_age=graph.max_age)
+    return key
+
+
+def leg_stage(graph, a, b, band, corridor_key):
+    route_key = _route_node(graph, a, b)
+    band_key = ("band", a, b)
+    graph.input(band_key, band)
+    graph.node(("route_weather_raw", a, b), (route_key,), route_weather, max_age=graph.max_age)
+    warnings = graph.node(("route_weather", a, b), (("route_weather_raw", a, b), band_key), route_weather_in_band)
+    pireps = graph.node(("leg_pireps", a, b), (route_key, corridor_key, band_key), _leg_pireps)
+    return warnings, pireps
+
+
+def _stations(airports):
+    # The distinct airports of the plan that could be placed.
+    return tuple(dict.fromkeys(a["airport_id"] for a in airports if not a.get("error")))
+
+
+def _route_sigmets(advisories, band, *routes):
+    return sigmets_near_route(sigmets_in_band(advisories, band), routes)
+
+
+def sigmet_stage(graph, airports):
+    # One feed download per briefing, filtered by the planned altitudes and
+    # then against every route sample.
+    stations = _stations(airports)
+    graph.source(("sigmet_feed",), fetch_sigmet_feed)
+    band_key = ("band",) + stations
+    graph.input(band_key, altitude_band(*[a["altitude"] for a in airports]))
+    # Every leg's samples, plus the position of any airport on no leg (a
+    # single-airport plan, or one whose neighbours could not be placed).
+    legs = route_legs(airports)
+    on_legs = {s for a, b, _ in legs for s in (a, b)}
+    route_keys = [_route_node(graph, a, b) for a, b, _ in legs]
+    route_keys += [("position", s) for s in stations if s not in on_legs]
+    routes = lambda advisories, band, *samples: _route_sigmets(
+        advisories, band, *samples[:len(legs)], *[[p] for p in samples[len(legs):]])
+    sigmet_key = ("sigmets",) + stations
+    sigmets = graph.node(sigmet_key, (("sigmet_feed",), band_key) + tuple(route_keys), routes)
+    graph.node(("sigmet_hits",) + stations, (sigmet_key,) + tuple(("position", s) for s in stations),
+               lambda sigmet_list, *positions: sigmets_over_waypoints(
+                   sigmet_list, [{"lat": p[0], "lon": p[1]} for p in positions]))
+    return sigmets
+
+
+def _map_payload(points, sigmets, *legs):
+    warnings = [w for leg in legs[:len(legs) // 2] for w in leg]
+    pireps = [p for leg in legs[len(legs) // 2:] for p in leg]
+    waypoints = [dict(zip(("airport_id", "altitude", "lat", "lon", "warning_level"), p)) for p in points]
+    return payload_json({"waypoints": waypoints, "pireps": pireps, "warnings": warnings, "sigmet": sigmets})
+
+
+def map_stage(graph, airports):
+    # The map's GeoJSON payload as a node over the leg and SIGMET nodes.
+    # Its version only changes when something drawn on the map did, which
+    # is what render_map keys its page cache on. Returns (version, payload).
+    stations = _stations(airports)
+    legs = route_legs(airports)
+    points_key = ("map_points",) + stations
+    graph.input(points_key, tuple((a["airport_id"], a["altitude"], a["lat"], a["lon"], a["warning_level"])
+                                  for a in airports))
+    deps = (points_key, ("sigmets",) + stations)
+    deps += tuple(("route_weather", a, b) for a, b, _ in legs)
+    deps += tuple(("leg_pireps", a, b) for a, b, _ in legs)
+    key = ("map",) + stations
+    graph.node(key, deps, _map_payload)
+    return graph.snapshot([key])[key]
+
+
+def _summary_deps(graph, airports):
+    stations = _stations(airports)
+    summary_deps = []
+    for icao in stations:
+        summary_deps += [("metar", icao), ("taf", icao), ("history", icao)]
+    summary_deps.append(("sigmet_hits",) + stations)
+    summary_deps += [("leg_pireps", a, b) for a, b, _ in route_legs(airports)]
+    # Stations whose METAR/TAF could not be fetched have no nodes this run,
+    # and stations without enough history have nothing to add.
+    return tuple(k for k in summary_deps if graph.value(k) is not None)
+
+
+def summary_prompt(graph, airports):
+    # The text summary_stage would send to the LLM, for callers that batch
+    # the LLM calls themselves.
+    return _summary_prompt(*[graph.value(k) for k in _summary_deps(graph, airports)])
+
+
+def summary_stage(graph, airports, hazards_only=False):
+    stations = _stations(airports)
+    legs = route_legs(airports)
+    summary_deps = _summary_deps(graph, airports)
+
+    if not hazards_only:
+        return graph.node(("summary",), summary_deps,
+                          lambda *parts: ask_llm(_summary_prompt(*parts)))
+
+    # Watch mode: a new METAR/TAF that leaves every flight category and
+    # hazard as it was keeps the previous summary. When it does rerun, the
+    # prompt uses the latest text.
+    hazard_deps = [("category", icao) for icao in stations]
+    hazard_deps.append(("sigmets",) + stations)
+    hazard_deps += [("leg_pireps", a, b) for a, b, _ in legs]
+    hazard_deps += [("route_weather", a, b) for a, b, _ in legs]
+    hazard_deps = tuple(k for k in hazard_deps if graph.value(k) is not None)
+    return graph.node(("summary",), hazard_deps,
+                      lambda *_: ask_llm(_summary_prompt(*[graph.value(k) for k in summary_deps])))
+
+
+def run_briefing(graph, waypoints, summarize=True):
+    # summarize=False skips the LLM and returns its prompt instead.
+    with graph.run_lock:
+        graph.start()
+
+        station_stage(waypoints)
+        airports = [airport_stage(graph, w) for w in waypoints]
+
+        warnings = []
+        pireps = []
+        corridor_key = pirep_corridor_stage(graph, airports)
+        for a, b, band in route_legs(airports):
+            leg_warnings, leg_pireps = leg_stage(graph, a, b, band, corridor_key)
+            warnings.extend(leg_warnings)
+            pireps.extend(leg_pireps)
+
+        sigmets = sigmet_stage(graph, airports)
+        if summarize:
+            final = summary_stage(graph, airports)
+        else:
+            final = None
+            prompt = summary_prompt(graph, airports)
+            graph.keep(("summary",))
+
+        graph.finish()
+
+    result = {
+        "waypoints": airports,
+        "pireps": pireps,
+        "warnings": warnings,
+        "sigmet": sigmets,
+        "summary": final,
+        "timing": graph.report(),
+    }
+    if not summarize:
+        result["summary_prompt"] = prompt
+    return result
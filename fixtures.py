@@ -0,0 +1,267 @@
+import argparse
+import atexit
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+
+# Record/replay of upstream HTTP (aviationweather.gov, open-meteo) so the
+# pipeline can run, be benchmarked and be load-tested offline.
+#
+#   AEROBRIEF_FIXTURES=record   capture every upstream response into the archive
+#   AEROBRIEF_FIXTURES=replay   answer from the archive, no network
+#   AEROBRIEF_MOCK_URL=http://127.0.0.1:8765
+#                               send upstream requests to `python fixtures.py serve`
+#
+# The archive (AEROBRIEF_ARCHIVE) is gzipped JSON lines, one response per key.
+# Replay and the mock server take AEROBRIEF_LATENCY / AEROBRIEF_JITTER
+# (seconds) and AEROBRIEF_ERROR_RATE (0-1) to simulate a slow or flaky upstream.
+ARCHIVE_PATH = os.environ.get("AEROBRIEF_ARCHIVE", os.path.join("fixtures", "upstream.jsonl.gz"))
+
+
+def fixture_key(url, params=None):
+    # Host, path and the sorted query (URL query and params merged), so the
+    # same request matches whether ids= is in the URL or in params.
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(k, str(v)) for k, v in (params or {}).items()]
+    return f"{parts.netloc}{parts.path}?{urlencode(sorted(query))}"
+
+
+def station_keys(key):
+    # {station: single-station key} for a multi-station request
+    # (ids=KSFO,KRNO), else {}.
+    parts = urlsplit("https://" + key)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    ids = query.get("ids", "").split(",")
+    if len(ids) < 2:
+        return {}
+    return {icao: fixture_key(f"https://{parts.netloc}{parts.path}", dict(query, ids=icao)) for icao in ids}
+
+
+def load_archive(path=ARCHIVE_PATH):
+    responses = {}
+    if os.path.exists(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                responses[entry["key"]] = entry["body"]
+    return responses
+
+
+def save_archive(responses, path=ARCHIVE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=9) as f:
+        for key in sorted(responses):
+            f.write(json.dumps({"key": key, "body": responses[key]}, separators=(",", ":")) + "\n")
+
+
+class Recorder:
+    # Transport that goes to the real upstream (or another transport, `fetch`)
+    # and keeps every successful response. Existing archive entries are kept;
+    # new ones overwrite them.
+
+    def __init__(self, path=ARCHIVE_PATH, fetch=None):
+        self.path = path
+        self.fetch = fetch
+        # Responses recorded from the network are real upstream data.
+        self.live = fetch is None
+        self.responses = load_archive(path)
+        self.recorded = 0
+        self._saved = None
+        self._lock = threading.Lock()
+        atexit.register(self.save)
+
+    def __call__(self, url, params, timeout):
+        if self.fetch is not None:
+            body = self.fetch(url, params, timeout)
+        else:
+            response = requests.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            body = response.json()
+        key = fixture_key(url, params)
+        with self._lock:
+            self.responses[key] = body
+            # Keep the per-station replies of a batched request too, so the
+            # archive also answers other combinations of these stations.
+            for icao, single_key in station_keys(key).items():
+                self.responses[single_key] = [e for e in body if isinstance(e, dict) and e.get("icaoId") == icao]
+            self.recorded += 1
+        return body
+
+    def save(self):
+        # Also runs at exit; a no-op (and silent) when nothing was recorded
+        # since the last save.
+        with self._lock:
+            if self._saved == self.recorded:
+                return
+            save_archive(self.responses, self.path)
+            self._saved = self.recorded
+        print(f"Recorded {self.recorded} responses, {len(self.responses)} in {self.path}")
+
+
+class Replayer:
+    # Transport that answers from the archive, with optional latency and
+    # injected failures (half timeouts, half HTTP 503s).
+
+    def __init__(self, path=ARCHIVE_PATH, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.responses = load_archive(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.served = 0
+        self.missing = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        with self._lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.error_rate
+            timeout = self.random.random() < 0.5
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            if fail:
+                self.failed += 1
+                return ("timeout" if timeout else 503), None
+            body = self.responses.get(key)
+            if body is None:
+                # A batched request nobody recorded in this combination:
+                # join the single-station replies.
+                singles = [self.responses.get(k) for k in station_keys(key).values()]
+                if singles and all(isinstance(b, list) for b in singles):
+                    body = [entry for b in singles for entry in b]
+            if body is None:
+                self.missing += 1
+                return 404, None
+            self.served += 1
+            return 200, body
+
+    def __call__(self, url, params, timeout):
+        key = fixture_key(url, params)
+        status, body = self.lookup(key)
+        if status == "timeout":
+            raise requests.exceptions.ReadTimeout(f"injected timeout for {key}")
+        if status != 200:
+            raise requests.exceptions.HTTPError(f"{status} from replay for {key}")
+        return body
+
+
+class MockServerTransport:
+    # Sends every upstream request to the local mock server instead, keeping
+    # the original host as the first path segment.
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def __call__(self, url, params, timeout):
+        parts = urlsplit(url)
+        mock_url = f"{self.base_url}/{parts.netloc}{parts.path}"
+        if parts.query:
+            mock_url += "?" + parts.query
+        response = requests.get(mock_url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def transport_from_env():
+    mock_url = os.environ.get("AEROBRIEF_MOCK_URL")
+    if mock_url:
+        return MockServerTransport(mock_url)
+    mode = os.environ.get("AEROBRIEF_FIXTURES")
+    if mode == "record":
+        return Recorder(ARCHIVE_PATH)
+    if mode == "replay":
+        return Replayer(
+            ARCHIVE_PATH,
+            latency=float(os.environ.get("AEROBRIEF_LATENCY", 0)),
+            jitter=float(os.environ.get("AEROBRIEF_JITTER", 0)),
+            error_rate=float(os.environ.get("AEROBRIEF_ERROR_RATE", 0)),
+        )
+    return None
+
+
+def serve(replayer, host="127.0.0.1", port=8765):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            upstream_host, _, rest = self.path.lstrip("/").partition("/")
+            status, body = replayer.lookup(fixture_key(f"https://{upstream_host}/{rest}"))
+            if status == "timeout":
+                # Hold the connection past any sane client timeout.
+                time.sleep(30)
+                status = 504
+            payload = json.dumps(body).encode() if status == 200 else b"{}"
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def record_route(path):
+    # Drive everything a briefing for this route fetches: the app's stages,
+    # including the SIGMET feed, and generate_quick.
+    from briefing import (
+        BriefingGraph,
+        airport_stage,
+        leg_stage,
+        pirep_corridor_stage,
+        route_legs,
+        sigmet_stage,
+        station_stage,
+    )
+    from helper import generate_quick
+
+    with open(path) as f:
+        waypoints = json.load(f)["waypoints"]
+    graph = BriefingGraph()
+    station_stage(waypoints)
+    airports = [airport_stage(graph, w) for w in waypoints]
+    corridor_key = pirep_corridor_stage(graph, airports)
+    for a, b, band in route_legs(airports):
+        leg_stage(graph, a, b, band, corridor_key)
+    sigmet_stage(graph, airports)
+    generate_quick(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or serve upstream fixtures")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="record every upstream response for the routes in these waypoint files")
+    rec.add_argument("routes", nargs="+")
+    srv = sub.add_parser("serve", help="serve the archive as a mock aviationweather.gov / open-meteo")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--latency", type=float, default=0.0)
+    srv.add_argument("--jitter", type=float, default=0.0)
+    srv.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        import upstream
+        upstream.set_transport(Recorder(ARCHIVE_PATH))
+        for route in args.routes:
+            record_route(route)
+    else:
+        replayer = Replayer(ARCHIVE_PATH, args.latency, args.jitter, args.error_rate)
+        server = serve(replayer, port=args.port)
+        print(f"Serving {len(replayer.responses)} responses from {ARCHIVE_PATH} on http://127.0.0.1:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
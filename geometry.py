@@ -0,0 +1,207 @@
+import heapq
+
+import numpy as np
+
+
+# Map zoom levels we prepare SIGMET outlines for. Each level is simplified to
+# roughly one screen pixel, i.e. 360 / (256 * 2**zoom) degrees.
+LOD_ZOOMS = (3, 5, 7, 9)
+
+
+def zoom_tolerance(zoom):
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def _as_array(points):
+    if len(points) and isinstance(points[0], dict):
+        return np.array([[p["lat"], p["lon"]] for p in points], dtype=float)
+    return np.asarray(points, dtype=float)
+
+
+def _segment_distances(points, start, end):
+    # Perpendicular distance of every point to the segment start-end.
+    d = end - start
+    length = np.dot(d, d)
+    if length == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip(((points - start) @ d) / length, 0, 1)
+    proj = start + t[:, None] * d
+    return np.hypot(*(points - proj).T)
+
+
+def douglas_peucker(points, tolerance):
+    pts = _as_array(points)
+    n = len(pts)
+    if n < 3:
+        return pts
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dists = _segment_distances(pts[first + 1:last], pts[first], pts[last])
+        i = int(np.argmax(dists))
+        if dists[i] > tolerance:
+            index = first + 1 + i
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return pts[keep]
+
+
+def _triangle_areas(pts):
+    a, b, c = pts[:-2], pts[1:-1], pts[2:]
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def visvalingam(points, tolerance):
+    # Drop the vertex with the smallest effective triangle area until every
+    # remaining area is above tolerance**2 (same units as douglas_peucker).
+    pts = _as_array(points)
+    n = len(pts)
+    if n < 3:
+        return pts
+
+    min_area = tolerance ** 2
+    areas = np.full(n, np.inf)
+    areas[1:-1] = _triangle_areas(pts)
+    prev = np.arange(-1, n - 1)
+    nxt = np.arange(1, n + 1)
+    alive = np.ones(n, dtype=bool)
+
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    while heap:
+        area, i = heapq.heappop(heap)
+        if not alive[i] or area != areas[i]:
+            continue
+        if area >= min_area:
+            break
+        alive[i] = False
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                # Never let a neighbour become cheaper than what was removed.
+                areas[j] = max(area, _triangle_areas(pts[[prev[j], j, nxt[j]]])[0])
+                heapq.heappush(heap, (areas[j], j))
+    return pts[alive]
+
+
+def simplify(points, tolerance, method="dp"):
+    simplified = douglas_peucker(points, tolerance) if method == "dp" else visvalingam(points, tolerance)
+    # A polygon needs three distinct corners; fall back to the original shape.
+    if len(np.unique(simplified, axis=0)) < 3:
+        return _as_array(points)
+    return simplified
+
+
+def encode_polyline(points, precision=5):
+    # Google encoded polyline format over (lat, lon) pairs.
+    pts = np.round(_as_array(points) * 10 ** precision).astype(np.int64)
+    if not len(pts):
+        return ""
+    deltas = np.diff(pts, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+def decode_polyline(encoded, precision=5):
+    values = []
+    value = shift = 0
+    for ch in encoded:
+        b = ord(ch) - 63
+        value |= (b & 0x1f) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return coords / 10 ** precision
+
+
+def polygon_lods(points, zooms=LOD_ZOOMS, method="dp"):
+    # [(min_zoom, encoded_polyline), ...], skipping levels that would repeat
+    # the previous (coarser) outline.
+    lods = []
+    for zoom in zooms:
+        encoded = encode_polyline(simplify(points, zoom_tolerance(zoom), method))
+        if not lods or lods[-1][1] != encoded:
+            lods.append((zoom, encoded))
+    return lods
+
+
+EARTH_RADIUS_NM = 3440.065
+
+
+def haversine_nm(lat1, lon1, lat2, lon2):
+    # Broadcasting great-circle distance, e.g. route points (n, 1) against
+    # reports (1, m) gives an (n, m) matrix in one call.
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _point_segment_nm(p, a, b):
+    # Broadcasting distance from points p to segments a-b, all (..., 2) in nm.
+    d = b - a
+    length = (d * d).sum(axis=-1)
+    t = np.clip(((p - a) * d).sum(axis=-1) / np.where(length == 0, 1, length), 0, 1)
+    return np.hypot(*np.moveaxis(p - (a + t[..., None] * d), -1, 0))
+
+
+def _cross(o, a, b):
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def segments_to_polygon_nm(starts, ends, polygon):
+    # Shortest distance (nm) from each route segment start-end to the outline
+    # of polygon, 0 where it crosses an edge. Each segment is measured in a
+    # flat projection around its own start, which is accurate enough at the
+    # tens of nm hazards are matched at. Containment is points_in_polygon's job.
+    poly = _as_array(polygon)
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    origin = starts[:, None, :]
+    scale = np.cos(np.radians((starts[:, 0] + ends[:, 0]) / 2))[:, None]
+
+    def project(points):
+        d = points - origin
+        return np.stack([d[..., 0] * 60, d[..., 1] * 60 * scale], axis=-1)
+
+    p, q = project(starts[:, None, :]), project(ends[:, None, :])
+    a, b = project(poly[None, :, :]), project(np.roll(poly, -1, axis=0)[None, :, :])
+    p, q = np.broadcast_to(p, a.shape), np.broadcast_to(q, a.shape)
+
+    crosses = ((_cross(p, q, a) * _cross(p, q, b) < 0) &
+               (_cross(a, b, p) * _cross(a, b, q) < 0))
+    distances = np.minimum.reduce([
+        _point_segment_nm(p, a, b), _point_segment_nm(q, a, b),
+        _point_segment_nm(a, p, q), _point_segment_nm(b, p, q),
+    ])
+    return np.where(crosses, 0.0, distances).min(axis=1)
+
+
+def points_in_polygon(xs, ys, polygon):
+    # Vectorised version of helper.is_point_in_polygon (same ray casting and
+    # the same lat/lon axes), for many points against one polygon.
+    poly = _as_array(polygon)
+    xs = np.asarray(xs, dtype=float)[:, None]
+    ys = np.asarray(ys, dtype=float)[:, None]
+    xi, yi = poly[:, 0], poly[:, 1]
+    xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+
+    crosses = (yi > ys) != (yj > ys)
+    x_intersect = (xj - xi) * (ys - yi) / (yj - yi + 1e-12) + xi
+    hits = crosses & (xs < x_intersect)
+    return (hits.sum(axis=1) % 2).astype(bool)
@@ -1,14 +1,20 @@
 import re
 import requests
-from groq import Groq
 import json
 from datetime import datetime, timezone
-from geopy.distance import geodesic
 import numpy as np
 import time
 
 import os
-from dotenv import load_dotenv
+import threading
+
+from geometry import haversine_nm, points_in_polygon, segments_to_polygon_nm
+from pirep import decode_pirep, decode_pireps
+from upstream import get_json, observe, prefetch_batch, age as upstream_age, sent as upstream_sent
+from records import CEILING_COVERS, flight_category, metar_records, taf_records, visibility_sm
+from airports import airport_index
+from history import archive_response
+from tracing import span
 
 
 
@@ -34,6 +40,32 @@ abbreviations = {
     "WI": "within",
     "WKN": "weakening",
     "Z": "UTC",
+    "AFT": "after",
+    "BLW": "below",
+    "BTN": "between",
+    "BYD": "beyond",
+    "CIG": "ceilings",
+    "CLDS": "clouds",
+    "CONDS": "conditions",
+    "CONTG": "continuing",
+    "CWA": "Center Weather Advisory",
+    "DMSHG": "diminishing",
+    "DVLPG": "developing",
+    "EMBD": "embedded",
+    "FRQ": "frequent",
+    "FZLVL": "freezing level",
+    "ICE": "icing",
+    "IMPR": "improving",
+    "ISOL": "isolated",
+    "LLWS": "low-level wind shear",
+    "MOD": "moderate",
+    "MTN OBSCN": "mountain obscuration",
+    "OCNL": "occasional",
+    "PCPN": "precipitation",
+    "SEV": "severe",
+    "TS": "thunderstorms",
+    "TURB": "turbulence",
+    "VIS": "visibility",
 }
 
 weather_codes = {
@@ -103,15 +135,13 @@ def is_point_in_polygon(x, y, polygon):
 
 
 def get_formatted_taf(airport_code):
-    url = f"https://aviationweather.gov/api/data/taf?ids={airport_code}&format=json"
-    response = requests.get(url)
-    
-    
-    if not response.json():
+    return format_taf(fetch_taf(airport_code), airport_code)
+
+def format_taf(data, airport_code):
+    if not data:
         return f"No TAF data available for airport '{airport_code}'."
-    data = response.json()
     
-    taf_raw = data[0].get("rawTAF", "")
+    taf_raw = data[0].raw
     if not taf_raw:
         return f"TAF data for '{airport_code}' is missing raw text."
 
@@ -201,26 +231,11 @@ def get_formatted_taf(airport_code):
     return "\n".join(result)
 
 
-def fetch_pirep(airport_id):
-    url = f"https://aviationweather.gov/api/data/pirep?ids={airport_id}&format=json"
-    response1 = requests.get(url)
-    response1=response1.json()
-    return response1
-
-def fetch_sigmet_h(altitude=None):
+def sigmets_over_waypoints(sigmets, airports):
     final = ""
-    
-    with open('sigmets_new.json', 'r') as file:
-        data = json.load(file)
-    data = data["sigmet"]
-
-    with open('airports_st.json', 'r') as file:
-        airports = json.load(file)
-    airports = airports['waypoints']
-
     for airport in airports:
 
-        for sigmet in data:
+        for sigmet in sigmets:
             if is_point_in_polygon(airport['lat'], airport['lon'], sigmet['coords']):
                 final += sigmet['sigmet_eng']
                 final += '\n'
@@ -228,46 +243,42 @@ def fetch_sigmet_h(altitude=None):
     return final
 
 
-def fetch_metar(airport_id):
-    url = f"https://aviationweather.gov/api/data/metar?ids={airport_id}&format=json"
-    response = requests.get(url)
-    return response.json()
-
 def parse_metar(airport_id,yes=0):
-    metar_list = fetch_metar(airport_id)
+    return format_metar(fetch_metar(airport_id), airport_id, yes)
 
+def format_metar(metar_list, airport_id, yes=0):
     if not metar_list or not isinstance(metar_list, list):
         return f"No valid METAR data returned for {airport_id}."
 
-    metar_entry = metar_list[0]  
+    metar = metar_list[0]
 
     if yes:
-        return metar_entry['rawOb']
+        return metar.raw
 
     result = {}
 
-    result["Type"] = "Routine METAR report" if metar_entry.get("metarType") == "METAR" else "Special METAR report"
-    result["Station"] = metar_entry.get("icaoId", "Unknown")
-    result["Time"] = metar_entry.get("reportTime", "Unknown")
+    result["Type"] = "Routine METAR report" if metar.metar_type == "METAR" else "Special METAR report"
+    result["Station"] = metar.icao or "Unknown"
+    result["Time"] = metar.report_time or "Unknown"
 
-    wdir = metar_entry.get("wdir")
-    wspd = metar_entry.get("wspd")
-    wgst = metar_entry.get("wgst")
+    wdir = metar.wdir
+    wspd = metar.wspd
+    wgst = metar.wgst
     if wdir is not None and wspd is not None:
         wind = f"{wdir}° at {wspd} knots"
         if wgst:
             wind += f" with gusts to {wgst} knots"
         result["Wind"] = wind
 
-    vis = metar_entry.get("visib")
+    vis = metar.visib
     if vis is not None:
         result["Visibility"] = f"{vis} statute miles"
 
-    wx = metar_entry.get("wxString")
+    wx = metar.wx
     if wx:
         result["Weather"] = wx
 
-    clouds = metar_entry.get("clouds", [])
+    clouds = metar.clouds
     if clouds:
         layers = []
         cover_dict = {
@@ -276,26 +287,24 @@ def parse_metar(airport_id,yes=0):
             "BKN": "Broken clouds",
             "OVC": "Overcast"
         }
-        for cloud in clouds:
-            cover = cloud.get("cover")
-            base = cloud.get("base")
+        for cover, base in clouds:
             if cover and base is not None:
-                desc = f"{cover_dict.get(cover, cover)} at {base * 100} feet"
+                desc = f"{cover_dict.get(cover, cover)} at {base} feet"
                 layers.append(desc)
         result["Sky"] = "; ".join(layers)
 
-    temp = metar_entry.get("temp")
-    dewp = metar_entry.get("dewp")
+    temp = metar.temp
+    dewp = metar.dewp
     if temp is not None:
         result["Temperature"] = f"{temp:.1f}°C"
     if dewp is not None:
         result["Dewpoint"] = f"{dewp:.1f}°C"
 
-    alt = metar_entry.get("altim")
+    alt = metar.altim
     if alt is not None:
         result["Altimeter"] = f"{alt} hPa"
 
-    slp = metar_entry.get("slp")
+    slp = metar.slp
     if slp is not None:
         result["Sea Level Pressure"] = f"{slp} hPa"
 
@@ -307,35 +316,22 @@ def parse_metar(airport_id,yes=0):
     
 
 def fetch_metar_new(airport_ids):
-    if isinstance(airport_ids, list):
-        airport_id = ''
-        for id in airport_ids:
-            airport_id += id
-            airport_id += '%'
-        airport_id = airport_id[:-1]
-    else:
-        airport_id = airport_ids
-        airport_ids = ''
-
-    url = f"https://aviationweather.gov/api/data/metar?ids={airport_id}&format=json&taf=true"
-    x = requests.get(url)
-    try:
-        response = x.json()
-        n = len(airport_ids)
-        metar_taf = {}
-        if n == 0:
-            # #print(response)
-            return parse_metar_new(response[0]['rawOb'])
-        for x in range(n):
-            airport_data = response[x]
-            # #print(airport_data)
-            metar_taf[airport_data['icaoId']] = {
-                # 'taf': parse_taf(airport_data['rawTaf']),
-                'metar': parse_metar_new(airport_data['rawOb'])
-            }        
-        return metar_taf
-    except:
-        print(x)
+    # Decoded METAR text for one station, or {icao: {'metar': text}} for a
+    # list (stations without a current METAR are left out). Fetch errors
+    # propagate; a single station without a METAR is a ValueError.
+    single = not isinstance(airport_ids, list)
+    stations = [airport_ids] if single else list(dict.fromkeys(airport_ids))
+    fetch_stations(stations, ("metar",))
+    metar_taf = {}
+    for icao in stations:
+        metars = fetch_metar(icao)
+        if metars:
+            metar_taf[icao] = {'metar': parse_metar_new(metars[0].raw)}
+    if single:
+        if airport_ids not in metar_taf:
+            raise ValueError(f"No METAR for '{airport_ids}'")
+        return metar_taf[airport_ids]['metar']
+    return metar_taf
 
 def parse_metar_new(raw):
     components = raw.split()
@@ -442,54 +438,39 @@ def parse_metar_new(raw):
         # #print(f"{key}: {value}")
     return final
 
-def read_pirep(file_path):
-    final=''
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    
-    pireps = data.get("pireps", [])
-    if len(pireps) !=0:
-        for pirep in pireps:
-            final += pirep["summary"] + ' '
-
-    ##print('final, pirep', final)
-    return final
-
-def summary():
-    load_dotenv()
-    try:
-        final=''
-        with open("airports_st.json", "r") as f:
-            data = json.load(f)
-
-
-        for waypoint in data["waypoints"]:
-            air = waypoint["airport_id"]
-            final += fetch_metar_new(air)
-            final += get_formatted_taf(air)
-
-        final += fetch_sigmet_h()
-        final += read_pirep('pireps.json')
-    except:
-        final = "give me the breifing of the weather in KLAX airport"
-
+_llm = None
+_llm_lock = threading.Lock()
+
+def llm_client():
+    # One client per process, reusing its connection pool. groq (and the
+    # pydantic/httpx stack under it) is only imported for the first summary.
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            from dotenv import load_dotenv
+            from groq import Groq
+            load_dotenv()
+            _llm = Groq(api_key=os.getenv("GROQ_API"))
+        return _llm
+
+def ask_llm(final):
     try: 
-        api = os.getenv("GROQ_API")
-        client = Groq(api_key=api)
-        completion = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[{
-                "role":"system", "content": "You brief pilots on the weather and give them the import details of their flight plan DO NOT SAY ANYTHING EXTRA"
-            },
-            {
-                "role":"user", "content": final
-            }],
-            temperature=1,
-            max_completion_tokens=8192,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
+        client = llm_client()
+        with span("llm"):
+            completion = client.chat.completions.create(
+                model="meta-llama/llama-4-scout-17b-16e-instruct",
+                messages=[{
+                    "role":"system", "content": "You brief pilots on the weather and give them the import details of their flight plan DO NOT SAY ANYTHING EXTRA"
+                },
+                {
+                    "role":"user", "content": final
+                }],
+                temperature=1,
+                max_completion_tokens=8192,
+                top_p=1,
+                stream=False,
+                stop=None,
+            )
 
         
 
@@ -498,7 +479,29 @@ def summary():
         return 'there was an error'
 
 def warning_level(airport_id):
-    raw_metar = parse_metar(airport_id, 1) 
+    metars = fetch_metar(airport_id)
+    if not metars:
+        return 5
+    return int(flight_categories(metars[:1])[2][0])
+
+def flight_categories(metars):
+    # MetarRecords (one per station) -> arrays of ceiling
+    # (ft), visibility (SM) and category (1 VFR .. 4 LIFR, 5 unknown), using
+    # the same limits as warning_level_from_raw. No network access.
+    n = len(metars)
+    visibility = np.array([visibility_sm(m.visib) for m in metars], dtype=float)
+
+    layers = [(i, base) for i, m in enumerate(metars) for cover, base in m.clouds
+              if cover in CEILING_COVERS and base is not None]
+    ceiling = np.full(n, np.inf)
+    if layers:
+        idx, base = np.array(layers, dtype=float).T
+        np.minimum.at(ceiling, idx.astype(int), base)
+
+    ceiling = np.where(np.isinf(ceiling), np.nan, ceiling)
+    return ceiling, visibility, flight_category(ceiling, visibility)
+
+def warning_level_from_raw(raw_metar):
     visibility = None
     ceiling = None
     ceiling_layers = []
@@ -608,57 +611,61 @@ weather_code_descriptions = {
 
 severe_weather_codes = {3,81,82, 86, 95, 96, 99,45, 48,51, 53, 55,56, 57,61, 63, 65,66, 67,71, 73, 75,77,80,85}
 
+# Thunderstorms build well into cruise levels; the rest of open-meteo's
+# codes describe surface weather.
+convective_weather_codes = {95, 96, 99}
 
-def summarize_pirep(raw):
-    if not raw or not isinstance(raw, str):
-        return "No PIREP information available."
-
-    summary = []
-
-    if re.search(r"\bUUA\b", raw):
-        summary.append("⚠️ Urgent PIREP issued – hazardous conditions reported")
-
-    fl_match = re.search(r"/FL(\d+)", raw)
-    if fl_match:
-        alt = int(fl_match.group(1)) * 100
-        summary.append(f"Altitude: {alt} ft")
-
-    tp_match = re.search(r"/TP\s*([A-Z0-9\-]+)", raw)
-    if tp_match:
-        summary.append(f"Aircraft type: {tp_match.group(1)}")
-
-    tops = re.search(r"TOPS\s+(\d+)", raw)
-    bases = re.search(r"BASES\s+(\d+)", raw)
-    if tops and bases:
-        summary.append(f"Cloud tops at {int(tops.group(1)) * 100} ft, bases at {int(bases.group(1)) * 100} ft")
-    elif tops:
-        summary.append(f"Cloud tops at {int(tops.group(1)) * 100} ft")
-    elif bases:
-        summary.append(f"Cloud bases at {int(bases.group(1)) * 100} ft")
+# Hazards further than this outside the planned altitudes are dropped.
+ALTITUDE_MARGIN_FT = 2000
+# Legs planned entirely above this only care about convective route weather.
+SURFACE_WEATHER_TOP_FT = 10000
 
-    ov_match = re.search(r"/OV\s+([A-Z0-9]+)", raw)
-    if ov_match:
-        summary.append(f"Reported over: {ov_match.group(1)}")
-
-    tm_match = re.search(r"/TM\s+(\d{4})", raw)
-    if tm_match:
-        summary.append(f"Report time: {tm_match.group(1)} Z")
-
-    tb_match = re.search(r"/TB\s+(.+?)(?=\s*/|$)", raw)
-    if tb_match:
-        summary.append(f"Turbulence reported: {tb_match.group(1).strip()}")
+def parse_altitude(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
 
-    ic_match = re.search(r"/IC\s+(.+?)(?=\s*/|$)", raw)
-    if ic_match:
-        summary.append(f"Icing reported: {ic_match.group(1).strip()}")
+def altitude_band(*altitudes, margin_ft=ALTITUDE_MARGIN_FT):
+    alts = [a for a in map(parse_altitude, altitudes) if a is not None]
+    if not alts:
+        return None
+    return (max(0, min(alts) - margin_ft), max(alts) + margin_ft)
+
+def in_altitude_band(band, low, high):
+    # low/high of None mean the report is unbounded on that side.
+    if band is None:
+        return True
+    low = 0 if low is None else low
+    high = float('inf') if high is None else high
+    return low <= band[1] and high >= band[0]
+
+def pireps_in_band(pireps, band):
+    # A report is kept if its altitude or any turbulence/icing layer it
+    # describes overlaps the band. Reports without a usable level (DURC,
+    # UNKN, ...) are kept.
+    if band is None:
+        return pireps
+    return [p for p in pireps
+            if not p.layers() or any(in_altitude_band(band, low, high) for low, high in p.layers())]
+
+def sigmets_in_band(advisories, band):
+    return [a for a in advisories if in_altitude_band(band, a.get("alt_low"), a.get("alt_high"))]
+
+def route_weather_in_band(warnings, band):
+    if band is None or band[0] <= SURFACE_WEATHER_TOP_FT:
+        return warnings
+    return [w for w in warnings if w.get("code") in convective_weather_codes]
 
-    wx_match = re.search(r"/WX\s+([\w\s\-]+)", raw)
-    if wx_match:
-        summary.append(f"Weather: {wx_match.group(1).strip()}")
 
-    return "; ".join(summary) if summary else "Unable to summarize PIREP."
+def summarize_pirep(raw):
+    if not raw or not isinstance(raw, str):
+        return "No PIREP information available."
+    return decode_pirep(raw).summary()
 
 def interpolate_points(start, end, interval_nm=50):
+    # geopy is imported on the first leg rather than at startup.
+    from geopy.distance import geodesic
     total_distance = geodesic(start, end).nm
     steps = max(2, int(total_distance // interval_nm) + 1)
     lats = np.linspace(start[0], end[0], steps)
@@ -668,10 +675,10 @@ def interpolate_points(start, end, interval_nm=50):
 def find_weather_warnings_between_airports(airport1_json, airport2_json, threshold_nm=50, output_filename="pireps.json"):
 
     try:
-        lat1 = airport1_json["weather"][0]["metar"][0]["lat"]
-        lon1 = airport1_json["weather"][0]["metar"][0]["lon"]
-        lat2 = airport2_json["weather"][0]["metar"][0]["lat"]
-        lon2 = airport2_json["weather"][0]["metar"][0]["lon"]
+        lat1 = airport1_json["weather"][0]["metar"][0].lat
+        lon1 = airport1_json["weather"][0]["metar"][0].lon
+        lat2 = airport2_json["weather"][0]["metar"][0].lat
+        lon2 = airport2_json["weather"][0]["metar"][0].lon
     except Exception as e:
         print("Error parsing airport coordinates:", e)
         return []
@@ -681,39 +688,8 @@ def find_weather_warnings_between_airports(airport1_json, airport2_json, thresho
     while(x==False):
         time.sleep(1)
     
-    # Combine PIREPs from both airports
-    pireps = []
-    if "pirep" in airport1_json["weather"][0]:
-        pireps.extend(airport1_json["weather"][0]["pirep"])
-    if "pirep" in airport2_json["weather"][0]:
-        pireps.extend(airport2_json["weather"][0]["pirep"])
-
-    seen = set()
-    warnings = []
-
-    for pt in route_points:
-        for pirep in pireps:
-            try:
-                pirep_lat = pirep["lat"]
-                pirep_lon = pirep["lon"]
-                distance = geodesic(pt, (pirep_lat, pirep_lon)).nm
-                if distance <= threshold_nm:
-                    unique_key = (
-                        round(pt[0], 4), round(pt[1], 4),
-                        round(pirep_lat, 4), round(pirep_lon, 4),
-                        pirep.get("rawOb", "")
-                    )
-                    if unique_key not in seen:
-                        seen.add(unique_key)
-                        warnings.append({
-                            "distance_to_pirep_nm": round(distance, 1),
-                            "pirep_raw": pirep.get("rawOb", "No raw PIREP available"),
-                            "summary": summarize_pirep(pirep.get("rawOb", "")),
-                            "lat": pirep_lat, 
-                            "lon": pirep_lon
-                        })
-            except:
-                continue
+    pireps = fetch_pirep_corridor(route_points, threshold_nm)
+    warnings = pireps_near_route(route_points, pireps, threshold_nm)
 
     output_data = {"pireps": warnings}
     
@@ -725,25 +701,109 @@ def find_weather_warnings_between_airports(airport1_json, airport2_json, thresho
     print(f"✅ Saved {len(warnings)} unique weather warning points to {output_filename}")
     return True
 
+# PIREPs for a route are fetched with one bbox query around all of its route
+# samples. Boxes are snapped outward to PIREP_BBOX_GRID degrees and results
+# reused within a PIREP_WINDOW time bucket, so nearby briefings share them.
+PIREP_AGE_HOURS = 2
+PIREP_WINDOW = 300
+PIREP_BBOX_GRID = 0.5
+
+_pirep_lock = threading.Lock()
+_pirep_cache = {}
+
+def route_bbox(route_points, pad_nm=0, grid=PIREP_BBOX_GRID):
+    pts = np.asarray(route_points, dtype=float)
+    pad_lat = pad_nm / 60.0
+    pad_lon = pad_lat / max(np.cos(np.radians(np.abs(pts[:, 0]).max())), 0.1)
+    lat0, lon0 = pts.min(axis=0) - (pad_lat, pad_lon)
+    lat1, lon1 = pts.max(axis=0) + (pad_lat, pad_lon)
+    snap_down = lambda v: float(np.floor(v / grid) * grid)
+    snap_up = lambda v: float(np.ceil(v / grid) * grid)
+    return (snap_down(lat0), snap_down(lon0), snap_up(lat1), snap_up(lon1))
+
+def fetch_pirep_corridor(route_points, threshold_nm=50):
+    # A briefing with no legs (one airport, or KSFO,KSFO) has no corridor.
+    if not len(route_points):
+        return []
+    bbox = route_bbox(route_points, threshold_nm)
+    key = (bbox, int(time.time() // PIREP_WINDOW))
+    with _pirep_lock:
+        if key in _pirep_cache:
+            return _pirep_cache[key]
+        # Drop buckets from earlier windows.
+        for old in [k for k in _pirep_cache if k[1] != key[1]]:
+            del _pirep_cache[old]
+
+    params = {
+        "bbox": ",".join(f"{v:g}" for v in bbox),
+        "age": PIREP_AGE_HOURS,
+        "format": "json",
+    }
+    try:
+        feed = get_json("https://aviationweather.gov/api/data/pirep", params=params)
+        with span("parse", "pireps"):
+            pireps = decode_pireps(feed or [])
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print("PIREP corridor query failed:", e)
+        return []
+    with _pirep_lock:
+        _pirep_cache[key] = pireps
+    return pireps
+
+def pireps_near_route(route_points, pireps, threshold_nm=50):
+    # pireps are decoded PirepReport records (see fetch_pirep_corridor).
+    if not pireps or not len(route_points):
+        return []
+
+    pts = np.asarray(route_points, dtype=float)
+    plat = np.array([p.lat for p in pireps], dtype=float)
+    plon = np.array([p.lon for p in pireps], dtype=float)
+    # (route points x pireps) distances, closest route point per report.
+    distances = haversine_nm(pts[:, :1], pts[:, 1:], plat[None, :], plon[None, :]).min(axis=0)
+
+    seen = set()
+    warnings = []
+    for idx in np.flatnonzero(distances <= threshold_nm):
+        pirep = pireps[idx]
+        unique_key = (round(pirep.lat, 4), round(pirep.lon, 4), pirep.raw)
+        if unique_key in seen:
+            continue
+        seen.add(unique_key)
+        warnings.append({
+            "distance_to_pirep_nm": round(float(distances[idx]), 1),
+            "pirep_raw": pirep.raw or "No raw PIREP available",
+            "summary": pirep.summary(),
+            "lat": pirep.lat,
+            "lon": pirep.lon
+        })
+    return warnings
+
 def fetch_weather_for_route_points(route_points, output_filename="route_weather.json"):
-    import requests
-    import time
+    weather_data = route_weather(route_points)
+
+    output_data = {"warnings": weather_data}
 
+    with open(output_filename, "w") as f:
+        json.dump(output_data, f, indent=2)
+
+    print(f"✅ Saved weather data for {len(route_points)} points to {output_filename}")
+    return True
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+OPEN_METEO_DELAY = 0.5
+
+def route_weather(route_points):
     weather_data = []
 
     for i, (lat, lon) in enumerate(route_points):
+        sent = upstream_sent()
         try:
-            response = requests.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params={
-                    "latitude": lat,
-                    "longitude": lon,
-                    "current_weather": True
-                },
-                timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
+            params = {
+                "latitude": lat,
+                "longitude": lon,
+                "current_weather": True
+            }
+            data = get_json(OPEN_METEO_URL, params=params, timeout=10)
             weather = data.get("current_weather", {})
             code = weather.get("weathercode")
             description = weather_code_descriptions.get(code, "Unknown weather code")
@@ -761,7 +821,6 @@ def fetch_weather_for_route_points(route_points, output_filename="route_weather.
                     "is_severe": is_severe
                 
             })
-            time.sleep(0.5)  
         except Exception as e:
             weather_data.append({
                 "point_index": i,
@@ -769,38 +828,76 @@ def fetch_weather_for_route_points(route_points, output_filename="route_weather.
                 "lon": lon,
                 "error": str(e)
             })
+        if upstream_sent() != sent:
+            # Rate limit every point that actually went to open-meteo, failed
+            # or not (each one does under upstream.revalidating()).
+            with span("rate_limit", "open-meteo"):
+                time.sleep(OPEN_METEO_DELAY)
 
-    output_data = {"warnings": weather_data}
+    return weather_data
 
-    with open(output_filename, "w") as f:
-        json.dump(output_data, f, indent=2)
 
-    print(f"✅ Saved weather data for {len(route_points)} points to {output_filename}")
-    return True
+def station_url(product, airport_id):
+    return f"https://aviationweather.gov/api/data/{product}?ids={airport_id}&format=json"
 
+# Every METAR/TAF that comes back from the real aviationweather.gov (not
+# fixtures, the mock server or synthetic data) goes into the history store.
+observe(archive_response)
 
 def fetch_metar(airport_id):
-    url = f"https://aviationweather.gov/api/data/metar?ids={airport_id}&format=json"
-    response = requests.get(url)
-    return response.json()
+    return get_json(station_url("metar", airport_id), decode=metar_records)
 
 def fetch_taf(airport_id):
-    url = f"https://aviationweather.gov/api/data/taf?ids={airport_id}&format=json"
-    response = requests.get(url)
-    
-    return response.json()
+    return get_json(station_url("taf", airport_id), decode=taf_records)
+
+def product_age(product, airport_id):
+    # Age in seconds of the copy fetch_<product> would return, or None.
+    return upstream_age(station_url(product, airport_id))
+
+STATION_DECODERS = {"metar": metar_records, "taf": taf_records}
+STATION_BATCH = 100
+
+def _by_station(entries):
+    stations = {}
+    for entry in entries or []:
+        stations.setdefault(entry.get("icaoId"), []).append(entry)
+    return stations
+
+def fetch_stations(airport_ids, products=("metar", "taf")):
+    # One request per product for every station not already cached (up to
+    # STATION_BATCH ids each), joined back by icaoId into the per-station
+    # entries fetch_metar / fetch_taf read. Duplicates are asked for once.
+    stations = list(dict.fromkeys(airport_ids))
+    fetched = 0
+    for product in products:
+        for start in range(0, len(stations), STATION_BATCH):
+            chunk = stations[start:start + STATION_BATCH]
+            fetched += prefetch_batch(
+                {icao: station_url(product, icao) for icao in chunk},
+                lambda ids, product=product: station_url(product, ",".join(ids)),
+                _by_station,
+                decode=STATION_DECODERS[product],
+            )
+    return fetched
 
 def fetch_pirep(airport_id):
     url = f"https://aviationweather.gov/api/data/pirep?ids={airport_id}&format=json"
-    response1 = requests.get(url)
-    response1=response1.json()
-    return response1
+    return get_json(url)
 
 
 def lat_log(airport_id):
+    # From the local airport database when there is one: malformed codes
+    # are rejected (with suggestions) without a network call, and only ICAO
+    # codes the database lacks go to the airport API.
+    index = airport_index()
+    if index is not None:
+        airport = index.lookup(index.resolve(airport_id))
+        if airport is not None:
+            return [airport.lat, airport.lon]
     url = f"https://aviationweather.gov/api/data/airport?ids={airport_id}&format=json"
-    response = requests.get(url)
-    response=response.json()
+    response = get_json(url)
+    if not response:
+        raise ValueError(f"Unknown airport '{airport_id}'")
     coords = [response[0]['lat'],response[0]['lon']]
     return coords
 
@@ -812,6 +909,9 @@ def generate_quick(file_path):
         data = json.load(f)
     
     waypoints = data.get("waypoints", [])
+    # One batched METAR and TAF request for the whole route; the per-waypoint
+    # fetch_metar/fetch_taf below are cache hits.
+    fetch_stations([w.get("airport_id") for w in waypoints])
     
     final_json_list=[]
     for waypoint in waypoints:
@@ -819,12 +919,10 @@ def generate_quick(file_path):
         altitude=waypoint.get("altitude")
         output_airport_data={}
         weather_data = []
-        pirep_dat=[]
         print(f"📍 Airport: {airport_id}]")
     
         metar = fetch_metar(airport_id)
         taf = fetch_taf(airport_id)
-        pirep = fetch_pirep(airport_id)
         lat,log=lat_log(airport_id)
 
         weather_data.append({
@@ -834,7 +932,6 @@ def generate_quick(file_path):
             "log":log,
             "metar": metar,
             "taf": taf,
-            "pirep": pirep,
         })
         print("weather collected")
         
@@ -846,53 +943,6 @@ def generate_quick(file_path):
     x=find_weather_warnings_between_airports(final_json_list[0],final_json_list[-1])
     return x
 
-abbreviations = {
-    "ABV": "above",
-    "CNL": "cancelled",
-    "CTA": "control area",
-    "FCST": "forecast",
-    "FIR": "Flight Information Region",
-    "FL": "flight level",
-    "FT": "feet",
-    "INTSF": "intensifying",
-    "KT": "knots",
-    "KMH": "kilometres per hour",
-    "M": "meters",
-    "MOV": "moving",
-    "NC": "no change",
-    "NM": "nautical miles",
-    "OBS": "observed",
-    "SFC": "surface",
-    "STNR": "stationary",
-    "TOP": "top of cloud",
-    "WI": "within",
-    "WKN": "weakening",
-    "Z": "UTC",
-}
-
-weather_codes = {
-    "AREA TS": "Area-wide thunderstorms",
-    "LINE TS": "Thunderstorm line",
-    "EMBD TS": "Embedded thunderstorms",
-    "TDO": "Tornado",
-    "FC": "Funnel Cloud",
-    "WTSPT": "Waterspout",
-    "HVY GR": "Heavy hail",
-    "OBSC TS": "Obscured thunderstorms",
-    "EMBD TSGR": "Embedded thunderstorms with hail",
-    "FRQ TS": "Frequent thunderstorms",
-    "SQL TS": "Squall line thunderstorms",
-    "FRQ TSGR": "Frequent thunderstorms with hail",
-    "SQL TSGR": "Squall line thunderstorms with hail",
-    "SEV TURB": "Severe turbulence",
-    "SEV ICE": "Severe icing",
-    "SEV ICE (FZRA)": "Severe icing due to freezing rain",
-    "SEV MTW": "Severe mountain wave",
-    "HVY DS": "Heavy duststorm",
-    "HVY SS": "Heavy sandstorm",
-    "RDOACT CLD": "Radioactive cloud"
-}
-
 def fetch_sigmet(airport_id, altitude=None):
 
     base_url = "https://aviationweather.gov/api/data/airsigmet"
@@ -904,19 +954,12 @@ def fetch_sigmet(airport_id, altitude=None):
         params["level"] = flight_level
 
     try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-
-        try:
-            print(response.json()[0]['rawAirSigmet'])
-            return response.json()
-            ##print(response.json())
-        except ValueError:
-            return {
-                "error": "Response is not valid JSON",
-                "raw": response.text
-            }
-
+        return get_json(base_url, params=params, timeout=10)
+    except ValueError as e:
+        return {
+            "error": "Response is not valid JSON",
+            "details": str(e)
+        }
     except requests.exceptions.RequestException as e:
         return {
             "error": "Request failed",
@@ -969,28 +1012,148 @@ def parse_sigmet(text):
     return "\n".join(output_lines)
 
 
+# Every code from both tables in one alternation, longest first so that
+# "SEV ICE (FZRA)" wins over "SEV ICE" and "SEV". Times and flight levels
+# are expanded in the same pass.
+_sigmet_codes = {**abbreviations, **weather_codes}
+_sigmet_pattern = re.compile(
+    r"(?<![\w/])(?P<code>" + "|".join(re.escape(k) for k in sorted(_sigmet_codes, key=len, reverse=True)) + r")(?![\w/])"
+    r"|\b(?P<time>\d{4})Z\b"
+    r"|\bFL(?P<fl>\d{3})\b"
+)
+
+def _expand_sigmet_code(match):
+    if match.group("code"):
+        return _sigmet_codes[match.group("code")]
+    if match.group("time"):
+        return f"{match.group('time')} UTC"
+    return f"flight level {match.group('fl')} ({int(match.group('fl')) * 100} ft)"
+
+def translate_sigmet(text):
+    return _sigmet_pattern.sub(_expand_sigmet_code, text)
+
+_sigmet_translations = {}
+
+def translate_advisory(advisory_id, text):
+    # Advisories keep their id across feed refreshes; only re-translate
+    # when the text for that id actually changed (e.g. an amendment).
+    cached = _sigmet_translations.get(advisory_id)
+    if cached is not None and cached[0] == text:
+        return cached[1]
+    english = translate_sigmet(text)
+    if advisory_id is not None:
+        _sigmet_translations[advisory_id] = (text, english)
+    return english
+
+
 def sigmet_json_generator(ap):
     with open(ap) as airports:
         ap = json.load(airports)
 
-    sigmet=[]
-    for a in ap['waypoints']:
-        print(a['airport_id'])
-        x=fetch_sigmet(a['airport_id'])
-        coords=x[0]['coords']
-        severity=x[0]['severity']
-        print(coords)
-        sigmet_english=parse_sigmet(x[0]['rawAirSigmet'])
-        print(sigmet_english)
-        
+    sigmet = collect_sigmets(ap['waypoints'])
 
-        sigmet.append({
-            "sigmet_eng": sigmet_english,
+    output_data = {"sigmet": sigmet}
+
+    with open("sigmets_new.json", "w") as f:
+        json.dump(output_data, f, indent=2)
+
+def collect_sigmets(waypoints):
+    # Sampled the same way as the briefing's legs, so both paths keep the
+    # same advisories.
+    positions = [(a['lat'], a['lon']) for a in waypoints]
+    routes = [interpolate_points(a, b) for a, b in zip(positions, positions[1:]) if a != b]
+    band = altitude_band(*[a.get('altitude') for a in waypoints])
+    return sigmets_near_route(sigmets_in_band(fetch_sigmet_feed(), band), routes or [[p] for p in positions])
+
+
+# The AIR/SIGMET feed is national and identical for every waypoint, so it is
+# downloaded at most once per SIGMET_FEED_TTL (see upstream.get_json) and
+# only re-parsed when the feed timestamp moves.
+SIGMET_FEED_TTL = 60
+SIGMET_MARGIN_NM = 25
+
+_sigmet_feed_lock = threading.Lock()
+_sigmet_feed = {"stamp": None, "advisories": []}
+
+def fetch_sigmet_feed():
+    try:
+        feed = get_json("https://aviationweather.gov/api/data/airsigmet",
+                        params={"format": "json"}, ttl=SIGMET_FEED_TTL)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print("SIGMET feed unavailable:", e)
+        return _sigmet_feed["advisories"]
+
+    stamp = (len(feed), max((str(x.get("receiptTime", "")) for x in feed), default=""))
+    with _sigmet_feed_lock:
+        if stamp != _sigmet_feed["stamp"]:
+            with span("parse", "sigmets"):
+                _sigmet_feed["advisories"] = parse_advisories(feed)
+            _sigmet_feed["stamp"] = stamp
+        return _sigmet_feed["advisories"]
+
+def parse_advisories(feed):
+    advisories = []
+    for x in feed:
+        coords = x.get('coords') or []
+        if len(coords) < 3:
+            continue
+        lats = [c['lat'] for c in coords]
+        lons = [c['lon'] for c in coords]
+        advisories.append({
+            "id": x.get('airSigmetId'),
+            "type": x.get('airSigmetType'),
+            "hazard": x.get('hazard'),
+            "severity": x.get('severity'),
+            "alt_low": x.get('altitudeLow1'),
+            "alt_high": x.get('altitudeHi1') or x.get('altitudeHi2'),
+            "valid_to": x.get('validTimeTo'),
+            "bbox": (min(lats), min(lons), max(lats), max(lons)),
             "coords": coords,
-            "severity":severity
-            })
+            "sigmet_eng": translate_advisory(x.get('airSigmetId'), x.get('rawAirSigmet', '')),
+        })
 
-        output_data = {"sigmet": sigmet}
+    current = {a["id"] for a in advisories}
+    for advisory_id in [k for k in _sigmet_translations if k not in current]:
+        del _sigmet_translations[advisory_id]
+    return advisories
+
+def _route_segments(routes):
+    # Every route is a list of (lat, lon) samples; a lone point (a briefing
+    # for one airport) is a zero-length segment.
+    starts, ends = [], []
+    for route in routes:
+        pts = np.asarray(route, dtype=float).reshape(-1, 2)
+        if len(pts) == 1:
+            pts = np.repeat(pts, 2, axis=0)
+        starts.append(pts[:-1])
+        ends.append(pts[1:])
+    return np.concatenate(starts), np.concatenate(ends)
+
+def sigmets_near_route(advisories, routes, margin_nm=SIGMET_MARGIN_NM):
+    # Advisories within margin_nm of any segment between consecutive route
+    # samples, so a narrow one crossing a leg between samples still counts.
+    routes = [r for r in routes if len(r)]
+    if not advisories or not routes:
+        return []
 
-        with open("sigmets_new.json", "w") as f:
-            json.dump(output_data, f, indent=2)
+    starts, ends = _route_segments(routes)
+    lat_lo, lat_hi = np.minimum(starts[:, 0], ends[:, 0]), np.maximum(starts[:, 0], ends[:, 0])
+    lon_lo, lon_hi = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    # ~1 degree of latitude is 60 nm; pad bounding boxes by the margin
+    # (generously for longitude) before doing any polygon maths.
+    pad = margin_nm / 60.0
+    lon_pad = pad / max(np.cos(np.radians(max(np.abs(lat_lo).max(), np.abs(lat_hi).max()))), 0.1)
+
+    relevant = []
+    for adv in advisories:
+        lat0, lon0, lat1, lon1 = adv["bbox"]
+        near_box = ((lat_hi >= lat0 - pad) & (lat_lo <= lat1 + pad) &
+                    (lon_hi >= lon0 - lon_pad) & (lon_lo <= lon1 + lon_pad))
+        if not near_box.any():
+            continue
+        if points_in_polygon(starts[near_box, 0], starts[near_box, 1], adv["coords"]).any():
+            relevant.append(adv)
+            continue
+        if segments_to_polygon_nm(starts[near_box], ends[near_box], adv["coords"]).min() <= margin_nm:
+            relevant.append(adv)
+    return relevant
@@ -0,0 +1,372 @@
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from records import CEILING_COVERS, flight_category, visibility_sm
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Append-only archive of every METAR and TAF received from the real
+# aviationweather.gov (helper registers archive_response as an upstream
+# observer, so fixtures, the mock server and synthetic data stay out), for
+# trends ("ceiling dropped 3 times in the last 6 h") and TAF verification
+# without another upstream call. One raw little-endian file per column,
+# partitioned by UTC day and read back with np.memmap:
+#
+#   history/metar/2026-10-19/station.bin, time.bin, ceiling.bin, ...
+#   history/taf/2026-10-19/station.bin, issued.bin, start.bin, ...
+#
+#   AEROBRIEF_HISTORY_DIR   where to keep it (default ./history)
+#   AEROBRIEF_HISTORY=0     do not record anything
+HISTORY_DIR = os.environ.get("AEROBRIEF_HISTORY_DIR", "history")
+HISTORY_ENABLED = os.environ.get("AEROBRIEF_HISTORY", "1") != "0"
+HISTORY_DAYS = 30
+TREND_HOURS = 6
+VERIFY_HOURS = 24
+
+OBSERVATION_COLUMNS = {
+    "station": "S4",
+    "time": "<i8",
+    "ceiling": "<f4",
+    "visibility": "<f4",
+    "category": "i1",
+    "wind_dir": "<i2",
+    "wind_speed": "<i2",
+    "gust": "<i2",
+    "temp": "<f4",
+    "altim": "<f4",
+}
+FORECAST_COLUMNS = {
+    "station": "S4",
+    "issued": "<i8",
+    "start": "<i8",
+    "end": "<i8",
+    "change": "S5",
+    "probability": "i1",
+    "ceiling": "<f4",
+    "visibility": "<f4",
+    "category": "i1",
+}
+CATEGORY_NAMES = {1: "VFR", 2: "MVFR", 3: "IFR", 4: "LIFR", 5: "unknown"}
+
+_lock = threading.Lock()
+# Last time written per (product, station), so this process does not append
+# a report it already appended. Processes sharing HISTORY_DIR (app, prefetch,
+# batch workers, API) can still write the same report twice; queries drop
+# those duplicates.
+_written = {}
+
+
+def _epoch(value):
+    # obsTime-style epoch seconds, or "2026-10-19 05:00:00" / ISO text.
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _partition(product, day):
+    return os.path.join(HISTORY_DIR, product, day)
+
+
+def _day(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _append(product, columns, rows, day):
+    path = _partition(product, day)
+    new_partition = not os.path.isdir(path)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "a") as lock:
+        # Columns are appended together under a file lock so processes
+        # sharing HISTORY_DIR cannot interleave rows.
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        for name, dtype in columns.items():
+            with open(os.path.join(path, f"{name}.bin"), "ab") as f:
+                f.write(np.asarray(rows[name], dtype=dtype).tobytes())
+    if new_partition:
+        prune()
+
+
+def _write(product, columns, rows, time_column):
+    by_day = {}
+    for i, t in enumerate(rows[time_column]):
+        by_day.setdefault(_day(int(t)), []).append(i)
+    for day, idx in by_day.items():
+        _append(product, columns, {name: [rows[name][i] for i in idx] for name in columns}, day)
+
+
+def archive_response(url, data):
+    # upstream observer: decoded METAR/TAF records from a live fetch.
+    path = url.split("?", 1)[0]
+    if path.endswith("/metar"):
+        record_observations(data)
+    elif path.endswith("/taf"):
+        record_forecasts(data)
+
+
+def record_observations(metars):
+    # MetarRecords -> observation rows. Never raises: the archive must not
+    # break a fetch.
+    if not HISTORY_ENABLED or not metars:
+        return 0
+    try:
+        with _lock:
+            fresh = []
+            for m in metars:
+                t = _epoch(m.obs_time) or _epoch(m.report_time)
+                if not m.icao or t is None or _written.get(("metar", m.icao), -1) >= t:
+                    continue
+                _written[("metar", m.icao)] = t
+                fresh.append((m, t))
+            if not fresh:
+                return 0
+            ceiling = np.array([min((b for c, b in m.clouds if c in CEILING_COVERS and b is not None), default=np.nan)
+                                for m, _ in fresh], dtype=float)
+            visibility = np.array([visibility_sm(m.visib) for m, _ in fresh], dtype=float)
+            rows = {
+                "station": [m.icao.encode() for m, _ in fresh],
+                "time": [t for _, t in fresh],
+                "ceiling": ceiling,
+                "visibility": visibility,
+                "category": flight_category(ceiling, visibility),
+                "wind_dir": [m.wdir if isinstance(m.wdir, int) else -1 for m, _ in fresh],
+                "wind_speed": [m.wspd if m.wspd is not None else -1 for m, _ in fresh],
+                "gust": [m.wgst if m.wgst is not None else -1 for m, _ in fresh],
+                "temp": [m.temp if m.temp is not None else np.nan for m, _ in fresh],
+                "altim": [m.altim if m.altim is not None else np.nan for m, _ in fresh],
+            }
+            _write("metar", OBSERVATION_COLUMNS, rows, "time")
+            return len(fresh)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print("History write failed:", e)
+        return 0
+
+
+def record_forecasts(tafs):
+    # TafRecords -> one row per forecast period.
+    if not HISTORY_ENABLED or not tafs:
+        return 0
+    try:
+        with _lock:
+            periods = []
+            for taf in tafs:
+                issued = _epoch(taf.issue_time)
+                if not taf.icao or issued is None or _written.get(("taf", taf.icao), -1) >= issued:
+                    continue
+                _written[("taf", taf.icao)] = issued
+                periods += [(taf.icao, issued) + p for p in taf.periods if p[0] is not None and p[1] is not None]
+            if not periods:
+                return 0
+            ceiling = np.array([p[7] if p[7] is not None else np.nan for p in periods], dtype=float)
+            visibility = np.array([visibility_sm(p[6]) for p in periods], dtype=float)
+            rows = {
+                "station": [p[0].encode() for p in periods],
+                "issued": [p[1] for p in periods],
+                "start": [p[2] for p in periods],
+                "end": [p[3] for p in periods],
+                "change": [(p[4] or "").encode()[:5] for p in periods],
+                "probability": [p[5] or 0 for p in periods],
+                "ceiling": ceiling,
+                "visibility": visibility,
+                "category": flight_category(ceiling, visibility),
+            }
+            _write("taf", FORECAST_COLUMNS, rows, "issued")
+            return len(periods)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print("History write failed:", e)
+        return 0
+
+
+def _read_partition(path, columns):
+    sizes = {}
+    for name, dtype in columns.items():
+        file = os.path.join(path, f"{name}.bin")
+        sizes[name] = os.path.getsize(file) // np.dtype(dtype).itemsize if os.path.exists(file) else 0
+    # A write cut short leaves some columns longer; ignore the torn tail.
+    rows = min(sizes.values())
+    if rows == 0:
+        return None
+    return {name: np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode="r", shape=(rows,))
+            for name, dtype in columns.items()}
+
+
+def _query(product, columns, time_column, station, since, until):
+    station = station.encode()
+    day = datetime.fromtimestamp(since, timezone.utc).date()
+    last = datetime.fromtimestamp(until, timezone.utc).date()
+    parts = []
+    while day <= last:
+        data = _read_partition(_partition(product, day.isoformat()), columns)
+        day += timedelta(days=1)
+        if data is None:
+            continue
+        t = data[time_column]
+        mask = (data["station"] == station) & (t >= since) & (t <= until)
+        if mask.any():
+            parts.append({name: np.asarray(col[mask]) for name, col in data.items()})
+    if not parts:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in columns.items()}
+    result = {name: np.concatenate([p[name] for p in parts]) for name in columns}
+    order = np.argsort(result[time_column], kind="stable")
+    return {name: col[order] for name, col in result.items()}
+
+
+def observations(station, since, until=None):
+    # Column arrays for one station's observations in [since, until] (epoch
+    # seconds), oldest first, one row per report time.
+    until = time.time() if until is None else until
+    obs = _query("metar", OBSERVATION_COLUMNS, "time", station, since, until)
+    if len(obs["time"]):
+        _, first = np.unique(obs["time"], return_index=True)
+        obs = {name: col[first] for name, col in obs.items()}
+    return obs
+
+
+def forecasts(station, since, until=None):
+    # Forecast periods from TAFs issued in [since, until], by issue time,
+    # each period once.
+    until = time.time() if until is None else until
+    fc = _query("taf", FORECAST_COLUMNS, "issued", station, since, until)
+    if len(fc["issued"]):
+        periods = np.rec.fromarrays([fc["issued"], fc["start"], fc["end"], fc["change"]])
+        _, first = np.unique(periods, return_index=True)
+        fc = {name: col[first] for name, col in fc.items()}
+    return fc
+
+
+def _describe(values, unit, fmt="{:.0f}"):
+    finite = values[~np.isnan(values)]
+    if not len(finite):
+        return None
+    drops = int(np.sum(np.diff(np.where(np.isnan(values), np.inf, values)) < 0))
+    first, last = values[0], values[-1]
+    show = lambda v: "none" if np.isnan(v) else fmt.format(v) + unit
+    return f"{show(first)} → {show(last)} (dropped {drops} time{'s' if drops != 1 else ''})"
+
+
+def station_trend(station, hours=TREND_HOURS, now=None):
+    # One line for the briefing and the LLM prompt, or None without at
+    # least two observations in the window.
+    now = time.time() if now is None else now
+    obs = observations(station, now - hours * 3600, now)
+    if len(obs["time"]) < 2:
+        return None
+    parts = []
+    ceiling = _describe(obs["ceiling"].astype(float), " ft")
+    if ceiling:
+        parts.append(f"ceiling {ceiling}")
+    visibility = _describe(obs["visibility"].astype(float), " SM", "{:g}")
+    if visibility:
+        parts.append(f"visibility {visibility}")
+    names = [CATEGORY_NAMES[int(c)] for c in obs["category"]]
+    changes = sum(1 for a, b in zip(names, names[1:]) if a != b)
+    parts.append(f"category {names[0]} → {names[-1]}" + (f" ({changes} change{'s' if changes != 1 else ''})" if changes else ""))
+    return f"{station} trend, last {hours} h ({len(obs['time'])} reports): " + "; ".join(parts)
+
+
+def taf_verification(station, hours=VERIFY_HOURS, now=None):
+    # Compare each observation in the window with the prevailing (FM/base)
+    # period of the latest TAF issued before it.
+    now = time.time() if now is None else now
+    obs = observations(station, now - hours * 3600, now)
+    fc = forecasts(station, now - (hours + 30) * 3600, now)
+    prevailing = np.isin(fc["change"], [b"", b"FM"])
+    fc = {name: col[prevailing] for name, col in fc.items()}
+    if not len(obs["time"]) or not len(fc["issued"]):
+        return None
+
+    matched = worse = better = 0
+    for t, actual in zip(obs["time"], obs["category"]):
+        covering = (fc["start"] <= t) & (t < fc["end"]) & (fc["issued"] <= t)
+        if not covering.any() or actual == 5:
+            continue
+        idx = np.flatnonzero(covering)
+        # Latest issuance; within it the period that started last (FM).
+        best = idx[np.lexsort((fc["start"][idx], fc["issued"][idx]))[-1]]
+        forecast = fc["category"][best]
+        if forecast == 5:
+            continue
+        if forecast == actual:
+            matched += 1
+        elif actual > forecast:
+            worse += 1
+        else:
+            better += 1
+    total = matched + worse + better
+    if not total:
+        return None
+    return (f"{station} TAF verification, last {hours} h: flight category as forecast for {matched}/{total} "
+            f"reports, worse than forecast {worse}, better {better}")
+
+
+def station_history(station):
+    # Trend and verification lines for the prompt; None when there is
+    # nothing to say yet.
+    lines = [line for line in (station_trend(station), taf_verification(station)) if line]
+    return "\n".join(lines) or None
+
+
+def prune(days=HISTORY_DAYS):
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    for product in ("metar", "taf"):
+        root = os.path.join(HISTORY_DIR, product)
+        if not os.path.isdir(root):
+            continue
+        for day in os.listdir(root):
+            if day < cutoff:
+                shutil.rmtree(os.path.join(root, day), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Write/query benchmark on a scratch directory: 30 days of half-hourly
+    # reports for 300 stations (~430k rows).
+    import tempfile
+
+    from records import metar_records
+
+    HISTORY_DIR = tempfile.mkdtemp()
+    stations = [f"K{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}{chr(65 + i // 676)}" for i in range(300)]
+    start = int(time.time()) - 30 * 86400
+    rng = np.random.default_rng(1)
+
+    t0 = time.perf_counter()
+    rows = 0
+    for step in range(30 * 48):
+        t = start + step * 1800
+        metars = metar_records([{
+            "icaoId": s, "obsTime": t, "rawOb": "", "visib": str(int(rng.integers(1, 11))),
+            "clouds": [{"cover": "BKN", "base": int(rng.integers(3, 60)) * 100}], "wdir": 270, "wspd": 10,
+        } for s in stations])
+        rows += record_observations(metars)
+    elapsed = time.perf_counter() - t0
+    size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(HISTORY_DIR) for f in files)
+    print(f"Appended {rows} observations in {elapsed:.2f} s ({rows / elapsed:,.0f} rows/s), {size / 2**20:.1f} MiB on disk")
+
+    now = start + 30 * 86400
+    for hours in (6, 24, 24 * 7):
+        t0 = time.perf_counter()
+        obs = observations(stations[7], now - hours * 3600, now)
+        print(f"{hours:4d} h window for one station: {len(obs['time'])} rows in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    t0 = time.perf_counter()
+    line = station_trend(stations[7], now=now)
+    print(f"station_trend in {(time.perf_counter() - t0) * 1e3:.1f} ms: {line}")
+    shutil.rmtree(HISTORY_DIR)
+    sys.exit(0)
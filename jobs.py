@@ -0,0 +1,191 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import requests
+
+from briefing import (
+    airport_stage,
+    leg_stage,
+    map_stage,
+    pirep_corridor_stage,
+    route_legs,
+    sigmet_stage,
+    station_stage,
+    summary_stage,
+)
+from profiling import profiled
+from tracing import Trace, TRACE_LOG, span, submit, tracing
+
+
+class InlineExecutor:
+    # Runs submitted work immediately on the calling thread. Used for
+    # profiled briefings, since the profilers only see their own thread.
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class BriefingJob:
+    # Runs the briefing pipeline on a background thread so the Streamlit
+    # script can keep rendering. Results are published stage by stage:
+    #   airports (one card per METAR/TAF as it arrives) -> map geometry -> summary
+    # Readers call wait() with the last version they saw and re-render
+    # whatever became available.
+
+    def __init__(self, graph, waypoints, max_workers=8, profile=False):
+        self.graph = graph
+        self.waypoints = waypoints
+        self.max_workers = max_workers
+        self.profile = profile
+        self.profile_path = None
+
+        self.airports = [None] * len(waypoints)
+        self.geometry = None
+        self.summary = None
+        self.timing = None
+        self.error = None
+        self.stages = []
+        self.trace = Trace("-".join(w["airport_id"] for w in waypoints))
+        self.done = False
+        self.cancelled = False
+
+        self.version = 0
+        self._changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def wait(self, seen, timeout=None):
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != seen or self.done, timeout)
+            return self.version
+
+    def _publish(self, **values):
+        with self._changed:
+            for name, value in values.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def _stage(self, name, started):
+        self.stages.append((name, time.perf_counter() - started))
+
+    def _run(self):
+        try:
+            with tracing(self.trace), span("briefing", self.trace.name):
+                if self.profile:
+                    with profiled(self.trace.name) as result:
+                        self._run_stages(InlineExecutor)
+                    self.profile_path = result["path"]
+                else:
+                    self._run_stages(ThreadPoolExecutor)
+        finally:
+            self._publish(timing=self.graph.report(), done=True)
+        if TRACE_LOG:
+            self.trace.log()
+
+    def _run_stages(self, executor):
+        graph = self.graph
+        with graph.run_lock:
+            graph.start()
+            try:
+                with executor(max_workers=self.max_workers) as pool:
+                    t0 = time.perf_counter()
+                    station_stage(self.waypoints)
+                    futures = {submit(pool, airport_stage, graph, w): i for i, w in enumerate(self.waypoints)}
+                    for future in as_completed(futures):
+                        airports = list(self.airports)
+                        airports[futures[future]] = future.result()
+                        self._publish(airports=airports)
+                    self._stage("airports", t0)
+                    if self.cancelled:
+                        return
+
+                    t0 = time.perf_counter()
+                    airports = self.airports
+                    sigmet_future = submit(pool, sigmet_stage, graph, airports)
+                    corridor_key = pirep_corridor_stage(graph, airports)
+                    legs = [submit(pool, leg_stage, graph, a, b, band, corridor_key)
+                            for a, b, band in route_legs(airports)]
+                    warnings = []
+                    pireps = []
+                    for leg in legs:
+                        leg_warnings, leg_pireps = leg.result()
+                        warnings.extend(leg_warnings)
+                        pireps.extend(leg_pireps)
+                    sigmets = sigmet_future.result()
+                    self._publish(geometry={
+                        "waypoints": airports,
+                        "pireps": pireps,
+                        "warnings": warnings,
+                        "sigmet": sigmets,
+                        "map": map_stage(graph, airports),
+                    })
+                    self._stage("map", t0)
+                    if self.cancelled:
+                        return
+
+                t0 = time.perf_counter()
+                self._publish(summary=summary_stage(graph, airports))
+                self._stage("summary", t0)
+            except Exception as e:
+                self.error = e
+            finally:
+                graph.finish(prune=self.error is None and not self.cancelled)
+
+
+class RemoteBriefingJob(BriefingJob):
+    # Same interface, but the briefing runs on the API service (api.py): the
+    # cards and map come from /briefing?summary=0, then the summary.
+
+    def __init__(self, api_url, waypoints, timeout=120):
+        super().__init__(None, waypoints)
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+
+    def _get(self, path, **params):
+        response = requests.get(self.api_url + path, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _run(self):
+        route = ",".join(f"{w['airport_id']}:{w['altitude']}" for w in self.waypoints)
+        timing = {"elapsed": 0.0, "full_cost": 0.0, "reused": [], "computed": []}
+        try:
+            t0 = time.perf_counter()
+            result = self._get("/briefing", route=route, summary=0)
+            self._publish(airports=result["waypoints"], geometry={k: result[k] for k in ("waypoints", "pireps", "warnings", "sigmet")})
+            self._stage("map", t0)
+            timing = result["timing"]
+            if self.cancelled:
+                return
+
+            t0 = time.perf_counter()
+            result = self._get("/briefing", route=route)
+            self._publish(summary=result["summary"])
+            self._stage("summary", t0)
+            timing = result["timing"]
+        except requests.exceptions.RequestException as e:
+            self.error = e
+        finally:
+            self._publish(timing=timing, done=True)
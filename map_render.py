@@ -0,0 +1,161 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from geometry import polygon_lods
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+INSERTION_POINT = "////hellow olrd"
+
+# 4 decimal places is ~11 m, far below what the map can show.
+COORD_DECIMALS = 4
+CURVE_POINTS = 20
+LOW_ALTITUDE_FT = 9000
+
+# Rendered pages keyed by map node version (or payload hash), shared by all
+# sessions.
+HTML_CACHE_SIZE = 32
+
+_template_cache = {}
+_html_cache = {}
+
+
+def _template():
+    # Re-read index.html only when it changes on disk.
+    mtime = os.path.getmtime(TEMPLATE_PATH)
+    cached = _template_cache.get(TEMPLATE_PATH)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as file:
+        html_content = file.read()
+
+    split_point = html_content.find(INSERTION_POINT)
+    if split_point == -1:
+        raise ValueError(f"Could not find the insertion point in {TEMPLATE_PATH}")
+
+    parts = (html_content[:split_point], html_content[split_point + len(INSERTION_POINT):])
+    _template_cache[TEMPLATE_PATH] = (mtime, parts)
+    _html_cache.clear()
+    return parts
+
+
+def _round(value):
+    return round(float(value), COORD_DECIMALS)
+
+
+def _point(lat, lon):
+    return {"type": "Point", "coordinates": [_round(lon), _round(lat)]}
+
+
+def _feature(geometry, **properties):
+    return {"type": "Feature", "geometry": geometry, "properties": properties}
+
+
+def _altitude(airport):
+    # Mirrors the old JS comparison: a blank box counts as ground level,
+    # anything non-numeric is not a low altitude leg.
+    try:
+        return float(airport.get("altitude") or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def curved_line(start, end, points=CURVE_POINTS):
+    # Quadratic Bezier with the control point raised proportionally to the
+    # leg length, so the route arcs slightly upward on the map.
+    start = np.asarray(start, dtype=float)
+    end = np.asarray(end, dtype=float)
+    mid = (start + end) / 2
+    mid[0] += np.hypot(*(end - start)) * 0.15
+
+    t = np.linspace(0, 1, points + 1)[:, None]
+    curve = (1 - t) ** 2 * start + 2 * (1 - t) * t * mid + t ** 2 * end
+    return np.round(curve, COORD_DECIMALS)
+
+
+def build_payload(briefing):
+    features = []
+
+    for p in briefing.get("pireps", []):
+        if not p.get("lat") or not p.get("lon"):
+            continue
+        features.append(_feature(_point(p["lat"], p["lon"]), kind="pirep", summary=p.get("summary")))
+
+    for w in briefing.get("warnings", []):
+        if not w.get("lat") or not w.get("lon") or "error" in w:
+            continue
+        features.append(_feature(
+            _point(w["lat"], w["lon"]),
+            kind="warning",
+            description=w.get("description"),
+            temperature=w.get("temperature"),
+            windspeed=w.get("windspeed"),
+            code=w.get("code"),
+        ))
+
+    for s in briefing.get("sigmet", []):
+        coords = s.get("coords") or []
+        if len(coords) < 3:
+            continue
+        # Outlines are shipped as encoded polylines per zoom level; the
+        # full-resolution coords stay on the server for containment checks.
+        features.append(_feature(
+            None,
+            kind="sigmet",
+            lod=polygon_lods(coords),
+            sigmet_eng=s.get("sigmet_eng"),
+            severity=s.get("severity"),
+        ))
+
+    # Airports that could not be placed have no position to draw.
+    airports = [a for a in briefing.get("waypoints", []) if a.get("lat") is not None]
+    for a in airports:
+        features.append(_feature(
+            _point(a["lat"], a["lon"]),
+            kind="airport",
+            airport_id=a["airport_id"],
+            altitude=a.get("altitude"),
+            warning_level=a.get("warning_level") or 5,
+        ))
+
+    low = [a for a in airports if _altitude(a) is not None and _altitude(a) < LOW_ALTITUDE_FT]
+    low.sort(key=lambda a: a["lon"])
+    for a, b in zip(low, low[1:]):
+        curve = curved_line((a["lat"], a["lon"]), (b["lat"], b["lon"]))
+        features.append(_feature(
+            {"type": "LineString", "coordinates": curve[:, ::-1].tolist()},
+            kind="route",
+        ))
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def payload_json(briefing):
+    return json.dumps(build_payload(briefing), separators=(",", ":"))
+
+
+def render_map(briefing):
+    # Briefings from BriefingJob carry "map": (version, payload) from the
+    # graph's map node, so an unchanged map is neither rebuilt nor hashed.
+    # Anything else (e.g. API results) is keyed by its payload hash.
+    head, tail = _template()
+    if "map" in briefing:
+        version, payload = briefing["map"]
+        key = ("version", version)
+    else:
+        payload = payload_json(briefing)
+        key = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    html = _html_cache.get(key)
+    if html is None:
+        # "</" would close the surrounding <script> tag.
+        script = "renderBriefing(" + payload.replace("</", "<\\/") + ");"
+        html = head + script + tail
+        if len(_html_cache) >= HTML_CACHE_SIZE:
+            del _html_cache[next(iter(_html_cache))]
+        _html_cache[key] = html
+    return html
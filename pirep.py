@@ -0,0 +1,168 @@
+import re
+import time
+
+
+# One scan over the "/XX value" groups of a PIREP. The header before the
+# first slash carries the station and the report type (UA or UUA).
+_fields = re.compile(r"/(OV|TM|FL|TP|SK|WX|TA|WV|TB|IC|RM)\s*([^/]*)")
+_header = re.compile(r"\b(UUA|UA)\b")
+_intensity = re.compile(r"\b(NEG|SMTH|SMOOTH|LGT|MOD|SEV|EXTRM)(?:-(LGT|MOD|SEV|EXTRM))?\b")
+_level_range = re.compile(r"\b(?:(BLO|BLW|ABV)\s*)?(\d{3})(?:-(\d{3}))?\b")
+_tops_bases = re.compile(r"\b(TOPS?|BASES?)\s*(\d{3})")
+
+
+class PirepReport:
+    __slots__ = (
+        "raw", "lat", "lon", "urgent", "location", "time", "altitude", "aircraft",
+        "sky", "tops", "bases", "weather",
+        "turbulence", "turb_intensity", "turb_low", "turb_high",
+        "icing", "ice_intensity", "ice_low", "ice_high",
+    )
+
+    def __init__(self, raw, lat=None, lon=None):
+        self.raw = raw
+        self.lat = lat
+        self.lon = lon
+        self.urgent = False
+        self.location = self.time = self.altitude = self.aircraft = None
+        self.sky = self.tops = self.bases = self.weather = None
+        self.turbulence = self.turb_intensity = self.turb_low = self.turb_high = None
+        self.icing = self.ice_intensity = self.ice_low = self.ice_high = None
+
+    def __eq__(self, other):
+        return isinstance(other, PirepReport) and (self.raw, self.lat, self.lon) == (other.raw, other.lat, other.lon)
+
+    def __hash__(self):
+        return hash((self.raw, self.lat, self.lon))
+
+    def __repr__(self):
+        return f"PirepReport({self.raw!r})"
+
+    def layers(self):
+        # (low, high) ft of every level the report covers: the aircraft's own
+        # altitude plus any turbulence or icing layer it reported.
+        layers = [(low, high) for low, high in ((self.turb_low, self.turb_high), (self.ice_low, self.ice_high))
+                  if low is not None]
+        if self.altitude is not None:
+            layers.append((self.altitude, self.altitude))
+        return layers
+
+    def summary(self):
+        summary = []
+        if self.urgent:
+            summary.append("⚠️ Urgent PIREP issued – hazardous conditions reported")
+        if self.altitude is not None:
+            summary.append(f"Altitude: {self.altitude} ft")
+        if self.aircraft:
+            summary.append(f"Aircraft type: {self.aircraft}")
+        if self.tops is not None and self.bases is not None:
+            summary.append(f"Cloud tops at {self.tops} ft, bases at {self.bases} ft")
+        elif self.tops is not None:
+            summary.append(f"Cloud tops at {self.tops} ft")
+        elif self.bases is not None:
+            summary.append(f"Cloud bases at {self.bases} ft")
+        if self.location:
+            summary.append(f"Reported over: {self.location}")
+        if self.time:
+            summary.append(f"Report time: {self.time} Z")
+        if self.turbulence:
+            summary.append(f"Turbulence reported: {self.turbulence}")
+        if self.icing:
+            summary.append(f"Icing reported: {self.icing}")
+        if self.weather:
+            summary.append(f"Weather: {self.weather}")
+        return "; ".join(summary) if summary else "Unable to summarize PIREP."
+
+
+def _hazard(value):
+    # "MOD-SEV 080-120" -> ("MOD-SEV", 8000, 12000)
+    # "LGT BLO 050" -> ("LGT", 0, 5000), "MOD ABV 300" -> ("MOD", 30000, inf)
+    intensity = _intensity.search(value)
+    levels = _level_range.search(value)
+    low = high = None
+    if levels:
+        low = int(levels.group(2)) * 100
+        high = int(levels.group(3)) * 100 if levels.group(3) else low
+        if levels.group(1) == "ABV":
+            high = float("inf")
+        elif levels.group(1):
+            low = 0
+    return (intensity.group(0) if intensity else None), low, high
+
+
+def decode_pirep(raw, lat=None, lon=None, flight_level=None):
+    report = PirepReport(raw, lat, lon)
+    if not raw:
+        return report
+
+    first_slash = raw.find("/")
+    header = _header.search(raw if first_slash == -1 else raw[:first_slash])
+    report.urgent = bool(header) and header.group(1) == "UUA"
+
+    for match in _fields.finditer(raw):
+        field, value = match.group(1), match.group(2).strip()
+        if not value:
+            continue
+        if field == "OV":
+            report.location = value.split()[0]
+        elif field == "TM":
+            if value[:4].isdigit():
+                report.time = value[:4]
+        elif field == "FL":
+            if value[:3].isdigit():
+                report.altitude = int(value[:3]) * 100
+        elif field == "TP":
+            report.aircraft = value.split()[0]
+        elif field == "SK":
+            report.sky = value
+        elif field == "WX":
+            report.weather = value
+        elif field == "TB":
+            report.turbulence = value
+            report.turb_intensity, report.turb_low, report.turb_high = _hazard(value)
+        elif field == "IC":
+            report.icing = value
+            report.ice_intensity, report.ice_low, report.ice_high = _hazard(value)
+
+        if field in ("SK", "RM"):
+            for kind, level in _tops_bases.findall(value):
+                if kind.startswith("TOP"):
+                    report.tops = int(level) * 100
+                else:
+                    report.bases = int(level) * 100
+
+    if report.altitude is None and flight_level is not None:
+        report.altitude = flight_level
+    return report
+
+
+def _flight_level(pirep):
+    fl = pirep.get("fltLvl")
+    if isinstance(fl, (int, float)) or (isinstance(fl, str) and fl.isdigit()):
+        return int(fl) * 100
+    return None
+
+
+def decode_pireps(pireps):
+    # API JSON records -> PirepReport, skipping anything without a position.
+    reports = []
+    for p in pireps:
+        if not isinstance(p, dict) or p.get("lat") is None or p.get("lon") is None:
+            continue
+        reports.append(decode_pirep(p.get("rawOb", ""), p["lat"], p["lon"], _flight_level(p)))
+    return reports
+
+
+if __name__ == "__main__":
+    samples = [
+        "SAC UA /OV SAC090020/TM 1850/FL080/TP C172/SK BKN030-TOP060/TB LGT/IC NEG/RM SMOOTH",
+        "DEN UUA /OV DEN270040/TM 2105/FL350/TP B738/TB SEV 330-370/RM TOPS 390",
+        "ORD UA /OV ORD180015/TM 1402/FL120/TP E145/SK OVC020-TOP110/TA M08/IC MOD RIME 090-120",
+        "SFO UA /OV OAK/TM 0315/FLDURD/TP A320/WX FV03SM HZ/TB MOD-SEV 040-060",
+    ]
+    corpus = samples * 2500
+    start = time.perf_counter()
+    for raw in corpus:
+        decode_pirep(raw).summary()
+    elapsed = time.perf_counter() - start
+    print(f"Decoded {len(corpus)} PIREPs in {elapsed:.3f} s ({len(corpus) / elapsed:,.0f} reports/s)")
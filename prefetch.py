@@ -0,0 +1,188 @@
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from airports import to_icao
+from briefing import route_legs
+from helper import (
+    fetch_pirep_corridor,
+    fetch_sigmet_feed,
+    fetch_stations,
+    interpolate_points,
+    lat_log,
+    route_weather,
+    PIREP_WINDOW,
+    SIGMET_FEED_TTL,
+)
+from upstream import revalidating
+
+
+# Watchlist: {"stations": ["KSFO", ...], "routes": [["KSFO", "KLAX"], ...]}
+WATCHLIST_PATH = os.environ.get("AEROBRIEF_WATCHLIST", "watchlist.json")
+
+# Routine METARs go out just before the hour; TAFs are issued for 00/06/12/18Z
+# and usually show up 20-40 minutes ahead, so we poll before and just after.
+METAR_MINUTE = 55
+TAF_ISSUE_HOURS = (0, 6, 12, 18)
+TAF_OFFSETS_MIN = (-20, 5)
+ROUTE_WEATHER_EVERY = 900
+PREFETCH_WORKERS = 4
+
+
+def load_watchlist(path=WATCHLIST_PATH):
+    if not os.path.exists(path):
+        return {"stations": [], "routes": []}
+    with open(path) as f:
+        data = json.load(f)
+    # IATA codes are polled under the ICAO key the briefings use.
+    routes = [tuple(to_icao(s) for s in route) for route in data.get("routes", []) if len(route) >= 2]
+    stations = [to_icao(s) for s in data.get("stations", [])]
+    stations += [s for route in routes for s in route]
+    return {"stations": list(dict.fromkeys(stations)), "routes": list(dict.fromkeys(routes))}
+
+
+def next_metar(now):
+    due = now.replace(minute=METAR_MINUTE, second=0, microsecond=0)
+    return due if due > now else due + timedelta(hours=1)
+
+
+def next_taf(now):
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    times = [day + timedelta(days=d, hours=h, minutes=m)
+             for d in (0, 1) for h in TAF_ISSUE_HOURS for m in TAF_OFFSETS_MIN]
+    return min(t for t in times if t > now)
+
+
+def every(seconds):
+    def next_due(now):
+        return datetime.fromtimestamp((now.timestamp() // seconds + 1) * seconds, timezone.utc)
+    return next_due
+
+
+class Prefetcher:
+    # Polls the watchlist on each product's cadence and writes the results
+    # into the upstream cache, so briefings for watched stations and routes
+    # are served without waiting on aviationweather.gov or open-meteo.
+
+    def __init__(self, watchlist, workers=PREFETCH_WORKERS):
+        self.stations = watchlist["stations"]
+        self.routes = watchlist["routes"]
+        self.workers = workers
+        self.tasks = {
+            "metar": (next_metar, self.metars),
+            "taf": (next_taf, self.tafs),
+            "pirep": (every(PIREP_WINDOW), self.pireps),
+            "sigmet": (every(SIGMET_FEED_TTL), self.sigmets),
+            "route_weather": (every(ROUTE_WEATHER_EVERY), self.route_weather),
+        }
+        self.last_run = {}
+        self.failures = {name: 0 for name in self.tasks}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _each(self, fn, items):
+        def run(item):
+            try:
+                with revalidating():
+                    fn(*item) if isinstance(item, tuple) else fn(item)
+                return 0
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print("Prefetch failed:", fn.__name__, item, e)
+                return 1
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return sum(pool.map(run, items))
+
+    def _route_points(self, route):
+        # Split into legs exactly as briefing.route_legs does, so the cache
+        # keys match what a briefing of the same route asks for.
+        legs = route_legs([{"airport_id": s, "altitude": ""} for s in route])
+        positions = {s: lat_log(s) for s in route}
+        return [interpolate_points(tuple(positions[a]), tuple(positions[b])) for a, b, _ in legs]
+
+    def metars(self):
+        return self._each(fetch_stations, [(self.stations, ("metar",))])
+
+    def tafs(self):
+        return self._each(fetch_stations, [(self.stations, ("taf",))])
+
+    def pireps(self):
+        # The corridor over every leg, as briefing.pirep_corridor_stage
+        # queries it.
+        def corridor(*route):
+            fetch_pirep_corridor([tuple(pt) for points in self._route_points(route) for pt in points])
+        return self._each(corridor, self.routes)
+
+    def sigmets(self):
+        return self._each(fetch_sigmet_feed, [()])
+
+    def route_weather(self):
+        def legs(*route):
+            for points in self._route_points(route):
+                route_weather(points)
+        return self._each(legs, self.routes)
+
+    def _run(self):
+        queue = []
+        now = datetime.now(timezone.utc)
+        # Warm everything once at start-up, then follow the schedule.
+        for name in self.tasks:
+            heapq.heappush(queue, (now, name))
+
+        while queue and not self._stop.is_set():
+            due, name = heapq.heappop(queue)
+            wait = (due - datetime.now(timezone.utc)).total_seconds()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            next_due, run = self.tasks[name]
+            started = time.perf_counter()
+            self.failures[name] += run()
+            self.last_run[name] = (datetime.now(timezone.utc), time.perf_counter() - started)
+            print(f"Prefetched {name} in {self.last_run[name][1]:.1f} s")
+            heapq.heappush(queue, (next_due(datetime.now(timezone.utc)), name))
+
+    def status(self):
+        return {name: {"last_run": self.last_run.get(name, (None, None))[0],
+                       "seconds": self.last_run.get(name, (None, None))[1],
+                       "failures": self.failures[name]}
+                for name in self.tasks}
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def start_prefetcher(path=WATCHLIST_PATH):
+    # One scheduler per process, whichever session asks first.
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            watchlist = load_watchlist(path)
+            if watchlist["stations"]:
+                _prefetcher = Prefetcher(watchlist).start()
+        return _prefetcher
+
+
+if __name__ == "__main__":
+    prefetcher = start_prefetcher(sys.argv[1] if len(sys.argv) > 1 else WATCHLIST_PATH)
+    if prefetcher is None:
+        sys.exit("Watchlist is empty")
+    print(f"Watching {len(prefetcher.stations)} stations and {len(prefetcher.routes)} routes")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        prefetcher.stop()
@@ -0,0 +1,76 @@
+import cProfile
+import glob
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+
+# Profile one briefing on demand: set AEROBRIEF_PROFILE=1 for every Submit in
+# the process, or open the app with ?profile=1 for just that session. Each
+# profiled briefing leaves an HTML flamegraph (pyinstrument) or a .pstats
+# file (cProfile, e.g. for snakeviz) in PROFILE_DIR, tagged with the route.
+# Any visitor can add ?profile=1 to the URL, so the query flag only counts
+# when the operator opts in with AEROBRIEF_PROFILE_QUERY=1, and only the
+# newest PROFILE_KEEP profiles are kept on disk.
+PROFILE_DIR = os.environ.get("AEROBRIEF_PROFILE_DIR", "profiles")
+PROFILE_QUERY = os.environ.get("AEROBRIEF_PROFILE_QUERY", "0") not in ("", "0")
+PROFILE_KEEP = int(os.environ.get("AEROBRIEF_PROFILE_KEEP", "20"))
+
+
+def profile_requested(query_params=None):
+    if os.environ.get("AEROBRIEF_PROFILE"):
+        return True
+    if not PROFILE_QUERY:
+        return False
+    return bool(query_params) and query_params.get("profile") not in (None, "", "0")
+
+
+def profile_path(tag, extension):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    safe_tag = re.sub(r"[^A-Za-z0-9_-]+", "_", tag) or "briefing"
+    return os.path.join(PROFILE_DIR, f"{stamp}-{safe_tag}.{extension}")
+
+
+def rotate_profiles(keep=None):
+    keep = PROFILE_KEEP if keep is None else keep
+    paths = glob.glob(os.path.join(PROFILE_DIR, "*.html")) + glob.glob(os.path.join(PROFILE_DIR, "*.pstats"))
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:max(len(paths) - keep, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profiled(tag):
+    # Yields a dict whose "path" is set to the saved profile on exit.
+    result = {"path": None}
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield result
+        finally:
+            profiler.stop()
+            result["path"] = profile_path(tag, "html")
+            with open(result["path"], "w") as f:
+                f.write(profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            result["path"] = profile_path(tag, "pstats")
+            profiler.dump_stats(result["path"])
+    rotate_profiles()
+    print("Saved briefing profile to", result["path"])
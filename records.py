@@ -0,0 +1,239 @@
+import sys
+
+import numpy as np
+
+
+# The data API returns ~35 fields per METAR and a fully decoded forecast
+# period list per TAF. The briefing only reads the fields below, so that is
+# all we keep in the upstream cache and the per-session graphs.
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class MetarRecord:
+    __slots__ = (
+        "icao", "raw", "report_time", "obs_time", "metar_type", "lat", "lon",
+        "wdir", "wspd", "wgst", "visib", "wx", "clouds",
+        "temp", "dewp", "altim", "slp",
+    )
+
+    def __init__(self, entry):
+        self.icao = _intern(entry.get("icaoId"))
+        self.raw = entry.get("rawOb", "")
+        self.report_time = entry.get("reportTime")
+        self.obs_time = entry.get("obsTime")
+        self.metar_type = _intern(entry.get("metarType"))
+        self.lat = entry.get("lat")
+        self.lon = entry.get("lon")
+        self.wdir = entry.get("wdir")
+        self.wspd = entry.get("wspd")
+        self.wgst = entry.get("wgst")
+        self.visib = _intern(entry.get("visib"))
+        self.wx = entry.get("wxString")
+        # ((cover, base_ft), ...)
+        self.clouds = tuple((_intern(c.get("cover")), c.get("base")) for c in entry.get("clouds") or [])
+        self.temp = entry.get("temp")
+        self.dewp = entry.get("dewp")
+        self.altim = entry.get("altim")
+        self.slp = entry.get("slp")
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, MetarRecord) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return f"MetarRecord({self.raw!r})"
+
+
+CEILING_COVERS = ("BKN", "OVC", "OVX")
+
+
+def _ceiling(clouds):
+    bases = [c.get("base") for c in clouds or [] if c.get("cover") in CEILING_COVERS and c.get("base") is not None]
+    return min(bases) if bases else None
+
+
+def visibility_sm(value):
+    # Data API visibilities: 10, "10+", "1/2", "1 1/2".
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value.strip():
+        return np.nan
+    total = 0.0
+    for part in value.replace("+", "").replace("SM", "").split():
+        try:
+            if "/" in part:
+                num, denom = part.split("/")
+                total += float(num) / float(denom)
+            else:
+                total += float(part)
+        except (ValueError, ZeroDivisionError):
+            return np.nan
+    return total
+
+
+def flight_category(ceiling, visibility):
+    # Arrays of ceiling (ft, NaN for none) and visibility (SM, NaN when not
+    # reported) -> category (1 VFR .. 4 LIFR, 5 unknown). The one place the
+    # limits live: helper.flight_categories (the cards) and history.py (trends,
+    # TAF verification) both use it.
+    ceil = np.where(np.isnan(ceiling), np.inf, ceiling)
+    vis = np.where(np.isnan(visibility), np.inf, visibility)
+    category = np.select(
+        [(ceil < 500) | (vis < 1), (ceil < 1000) | (vis < 3), (ceil <= 3000) | (vis <= 5)],
+        [4, 3, 2], default=1)
+    category[np.isnan(ceiling) & np.isnan(visibility)] = 5
+    return category
+
+
+class TafRecord:
+    __slots__ = ("icao", "raw", "issue_time", "valid_from", "valid_to", "lat", "lon", "periods")
+
+    def __init__(self, entry):
+        self.icao = _intern(entry.get("icaoId"))
+        self.raw = entry.get("rawTAF", "")
+        self.issue_time = entry.get("issueTime")
+        self.valid_from = entry.get("validTimeFrom")
+        self.valid_to = entry.get("validTimeTo")
+        self.lat = entry.get("lat")
+        self.lon = entry.get("lon")
+        # ((time_from, time_to, change, probability, visib, ceiling_ft), ...)
+        # for TAF verification against the observations (history.py).
+        self.periods = tuple(
+            (p.get("timeFrom"), p.get("timeTo"), _intern(p.get("fcstChange")), p.get("probability"),
+             _intern(p.get("visib")), _ceiling(p.get("clouds")))
+            for p in entry.get("fcsts") or [])
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, TafRecord) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return f"TafRecord({self.raw!r})"
+
+
+def metar_records(data):
+    return [MetarRecord(e) for e in data or [] if isinstance(e, dict)]
+
+
+def taf_records(data):
+    return [TafRecord(e) for e in data or [] if isinstance(e, dict)]
+
+
+if __name__ == "__main__":
+    # Memory benchmark: what one product costs raw vs as a record, and what an
+    # active briefing session keeps resident, against a stand-in upstream.
+    import gc
+    import json
+    import random
+    import resource
+    import tracemalloc
+
+    import requests
+
+    import helper
+    import upstream
+    from briefing import BriefingGraph, run_briefing
+
+    metar = {
+        "metar_id": 715233188, "icaoId": "KORD", "receiptTime": "2026-10-19 04:54:23", "obsTime": 1760849460,
+        "reportTime": "2026-10-19 05:00:00", "temp": 12.2, "dewp": 8.3, "wdir": 270, "wspd": 10, "wgst": None,
+        "visib": "10+", "altim": 1016.9, "slp": 1016.8, "qcField": 4, "wxString": None, "presTend": None,
+        "maxT": None, "minT": None, "maxT24": None, "minT24": None, "precip": None, "pcp3hr": None,
+        "pcp6hr": None, "pcp24hr": None, "snow": None, "vertVis": None, "metarType": "METAR",
+        "rawOb": "KORD 190451Z 27010KT 10SM FEW250 12/08 A3003 RMK AO2 SLP168 T01220083",
+        "mostRecent": 1, "lat": 41.9602, "lon": -87.9316, "elev": 202, "prior": 1,
+        "name": "Chicago/O'Hare Intl, IL, US", "clouds": [{"cover": "FEW", "base": 25000}], "fltCat": "VFR",
+    }
+    period = {
+        "timeFrom": 1760853600, "timeTo": 1760868000, "timeBec": None, "fcstChange": "FM", "probability": None,
+        "wdir": 270, "wspd": 12, "wgst": None, "wshearHgt": None, "wshearDir": None, "wshearSpd": None,
+        "visib": "6+", "altim": None, "vertVis": None, "wxString": None, "notDecoded": None,
+        "clouds": [{"cover": "SCT", "base": 2500, "type": None}, {"cover": "BKN", "base": 8000, "type": None}],
+        "icgTurb": [], "temp": [],
+    }
+    taf = {
+        "tafId": 23071985, "icaoId": "KORD", "dbPopTime": "2026-10-19 05:23:11", "bulletinTime": "2026-10-19 05:20:00",
+        "issueTime": "2026-10-19 05:20:00", "validTimeFrom": 1760853600, "validTimeTo": 1760961600,
+        "rawTAF": "TAF KORD 190520Z 1906/2012 27012KT P6SM SCT025 BKN080 FM191400 29015G25KT P6SM BKN040 "
+                  "FM200000 30010KT P6SM SCT050 FM200600 31008KT P6SM FEW250",
+        "mostRecent": 1, "remarks": "", "lat": 41.9602, "lon": -87.9316, "elev": 202, "prior": 5,
+        "name": "Chicago/O'Hare Intl, IL, US", "fcsts": [dict(period) for _ in range(6)],
+    }
+
+    def measure(build, count=2000):
+        gc.collect()
+        tracemalloc.start()
+        kept = [build() for _ in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size / len(kept)
+
+    print("Per product (bytes):")
+    for name, entry, compact in (("METAR", metar, metar_records), ("TAF", taf, taf_records)):
+        text = json.dumps([entry])
+        raw = measure(lambda: json.loads(text))
+        rec = measure(lambda: compact(json.loads(text)))
+        print(f"  {name}: raw JSON {raw:,.0f}, record {rec:,.0f} ({raw / rec:.1f}x smaller)")
+
+    from airports import airport_index
+    stations = {a.icao: (a.lat, a.lon) for a in airport_index().airports if a.icao.startswith("K") and a.iata}
+    stations = dict(list(stations.items())[:40])
+
+    def fake_get(url, params=None, timeout=None, headers=None):
+        class Response:
+            status_code = 200
+            headers = {}
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                if "open-meteo" in url:
+                    return {"current_weather": {"weathercode": 3, "temperature": 10, "windspeed": 12}}
+                if "airsigmet" in url or "pirep" in url:
+                    return []
+                ids = url.split("ids=")[1].split("&")[0].split(",")
+                if "airport" in url:
+                    return [{"icaoId": icao, "lat": stations[icao][0], "lon": stations[icao][1]} for icao in ids]
+                return [dict(metar if "metar" in url else taf, icaoId=icao, lat=stations[icao][0], lon=stations[icao][1])
+                        for icao in ids]
+
+        return Response()
+
+    requests.get = fake_get
+    helper.OPEN_METEO_DELAY = 0
+    # fake_get looks like the real upstream; keep it out of the history store.
+    import history
+    history.HISTORY_ENABLED = False
+    import briefing
+    briefing.ask_llm = lambda final: final[:2000]
+
+    sessions = 50
+    routes = [random.sample(list(stations), 3) for _ in range(sessions)]
+    for route in routes:
+        run_briefing(BriefingGraph(), [{"airport_id": s, "altitude": "8500"} for s in route])
+
+    gc.collect()
+    tracemalloc.start()
+    graphs = []
+    for route in routes:
+        graph = BriefingGraph()
+        graphs.append((graph, run_briefing(graph, [{"airport_id": s, "altitude": "8500"} for s in route])))
+    per_session = tracemalloc.get_traced_memory()[0] / sessions
+    tracemalloc.stop()
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Per active session (graph + briefing): {per_session / 1024:,.1f} KiB")
+    print(f"Shared upstream cache: {upstream.stats()['cached']} entries; peak RSS {rss_mb:,.1f} MiB")
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repo, next to app.py.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests that exercise the history store point it at a temporary directory;
+# nothing else should write to ./history.
+os.environ.setdefault("AEROBRIEF_HISTORY", "0")
+
+
+class RecordingTransport:
+    def __init__(self, transport):
+        self.transport = transport
+        self.urls = []
+
+    def __call__(self, url, params, timeout):
+        self.urls.append(url)
+        return self.transport(url, params, timeout)
+
+
+@pytest.fixture
+def synthetic(monkeypatch):
+    # bench.py's deterministic upstream behind a cold cache, keeping the URL
+    # of every request that reaches it.
+    import helper
+    import upstream
+    from bench import synthetic_upstream
+
+    monkeypatch.setattr(helper, "OPEN_METEO_DELAY", 0)
+    upstream.clear()
+    upstream._breakers.clear()
+    helper._pirep_cache.clear()
+    transport = upstream.set_transport(RecordingTransport(synthetic_upstream))
+    yield transport
+    upstream.set_transport(None)
+    upstream.clear()
+    upstream._breakers.clear()
+    helper._pirep_cache.clear()
@@ -0,0 +1,55 @@
+import pytest
+
+from airports import Airport, AirportIndex, airport_index
+
+
+def _airport(icao, iata, name, lat=0.0, lon=0.0):
+    return Airport({"icao": icao, "iata": iata, "name": name, "city": "", "country": "", "lat": lat, "lon": lon})
+
+
+@pytest.fixture
+def index():
+    return AirportIndex([
+        _airport("EDVK", "KSF", "Kassel"),
+        _airport("KSFO", "SFO", "San Francisco Intl"),
+        _airport("KSFB", "SFB", "Orlando Sanford Intl"),
+        _airport("KSFA", None, "Private strip"),
+        _airport("KRNO", "RNO", "Reno Tahoe Intl"),
+        _airport("KSF1", None, "Heliport"),
+    ])
+
+
+def test_icao_prefix_matches_come_first(index):
+    assert [a.icao for a in index.complete("KSF")] == ["KSFB", "KSFO", "KSF1", "KSFA", "EDVK"]
+    # Airports with scheduled service rank ahead of those without.
+    assert [a.icao for a in index.complete("KS", limit=2)] == ["KSFB", "KSFO"]
+
+
+def test_exact_code_is_the_top_completion(index):
+    assert index.complete("KSFO")[0].icao == "KSFO"
+    assert index.complete("ksfa")[0].icao == "KSFA"
+    assert index.complete("SFO")[0].icao == "KSFO"
+    assert index.complete("XYZ") == []
+
+
+def test_resolve(index, capsys):
+    assert index.resolve("KRNO") == "KRNO"
+    assert index.resolve(" sfo ") == "KSFO"
+    assert index.resolve("KSF") == "EDVK"
+    # A well-formed ICAO code the database lacks goes to the airport API.
+    assert index.resolve("K0Q5") == "K0Q5"
+    assert "K0Q5 is not in the local database" in capsys.readouterr().out
+
+
+def test_resolve_rejects_malformed_codes_with_suggestions(index):
+    with pytest.raises(ValueError, match=r"Unknown airport 'KSF0X' \(did you mean KSFB, KSFO"):
+        index.resolve("KSF0X")
+    with pytest.raises(ValueError, match=r"^Unknown airport '12'$"):
+        index.resolve("12")
+
+
+def test_bundled_database():
+    index = airport_index()
+    assert index.lookup("SFO").icao == "KSFO"
+    assert index.resolve("KSFO") == "KSFO"
+    assert "KSFO" in [a.icao for a in index.complete("KSF")]
@@ -0,0 +1,14 @@
+import api
+import briefing
+
+
+def test_one_graph_per_route(synthetic, monkeypatch):
+    monkeypatch.setattr(briefing, "ask_llm", lambda prompt: "summary")
+    monkeypatch.setattr(api, "_graphs", type(api._graphs)())
+    waypoints = api.parse_route("KSFO:8500,KRNO:9500")
+    api._briefing(waypoints, False)
+    api._briefing(waypoints, True)
+    api._briefing(waypoints, False)
+    assert list(api._graphs) == [(("KSFO", "8500"), ("KRNO", "9500"))]
+    graph = api._graphs[(("KSFO", "8500"), ("KRNO", "9500"))]
+    assert graph.value(("summary",)) == "summary"
@@ -0,0 +1,154 @@
+from briefing import BriefingGraph
+
+
+def _plan(graph, raw, calls):
+    graph.start()
+    graph.input(("raw",), raw)
+    graph.node(("station",), (("raw",),), lambda r: calls.append("station") or r.split()[0])
+    label = graph.node(("label",), (("station",),), lambda s: calls.append("label") or s.upper())
+    graph.finish()
+    return label
+
+
+def test_unchanged_nodes_are_reused():
+    graph = BriefingGraph()
+    calls = []
+    assert _plan(graph, "ksfo 1853Z", calls) == "KSFO"
+    assert _plan(graph, "ksfo 1853Z", calls) == "KSFO"
+    assert calls == ["station", "label"]
+    assert graph.report()["computed"] == []
+
+
+def test_equal_value_stops_the_ripple():
+    graph = BriefingGraph()
+    calls = []
+    _plan(graph, "ksfo 1853Z", calls)
+    version = graph.snapshot([("station",)])[("station",)][0]
+
+    # A new report for the same station recomputes the station node, which
+    # comes out equal, so its version holds and the label is reused.
+    assert _plan(graph, "ksfo 1953Z", calls) == "KSFO"
+    assert calls == ["station", "label", "station"]
+    assert graph.snapshot([("station",)])[("station",)][0] == version
+    assert "label" in graph.report()["reused"]
+
+
+def test_changed_value_recomputes_dependents():
+    graph = BriefingGraph()
+    calls = []
+    _plan(graph, "ksfo 1853Z", calls)
+    assert _plan(graph, "krno 1853Z", calls) == "KRNO"
+    assert calls == ["station", "label", "station", "label"]
+
+
+def test_sources_refetch_after_invalidate():
+    graph = BriefingGraph(max_age=3600)
+    fetches = []
+
+    def run():
+        graph.start()
+        value = graph.source(("metar_raw", "KSFO"), lambda: fetches.append(1) or len(fetches))
+        graph.finish()
+        return value
+
+    assert run() == 1
+    assert run() == 1
+    graph.invalidate(("metar_raw", "KSFO"))
+    assert run() == 2
+
+
+def test_sources_refetch_once_older_than_max_age():
+    graph = BriefingGraph(max_age=0)
+    fetches = []
+    for _ in range(2):
+        graph.start()
+        graph.source(("metar_raw", "KSFO"), lambda: fetches.append(1))
+        graph.finish()
+    assert len(fetches) == 2
+
+
+def test_finish_drops_nodes_outside_the_plan():
+    graph = BriefingGraph()
+    graph.start()
+    graph.input(("band", "KSFO", "KRNO"), (6500, 10500))
+    graph.input(("band", "KRNO", "KSLC"), (8500, 12500))
+    graph.finish()
+
+    graph.start()
+    graph.input(("band", "KSFO", "KRNO"), (6500, 10500))
+    graph.finish()
+    assert graph.value(("band", "KRNO", "KSLC")) is None
+    assert graph.value(("band", "KSFO", "KRNO")) == (6500, 10500)
+
+
+def _brief(waypoints):
+    from briefing import run_briefing
+
+    return run_briefing(BriefingGraph(), [{"airport_id": s, "altitude": a} for s, a in waypoints], summarize=False)
+
+
+def test_single_station_briefing(synthetic):
+    result = _brief([("KSFO", "8500")])
+    assert [a["airport_id"] for a in result["waypoints"]] == ["KSFO"]
+    assert result["pireps"] == [] and result["warnings"] == []
+    # No legs, so no corridor to ask PIREPs for.
+    assert not any("/pirep" in url for url in synthetic.urls)
+
+
+def test_repeated_station_briefing(synthetic):
+    result = _brief([("KSFO", "8500"), ("KSFO", "9500")])
+    assert [a["airport_id"] for a in result["waypoints"]] == ["KSFO", "KSFO"]
+    assert result["pireps"] == []
+    assert not any("/pirep" in url for url in synthetic.urls)
+
+
+def test_route_asks_for_one_pirep_corridor(synthetic):
+    result = _brief([("KSFO", "8500"), ("KRNO", "9500"), ("KSLC", "")])
+    assert [url for url in synthetic.urls if "/pirep" in url] == ["https://aviationweather.gov/api/data/pirep"]
+    assert result["pireps"]
+
+
+def test_summary_survives_a_run_without_one(synthetic, monkeypatch):
+    import briefing
+
+    asked = []
+    monkeypatch.setattr(briefing, "ask_llm", lambda prompt: asked.append(prompt) or "summary")
+    graph = BriefingGraph()
+    waypoints = [{"airport_id": "KSFO", "altitude": "8500"}, {"airport_id": "KRNO", "altitude": "9500"}]
+    assert briefing.run_briefing(graph, waypoints)["summary"] == "summary"
+    briefing.run_briefing(graph, waypoints, summarize=False)
+    assert graph.value(("summary",)) == "summary"
+    assert briefing.run_briefing(graph, waypoints)["summary"] == "summary"
+    assert len(asked) == 1
+
+
+def test_unknown_station_fails_only_its_card(synthetic):
+    result = _brief([("KSFO", "8500"), ("ZZZZ", "9500"), ("KRNO", "9500"), ("KSLC", "")])
+    cards = {a["airport_id"]: a for a in result["waypoints"]}
+    assert "Unknown airport 'ZZZZ'" in cards["ZZZZ"]["error"]
+    assert cards["ZZZZ"]["lat"] is None and cards["ZZZZ"]["warning_level"] == 5
+    assert all("error" not in cards[s] and f"Station {s}" in cards[s]["metar"] for s in ("KSFO", "KRNO", "KSLC"))
+    # The legs to and from ZZZZ are left out; KRNO-KSLC is still briefed.
+    assert result["warnings"] and "ZZZZ" not in result["summary_prompt"]
+
+
+def test_repeated_leg_is_briefed_once():
+    from briefing import route_legs
+
+    airports = [{"airport_id": s, "altitude": a} for s, a in
+                [("KSFO", "8500"), ("KRNO", "9500"), ("KSFO", "6500"), ("KRNO", "12500")]]
+    assert route_legs(airports) == [("KSFO", "KRNO", (4500, 14500))]
+    airports[1]["altitude"] = ""
+    airports[3]["altitude"] = ""
+    assert [leg[:2] for leg in route_legs(airports)] == [("KSFO", "KRNO")]
+    # A station that could not be placed has no legs.
+    for airport in airports[1::2]:
+        airport["error"] = "Unknown airport"
+    assert route_legs(airports) == []
+
+
+def test_abab_route_fetches_each_leg_once(synthetic):
+    result = _brief([("KSFO", "8500"), ("KRNO", "9500"), ("KSFO", "8500"), ("KRNO", "9500")])
+    once = _brief([("KSFO", "8500"), ("KRNO", "9500")])
+    assert len(result["warnings"]) == len(once["warnings"])
+    assert len(result["pireps"]) == len(once["pireps"])
@@ -0,0 +1,81 @@
+import numpy as np
+
+from geometry import (
+    _segment_distances,
+    decode_polyline,
+    douglas_peucker,
+    encode_polyline,
+    polygon_lods,
+    simplify,
+    visvalingam,
+    zoom_tolerance,
+)
+
+
+def _circle(n=200, radius=2.0):
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    return np.column_stack([39.0 + radius * np.sin(angles), -105.0 + radius * np.cos(angles)])
+
+
+def test_polyline_matches_the_reference_encoding():
+    # The example from Google's encoded polyline documentation.
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(points) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    np.testing.assert_allclose(decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@"), points)
+
+
+def test_polyline_round_trip_keeps_five_decimals():
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.uniform(-89, 89, 500), rng.uniform(-179, 179, 500)])
+    decoded = decode_polyline(encode_polyline(points))
+    np.testing.assert_allclose(decoded, np.round(points, 5), atol=1e-9)
+
+
+def test_polyline_accepts_coordinate_dicts_and_nothing():
+    assert encode_polyline([{"lat": 38.5, "lon": -120.2}]) == encode_polyline([(38.5, -120.2)])
+    assert encode_polyline([]) == ""
+
+
+def test_douglas_peucker_stays_within_tolerance():
+    points = _circle()
+    tolerance = zoom_tolerance(5)
+    simplified = douglas_peucker(points, tolerance)
+    assert 3 <= len(simplified) < len(points)
+    # Every dropped vertex is within tolerance of the simplified outline.
+    distances = np.min([_segment_distances(points, a, b) for a, b in zip(simplified, simplified[1:])], axis=0)
+    assert distances.max() <= tolerance + 1e-12
+
+
+def test_douglas_peucker_drops_collinear_points():
+    line = [(0.0, float(i)) for i in range(10)]
+    np.testing.assert_array_equal(douglas_peucker(line, 1e-6), [(0.0, 0.0), (0.0, 9.0)])
+
+
+def test_visvalingam_removes_only_small_triangles():
+    points = _circle()
+    tolerance = zoom_tolerance(5)
+    simplified = visvalingam(points, tolerance)
+    assert 3 <= len(simplified) < len(points)
+    a, b, c = simplified[:-2], simplified[1:-1], simplified[2:]
+    areas = 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+    assert areas.min() >= tolerance ** 2
+
+
+def test_finer_zoom_keeps_more_vertices():
+    points = _circle()
+    for method in ("dp", "vw"):
+        counts = [len(simplify(points, zoom_tolerance(z), method)) for z in (3, 5, 7, 9)]
+        assert counts == sorted(counts)
+
+
+def test_simplify_never_collapses_a_polygon():
+    tiny = [(39.0, -105.0), (39.0001, -105.0), (39.0, -105.0001)]
+    assert len(simplify(tiny, 1.0)) == 3
+
+
+def test_lods_skip_repeated_outlines():
+    lods = polygon_lods(_circle())
+    zooms = [zoom for zoom, _ in lods]
+    assert zooms == sorted(zooms) and zooms[0] == 3
+    encoded = [e for _, e in lods]
+    assert len(set(encoded)) == len(encoded)
@@ -0,0 +1,67 @@
+import helper
+from helper import parse_advisories, sigmets_near_route
+
+
+def _advisory(coords, advisory_id=1, low=0, high=45000):
+    return {"airSigmetId": advisory_id, "rawAirSigmet": "", "altitudeLow1": low, "altitudeHi1": high,
+            "coords": [{"lat": lat, "lon": lon} for lat, lon in coords]}
+
+
+# A 1 nm wide north-south strip across 120W, from 36N to 38N.
+STRIP = [(36.0, -120.01), (38.0, -120.01), (38.0, -119.99), (36.0, -119.99)]
+# 37N from 122W to 118W: its two samples are ~190 nm apart, and the strip's
+# corners are ~60 nm from either of them.
+LEG = [(37.0, -122.0), (37.0, -118.0)]
+
+
+def test_sigmet_crossing_a_leg_between_samples_is_kept():
+    advisories = parse_advisories([_advisory(STRIP)])
+    assert sigmets_near_route(advisories, [LEG]) == advisories
+
+
+def test_sigmet_edge_within_margin_is_kept():
+    # Parallel to the leg, 20 nm north of it; its corners are far from
+    # every route sample.
+    strip = [(37.33, -123.0), (37.5, -123.0), (37.5, -117.0), (37.33, -117.0)]
+    advisories = parse_advisories([_advisory(strip)])
+    assert sigmets_near_route(advisories, [LEG], margin_nm=25) == advisories
+    assert sigmets_near_route(advisories, [LEG], margin_nm=15) == []
+
+
+def test_sigmet_around_a_lone_airport():
+    box = [(36.5, -120.5), (37.5, -120.5), (37.5, -119.5), (36.5, -119.5)]
+    advisories = parse_advisories([_advisory(box)])
+    assert sigmets_near_route(advisories, [[(37.0, -120.0)]]) == advisories
+    assert sigmets_near_route(advisories, [[(40.0, -120.0)]]) == []
+
+
+def test_separate_routes_are_not_joined():
+    # The end of one route and the start of the next are not a leg.
+    advisories = parse_advisories([_advisory(STRIP)])
+    assert sigmets_near_route(advisories, [[(37.0, -122.0)], [(37.0, -118.0)]]) == []
+
+
+def test_collect_sigmets_uses_the_briefing_route_samples(monkeypatch):
+    advisories = parse_advisories([_advisory(STRIP)])
+    monkeypatch.setattr(helper, "fetch_sigmet_feed", lambda: advisories)
+    waypoints = [{"lat": lat, "lon": lon, "altitude": "8500"} for lat, lon in LEG]
+    assert helper.collect_sigmets(waypoints) == advisories
+    assert helper.collect_sigmets(waypoints[:1]) == []
+
+
+def test_route_weather_rate_limits_only_real_requests(synthetic, monkeypatch):
+    import upstream
+
+    sleeps = []
+    monkeypatch.setattr(helper.time, "sleep", sleeps.append)
+    points = [(37.0 + i * 0.5, -122.0) for i in range(4)]
+
+    helper.route_weather(points)
+    assert len(sleeps) == 4
+    helper.route_weather(points)
+    assert len(sleeps) == 4
+    # The prefetcher revalidates every point, so each one is a request again.
+    with upstream.revalidating():
+        helper.route_weather(points)
+    assert len(sleeps) == 8
+    assert sum("open-meteo" in url for url in synthetic.urls) == 8
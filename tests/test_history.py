@@ -0,0 +1,109 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import history
+from records import metar_records, taf_records
+
+HOUR = 3600
+NOW = int(time.time())
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_DIR", str(tmp_path))
+    monkeypatch.setattr(history, "HISTORY_ENABLED", True)
+    monkeypatch.setattr(history, "_written", {})
+    return tmp_path
+
+
+def _metar(t, ceiling, visib="10", station="KSFO"):
+    clouds = [{"cover": "BKN", "base": ceiling}] if ceiling is not None else []
+    return {"icaoId": station, "obsTime": t, "rawOb": f"{station} {t}", "visib": visib, "clouds": clouds,
+            "wdir": 270, "wspd": 10, "temp": 12.0, "altim": 1016.9}
+
+
+def test_observations_come_back_in_time_order():
+    history.record_observations(metar_records([_metar(NOW - 2 * HOUR, 2500), _metar(NOW - HOUR, 900, station="KRNO")]))
+    history.record_observations(metar_records([_metar(NOW - HOUR, 800, "2")]))
+    # Older than what was already written for the station: skipped.
+    assert history.record_observations(metar_records([_metar(NOW - 3 * HOUR, 500)])) == 0
+    obs = history.observations("KSFO", NOW - 3 * HOUR, NOW)
+    assert obs["time"].tolist() == [NOW - 2 * HOUR, NOW - HOUR]
+    assert obs["ceiling"].tolist() == [2500, 800]
+    assert obs["visibility"].tolist() == [10, 2]
+    assert obs["category"].tolist() == [2, 3]
+    assert len(history.observations("KRNO", NOW - 3 * HOUR, NOW)["time"]) == 1
+    assert len(history.observations("KSFO", NOW - 10 * HOUR, NOW - 3 * HOUR)["time"]) == 0
+
+
+def test_missing_values_are_stored_as_blanks():
+    history.record_observations(metar_records([_metar(NOW, None, "")]))
+    obs = history.observations("KSFO", NOW - HOUR, NOW)
+    assert np.isnan(obs["ceiling"][0]) and np.isnan(obs["visibility"][0])
+    assert obs["category"].tolist() == [5]
+
+
+def test_a_report_is_written_once_and_read_once():
+    metars = metar_records([_metar(NOW, 2500)])
+    assert history.record_observations(metars) == 1
+    assert history.record_observations(metars) == 0
+    # Another process sharing the directory writes it again.
+    history._written.clear()
+    assert history.record_observations(metars) == 1
+    assert len(history.observations("KSFO", NOW - HOUR, NOW)["time"]) == 1
+
+
+def test_torn_tail_is_ignored(store):
+    history.record_observations(metar_records([_metar(NOW, 2500)]))
+    day = history._day(NOW)
+    with open(os.path.join(store, "metar", day, "time.bin"), "ab") as f:
+        f.write(b"\0" * 8)
+    assert len(history.observations("KSFO", NOW - HOUR, NOW)["time"]) == 1
+
+
+def test_forecast_periods():
+    taf = {"icaoId": "KSFO", "issueTime": NOW - 2 * HOUR, "rawTAF": "TAF KSFO", "fcsts": [
+        {"timeFrom": NOW - 2 * HOUR, "timeTo": NOW, "visib": "6+", "clouds": [{"cover": "BKN", "base": 2000}]},
+        {"timeFrom": NOW, "timeTo": NOW + 6 * HOUR, "fcstChange": "FM", "visib": "1/2", "clouds": []},
+    ]}
+    assert history.record_forecasts(taf_records([taf])) == 2
+    history._written.clear()
+    history.record_forecasts(taf_records([taf]))
+    fc = history.forecasts("KSFO", NOW - 3 * HOUR, NOW)
+    assert fc["start"].tolist() == [NOW - 2 * HOUR, NOW]
+    assert fc["change"].tolist() == [b"", b"FM"]
+    assert fc["category"].tolist() == [2, 4]
+
+
+def test_trend_line():
+    history.record_observations(metar_records([_metar(NOW - 3 * HOUR, 3500), _metar(NOW - 2 * HOUR, 2500),
+                                               _metar(NOW - HOUR, 900)]))
+    line = history.station_trend("KSFO", now=NOW)
+    assert line.startswith("KSFO trend, last 6 h (3 reports): ceiling 3500 ft → 900 ft (dropped 2 times)")
+    assert "category VFR → IFR (2 changes)" in line
+    assert history.station_trend("KRNO", now=NOW) is None
+
+
+def test_archive_response_routes_by_product():
+    history.archive_response("https://aviationweather.gov/api/data/metar?ids=KSFO&format=json",
+                             metar_records([_metar(NOW, 2500)]))
+    history.archive_response("https://api.open-meteo.com/v1/forecast", {"current_weather": {}})
+    assert len(history.observations("KSFO", NOW - HOUR, NOW)["time"]) == 1
+
+
+def test_disabled_store_writes_nothing(store, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_ENABLED", False)
+    assert history.record_observations(metar_records([_metar(NOW, 2500)])) == 0
+    assert not os.listdir(store)
+
+
+def test_prune_drops_old_days(store):
+    old = time.time() - 40 * 86400
+    history.record_observations(metar_records([_metar(int(old), 2500)]))
+    recent = int(time.time())
+    history.record_observations(metar_records([_metar(recent, 2500)]))
+    history.prune()
+    assert os.listdir(os.path.join(store, "metar")) == [history._day(recent)]
@@ -0,0 +1,70 @@
+from helper import pireps_in_band
+from pirep import decode_pirep, decode_pireps
+
+
+def test_decodes_every_group():
+    report = decode_pirep("ORD UA /OV ORD180015/TM 1402/FL120/TP E145/SK OVC020-TOP110/TA M08/IC MOD RIME 090-120")
+    assert not report.urgent
+    assert report.location == "ORD180015"
+    assert report.time == "1402"
+    assert report.altitude == 12000
+    assert report.aircraft == "E145"
+    assert report.sky == "OVC020-TOP110"
+    assert report.tops == 11000
+    assert (report.ice_intensity, report.ice_low, report.ice_high) == ("MOD", 9000, 12000)
+    assert report.turbulence is None
+
+
+def test_urgent_report_and_intensity_range():
+    report = decode_pirep("DEN UUA /OV DEN270040/TM 2105/FL350/TP B738/TB MOD-SEV 330-370/RM TOPS 390")
+    assert report.urgent
+    assert (report.turb_intensity, report.turb_low, report.turb_high) == ("MOD-SEV", 33000, 37000)
+    assert report.tops == 39000
+
+
+def test_below_and_above_levels_are_open_ranges():
+    below = decode_pirep("SAC UA /OV SAC/TM 1850/FL080/TP C172/TB LGT BLO 050")
+    assert (below.turb_low, below.turb_high) == (0, 5000)
+    above = decode_pirep("DEN UA /OV DEN/TM 2105/FL250/TP B738/IC LGT RIME ABV 300")
+    assert (above.ice_low, above.ice_high) == (30000, float("inf"))
+
+
+def test_single_level_hazard():
+    report = decode_pirep("SAC UA /OV SAC/TM 1850/FLUNKN/TP C172/TB LGT 080")
+    assert report.altitude is None
+    assert (report.turb_low, report.turb_high) == (8000, 8000)
+
+
+def test_unreadable_flight_level_falls_back_to_the_api_field():
+    report = decode_pirep("SFO UA /OV OAK/TM 0315/FLDURD/TP A320", flight_level=4000)
+    assert report.altitude == 4000
+
+
+def test_summary():
+    summary = decode_pirep("SAC UA /OV SAC090020/TM 1850/FL080/TP C172/TB LGT").summary()
+    assert summary == ("Altitude: 8000 ft; Aircraft type: C172; Reported over: SAC090020; "
+                       "Report time: 1850 Z; Turbulence reported: LGT")
+    assert decode_pirep("").summary() == "Unable to summarize PIREP."
+
+
+def test_decode_pireps_skips_reports_without_a_position():
+    feed = [
+        {"lat": 38.5, "lon": -121.0, "rawOb": "SAC UA /OV SAC/TM 1850/FL080/TP C172", "fltLvl": "080"},
+        {"lat": None, "lon": -121.0, "rawOb": "SAC UA /OV SAC/TM 1850/FL080/TP C172"},
+        "not a report",
+    ]
+    reports = decode_pireps(feed)
+    assert [(r.lat, r.altitude) for r in reports] == [(38.5, 8000)]
+
+
+def test_band_keeps_reports_whose_layers_reach_it():
+    band = (6500, 10500)
+    reports = [
+        decode_pirep("SAC UA /OV SAC/TM 1850/FL150/TP C172/IC MOD 040-080"),
+        decode_pirep("SAC UA /OV SAC/TM 1850/FL020/TP C172/TB LGT BLO 120"),
+        decode_pirep("SAC UA /OV SAC/TM 1850/FL350/TP B738/TB MOD ABV 050"),
+        decode_pirep("SAC UA /OV SAC/TM 1850/FL350/TP B738/TB MOD 330-370"),
+        decode_pirep("SAC UA /OV SAC/TM 1850/FLUNKN/TP B738"),
+    ]
+    kept = pireps_in_band(reports, band)
+    assert kept == [reports[0], reports[1], reports[2], reports[4]]
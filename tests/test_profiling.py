@@ -0,0 +1,27 @@
+import os
+
+import profiling
+
+
+def test_query_flag_needs_the_operator_opt_in(monkeypatch):
+    monkeypatch.delenv("AEROBRIEF_PROFILE", raising=False)
+    monkeypatch.setattr(profiling, "PROFILE_QUERY", False)
+    assert not profiling.profile_requested({"profile": "1"})
+    monkeypatch.setattr(profiling, "PROFILE_QUERY", True)
+    assert profiling.profile_requested({"profile": "1"})
+    assert not profiling.profile_requested({"profile": "0"})
+    assert not profiling.profile_requested({})
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 3)
+    for i in range(5):
+        with profiling.profiled(f"KSFO-KRNO-{i}") as result:
+            sum(range(1000))
+        os.utime(result["path"], (i, i))
+    (tmp_path / "notes.txt").write_text("not a profile")
+    profiling.rotate_profiles()
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 4 and "notes.txt" in names
+    assert all(f"KSFO-KRNO-{i}" in " ".join(names) for i in (2, 3, 4))
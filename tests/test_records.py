@@ -0,0 +1,42 @@
+import numpy as np
+
+from records import flight_category, metar_records, visibility_sm
+
+NAN = np.nan
+
+
+def test_visibility_forms():
+    assert visibility_sm(10) == 10.0
+    assert visibility_sm(2.5) == 2.5
+    assert visibility_sm("10+") == 10.0
+    assert visibility_sm("6+") == 6.0
+    assert visibility_sm("1/2") == 0.5
+    assert visibility_sm("1 1/2") == 1.5
+    assert visibility_sm("3SM") == 3.0
+
+
+def test_unreadable_visibility_is_nan():
+    for value in (None, "", "  ", "M1/4", "1/0", [10]):
+        assert np.isnan(visibility_sm(value)), value
+
+
+def test_category_limits():
+    ceiling = np.array([NAN, 3500, 3000, 999, 1000, 499, 500, NAN, NAN, NAN, NAN, 5000])
+    visibility = np.array([10, 10, 10, 10, 10, 10, 10, 5.5, 5, 2.5, 0.75, 0.5])
+    assert flight_category(ceiling, visibility).tolist() == [1, 1, 2, 3, 2, 4, 3, 1, 2, 3, 4, 4]
+
+
+def test_unknown_only_when_both_are_missing():
+    ceiling = np.array([NAN, NAN, 800])
+    visibility = np.array([NAN, 10, NAN])
+    assert flight_category(ceiling, visibility).tolist() == [5, 1, 3]
+
+
+def test_metar_records_keep_only_what_the_briefing_reads():
+    entry = {"icaoId": "KSFO", "rawOb": "KSFO 191756Z 29012KT 10SM FEW015 18/12 A3001", "visib": "10+",
+             "clouds": [{"cover": "FEW", "base": 1500, "type": None}], "dbPopTime": "2026-10-19 18:00:00"}
+    (record,) = metar_records([entry])
+    assert record.icao == "KSFO" and record.visib == "10+"
+    assert record.clouds == (("FEW", 1500),)
+    assert not hasattr(record, "__dict__")
+    assert metar_records([entry]) == [record]
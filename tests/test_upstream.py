@@ -0,0 +1,178 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import upstream
+from upstream import SingleFlight
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def _concurrently(n, fn):
+    results = [None] * n
+    errors = [None] * n
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+@pytest.fixture
+def transport():
+    # A stand-in upstream that holds every request until released.
+    class Gate:
+        def __init__(self):
+            self.release = threading.Event()
+            self.calls = 0
+            self.error = None
+
+        def __call__(self, url, params, timeout):
+            self.calls += 1
+            self.release.wait(5)
+            if self.error is not None:
+                raise self.error
+            return {"url": url}
+
+    gate = Gate()
+    upstream.clear()
+    upstream._breakers.clear()
+    upstream.set_transport(gate)
+    yield gate
+    gate.release.set()
+    upstream.set_transport(None)
+    upstream.clear()
+    upstream._breakers.clear()
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "metar"
+
+    threads, results, errors = _concurrently(8, lambda: flight.do("KSFO", fetch))
+    _wait_for(lambda: flight.stats()["requests"] == 8)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["metar"] * 8 and errors == [None] * 8
+    assert len(calls) == 1
+    assert flight.stats() == {"requests": 8, "upstream_calls": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_waiters_get_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise requests.exceptions.ReadTimeout("slow")
+
+    threads, results, errors = _concurrently(4, lambda: flight.do("KSFO", fetch))
+    _wait_for(lambda: flight.stats()["requests"] == 4)
+    release.set()
+    for t in threads:
+        t.join()
+    assert all(isinstance(e, requests.exceptions.ReadTimeout) for e in errors)
+
+
+def test_nothing_is_kept_after_the_call():
+    flight = SingleFlight()
+    assert flight.do("KSFO", lambda: 1) == 1
+    assert flight.do("KSFO", lambda: 2) == 2
+    assert flight.do("KRNO", lambda: 3) == 3
+    assert flight.stats()["upstream_calls"] == 3
+
+
+def test_get_json_coalesces_identical_requests(transport):
+    url = "https://aviationweather.gov/api/data/metar?ids=KSFO&format=json"
+    threads, results, errors = _concurrently(6, lambda: upstream.get_json(url))
+    _wait_for(lambda: transport.calls == 1 and upstream._flight.stats()["in_flight"] == 1)
+    time.sleep(0.05)
+    transport.release.set()
+    for t in threads:
+        t.join()
+    assert errors == [None] * 6
+    assert results == [{"url": url}] * 6
+    assert transport.calls == 1
+    # And the next caller is a cache hit.
+    assert upstream.get_json(url) == {"url": url}
+    assert transport.calls == 1
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    breaker = upstream.CircuitBreaker(threshold=3, cooldown=30)
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+
+    # After the cooldown exactly one trial call gets through.
+    now = time.time() + 31
+    monkeypatch.setattr(upstream.time, "time", lambda: now)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_trial_reopens_and_released_trial_retries(monkeypatch):
+    breaker = upstream.CircuitBreaker(threshold=1, cooldown=30)
+    breaker.record(False)
+    now = time.time() + 31
+    monkeypatch.setattr(upstream.time, "time", lambda: now)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+
+
+def test_one_failure_with_many_waiters_counts_once(transport):
+    transport.error = requests.exceptions.ConnectionError("down")
+    url = "https://aviationweather.gov/api/data/metar?ids=KSFO&format=json"
+    threads, results, errors = _concurrently(5, lambda: upstream.get_json(url))
+    _wait_for(lambda: upstream._flight.stats()["in_flight"] == 1)
+    time.sleep(0.05)
+    transport.release.set()
+    for t in threads:
+        t.join()
+    assert all(isinstance(e, requests.exceptions.ConnectionError) for e in errors)
+    breaker = upstream._breakers["aviationweather.gov"]
+    assert transport.calls == 1
+    assert breaker.failures == 1
+    assert breaker.state == "closed"
+
+
+def test_bad_payload_does_not_count_against_the_host(transport):
+    transport.release.set()
+    url = "https://aviationweather.gov/api/data/taf?ids=KSFO&format=json"
+
+    def decode(data):
+        raise ValueError("not a TAF")
+
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            upstream.get_json(url, decode=decode)
+    assert upstream._breakers["aviationweather.gov"].failures == 0
+    assert upstream._breakers["aviationweather.gov"].state == "closed"
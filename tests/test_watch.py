@@ -0,0 +1,39 @@
+import briefing
+import upstream
+from watch import RouteWatch
+
+ROUTE = [{"airport_id": "KSFO", "altitude": "8500"}, {"airport_id": "KRNO", "altitude": "9500"}]
+
+
+def _ifr_at(icao, transport):
+    def fetch(url, params, timeout):
+        data = transport(url, params, timeout)
+        if "/metar" in url:
+            for entry in data:
+                if entry["icaoId"] == icao:
+                    entry.update(visib="2", clouds=[{"cover": "OVC", "base": 800}])
+        return data
+    return fetch
+
+
+def test_watch_reports_only_real_changes(synthetic, monkeypatch):
+    summaries = []
+    monkeypatch.setattr(briefing, "ask_llm", lambda prompt: summaries.append(prompt) or f"summary {len(summaries)}")
+    watch = RouteWatch("AB123", ROUTE, interval=0)
+
+    events = watch.poll()
+    assert [e["kind"] for e in events] == ["briefing"]
+    assert events[0]["new"] == "summary 1"
+
+    # Same weather: products are refetched (interval 0) but nothing moved.
+    assert watch.poll() == []
+    assert len(summaries) == 1
+
+    upstream.clear()
+    upstream.set_transport(_ifr_at("KRNO", synthetic))
+    events = watch.poll()
+    kinds = {e["kind"] for e in events}
+    assert {"category", "metar", "summary"} <= kinds
+    category = next(e for e in events if e["kind"] == "category")
+    assert category["node"] == "category KRNO" and category["new"] == 3
+    assert len(summaries) == 2
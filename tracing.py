@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+try:
+    from prometheus_client import Histogram, start_http_server
+except ImportError:
+    Histogram = None
+
+
+# Lightweight spans around the briefing stages. A span always feeds the
+# Prometheus histogram (when prometheus_client is installed) and, inside
+# tracing(trace), is also recorded on that trace for the waterfall panel and
+# the structured log line.
+#
+#   AEROBRIEF_TRACE_LOG=1         print one JSON line per finished briefing
+#   AEROBRIEF_METRICS_PORT=9108   expose /metrics for Prometheus
+TRACE_LOG = bool(os.environ.get("AEROBRIEF_TRACE_LOG"))
+
+_current = ContextVar("aerobrief_trace", default=None)
+
+_histogram = None
+if Histogram is not None:
+    _histogram = Histogram("aerobrief_span_seconds", "Time spent per briefing span", ["span"],
+                           buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+_metrics_started = False
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port=None):
+    global _metrics_started
+    port = port or os.environ.get("AEROBRIEF_METRICS_PORT")
+    with _metrics_lock:
+        if _histogram is None or not port or _metrics_started:
+            return False
+        start_http_server(int(port))
+        _metrics_started = True
+        return True
+
+
+class Span:
+    __slots__ = ("name", "detail", "start", "end", "thread")
+
+    def __init__(self, name, detail, start, end, thread):
+        self.name = name
+        self.detail = detail
+        self.start = start
+        self.end = end
+        self.thread = thread
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def rows(self):
+        # Spans as offsets from the start of the briefing, in start order.
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [{
+            "span": s.name,
+            "detail": s.detail,
+            "start": s.start - self.started,
+            "end": s.end - self.started,
+            "seconds": s.end - s.start,
+            "thread": s.thread,
+        } for s in spans]
+
+    def totals(self):
+        totals = {}
+        for row in self.rows():
+            count, seconds = totals.get(row["span"], (0, 0.0))
+            totals[row["span"]] = (count + 1, seconds + row["seconds"])
+        return totals
+
+    def log(self):
+        print(json.dumps({
+            "event": "briefing_trace",
+            "trace": self.name,
+            "elapsed": round(time.perf_counter() - self.started, 4),
+            "spans": [{k: round(v, 4) if isinstance(v, float) else v for k, v in row.items()} for row in self.rows()],
+        }), flush=True)
+
+
+@contextmanager
+def span(name, detail=""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if _histogram is not None:
+            _histogram.labels(name).observe(end - start)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(Span(name, detail, start, end, threading.current_thread().name))
+
+
+@contextmanager
+def tracing(trace):
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def submit(pool, fn, *args):
+    # pool.submit that keeps the caller's trace in the worker thread.
+    return pool.submit(copy_context().run, fn, *args)
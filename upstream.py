@@ -0,0 +1,462 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from tracing import span
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Process-wide request coalescing: while a call for a key is in flight,
+    # every other caller asking for the same key waits for it and shares its
+    # result (or its exception) instead of hitting the upstream again.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "upstream_calls": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    # Raised when the circuit for a host is open and nothing is cached.
+    pass
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures and rejects calls for
+    # `cooldown` seconds; then lets one trial call through (half-open).
+
+    def __init__(self, threshold=3, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.cooldown and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.time()
+
+    def release(self):
+        # Ends a half-open trial that neither succeeded nor failed on the
+        # network (e.g. a malformed payload), so the next call can try again.
+        with self._lock:
+            self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.time() - self.opened_at >= self.cooldown else "open"
+
+
+# How long a product is served without revalidation (seconds), matched on
+# the URL. Past that it is still served immediately, flagged with its age,
+# while a background refresh runs; past MAX_STALE it is treated as missing.
+PRODUCT_TTL = {
+    "/metar": 300,
+    "/taf": 600,
+    "/pirep": 300,
+    "/airsigmet": 60,
+    "/airport": 86400,
+    "open-meteo": 900,
+}
+DEFAULT_TTL = 300
+MAX_STALE = 6 * 3600
+CACHE_SIZE = 5000
+
+
+class _Entry:
+    __slots__ = ("data", "fetched_at", "last_modified")
+
+    def __init__(self, data, fetched_at, last_modified=None):
+        self.data = data
+        self.fetched_at = fetched_at
+        # The response's Last-Modified as an HTTP-date, sent back as
+        # If-Modified-Since when this entry is revalidated.
+        self.last_modified = last_modified
+
+
+_flight = SingleFlight()
+_cache = {}
+_cache_lock = threading.Lock()
+_breakers = {}
+_refreshing = set()
+_counters = {"calls": 0, "fresh_hits": 0, "stale_served": 0, "not_modified": 0}
+_local = threading.local()
+# Replaces requests.get when set: fn(url, params, timeout) -> JSON. See
+# fixtures.py for the record/replay and mock-server transports. A transport
+# whose `live` attribute is true (the fixture recorder) still counts as the
+# real upstream for observers.
+_transport = None
+# fn(url, data) for every response that came from the real upstream, after
+# decoding: not cache hits, 304s, replayed, mocked or synthetic data.
+_observers = []
+
+
+def _key(url, params):
+    return (url, tuple(sorted((params or {}).items())))
+
+
+def _ttl(url):
+    for marker, ttl in PRODUCT_TTL.items():
+        if marker in url:
+            return ttl
+    return DEFAULT_TTL
+
+
+def _breaker(url):
+    host = urlsplit(url).netloc
+    with _cache_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def observe(fn):
+    if fn not in _observers:
+        _observers.append(fn)
+    return fn
+
+
+def _notify(url, data):
+    for fn in _observers:
+        fn(url, data)
+
+
+def set_transport(transport):
+    global _transport
+    _transport = transport
+    return transport
+
+
+def _http_date(value):
+    # Normalised HTTP-date, or None for a missing or unparseable header.
+    try:
+        return format_datetime(parsedate_to_datetime(value), usegmt=True) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def sent():
+    # Upstream requests this thread has made: not cache hits, waits on a
+    # coalesced request or background refreshes. route_weather rate-limits
+    # on it.
+    return getattr(_local, "sent", 0)
+
+
+def _fetch_json(url, params, timeout, decode, cached=None):
+    # -> (data, last_modified, live). With a cached entry that has a
+    # Last-Modified the request is conditional, and a 304 returns the cached
+    # data as is. live: a new response from the real upstream.
+    _local.sent = sent() + 1
+    if _transport is not None:
+        data = _transport(url, params, timeout)
+        return (data if decode is None else decode(data)), None, bool(getattr(_transport, "live", False))
+    kwargs = {}
+    if cached is not None and cached.last_modified:
+        kwargs["headers"] = {"If-Modified-Since": cached.last_modified}
+    response = requests.get(url, params=params, timeout=timeout, **kwargs)
+    if kwargs and response.status_code == 304:
+        with _cache_lock:
+            _counters["not_modified"] += 1
+        return cached.data, cached.last_modified, False
+    response.raise_for_status()
+    data = response.json()
+    return (data if decode is None else decode(data)), _http_date(response.headers.get("Last-Modified")), True
+
+
+def _store(key, data, last_modified=None):
+    with _cache_lock:
+        _cache.pop(key, None)
+        if len(_cache) >= CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+        _cache[key] = _Entry(data, time.time(), last_modified)
+
+
+def _span_name(url, params):
+    # "fetch metar" / "fetch forecast" plus the stations or point asked for.
+    parts = urlsplit(url)
+    product = parts.path.rstrip("/").rsplit("/", 1)[-1] or parts.netloc
+    query = dict(p.split("=", 1) for p in parts.query.split("&") if "=" in p)
+    query.update(params or {})
+    detail = query.get("ids") or query.get("bbox") or ""
+    if "latitude" in query:
+        detail = f"{float(query['latitude']):.2f},{float(query['longitude']):.2f}"
+    return f"fetch {product}", str(detail)
+
+
+def _fetch_once(breaker, url, params, timeout, decode, cached):
+    # Runs in the SingleFlight leader only, so one upstream failure counts
+    # once against the host however many callers were waiting on it. Only
+    # request errors count: a payload that does not parse or decode
+    # (ValueError, including requests' JSONDecodeError) is not the host
+    # being down.
+    try:
+        result = _fetch_json(url, params, timeout, decode, cached)
+    except requests.exceptions.RequestException as e:
+        if not isinstance(e, ValueError):
+            breaker.record(False)
+        raise
+    finally:
+        breaker.release()
+    breaker.record(True)
+    return result
+
+
+def _fetch(key, url, params, timeout, decode=None, cached=None):
+    breaker = _breaker(url)
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"circuit open for {urlsplit(url).netloc}")
+    with span(*_span_name(url, params)):
+        return _flight.do(key, lambda: _fetch_once(breaker, url, params, timeout, decode, cached))
+
+
+def _fetch_and_store(key, url, params, timeout, decode=None):
+    with _cache_lock:
+        cached = _cache.get(key)
+    data, last_modified, live = _fetch(key, url, params, timeout, decode, cached)
+    _store(key, data, last_modified)
+    if live:
+        _notify(url, data)
+    return data
+
+
+def _refresh(key, url, params, timeout, decode):
+    try:
+        _fetch_and_store(key, url, params, timeout, decode)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print("Background refresh failed:", url, e)
+    finally:
+        with _cache_lock:
+            _refreshing.discard(key)
+
+
+def _refresh_in_background(key, url, params, timeout, decode):
+    with _cache_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    threading.Thread(target=_refresh, args=(key, url, params, timeout, decode), daemon=True).start()
+
+
+@contextmanager
+def revalidating():
+    # Inside this block get_json always goes upstream and refreshes the cache
+    # (used by the prefetch scheduler to keep watched products warm).
+    _local.revalidate = True
+    try:
+        yield
+    finally:
+        _local.revalidate = False
+
+
+def get_json(url, params=None, timeout=10, ttl=None, decode=None):
+    # decode turns the JSON into whatever the cache should hold for this URL
+    # (e.g. compact records); every caller of a URL must pass the same one.
+    key = _key(url, params)
+    ttl = _ttl(url) if ttl is None else ttl
+
+    revalidate = getattr(_local, "revalidate", False)
+    with _cache_lock:
+        _counters["calls"] += 1
+        entry = _cache.get(key)
+        age = None if entry is None or revalidate else time.time() - entry.fetched_at
+        if age is not None and age < ttl:
+            _counters["fresh_hits"] += 1
+            return entry.data
+        if age is not None and age < MAX_STALE:
+            _counters["stale_served"] += 1
+        else:
+            entry = None
+    if entry is not None:
+        # Serve the last good copy now; never block on a slow upstream.
+        if _breaker(url).state != "open":
+            _refresh_in_background(key, url, params, timeout, decode)
+        return entry.data
+
+    return _fetch_and_store(key, url, params, timeout, decode)
+
+
+def _fetch_batch(items, batch_url, split, timeout, decode):
+    url = batch_url(list(items))
+    # Own coalescing key: a one-item batch has the same URL as the item, but
+    # returns raw JSON where get_json callers expect decoded data.
+    data, _, live = _fetch(("batch",) + _key(url, None), url, None, timeout)
+    parts = split(data)
+    for item, item_url in items.items():
+        # Nothing in the response for an item is an answer too (e.g. a
+        # station without a current METAR), cached like a single empty reply.
+        part = parts.get(item, [])
+        part = part if decode is None else decode(part)
+        _store(_key(item_url, None), part)
+        if live:
+            _notify(item_url, part)
+
+
+def _refresh_batch(items, batch_url, split, timeout, decode):
+    try:
+        _fetch_batch(items, batch_url, split, timeout, decode)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print("Background refresh failed:", batch_url(list(items)), e)
+    finally:
+        with _cache_lock:
+            for item_url in items.values():
+                _refreshing.discard(_key(item_url, None))
+
+
+def prefetch_batch(items, batch_url, split, timeout=10, decode=None):
+    # Make get_json(url) a cache hit for every {item: url} in items with one
+    # upstream request instead of one per url: batch_url(item_list) is the
+    # combined request and split(json) -> {item: json} the per-item replies.
+    # Items with no usable copy are fetched now; items with a stale copy are
+    # refreshed the same way in the background, so callers never block on
+    # them. Returns the number of items fetched now.
+    missing = {}
+    stale = {}
+    now = time.time()
+    revalidate = getattr(_local, "revalidate", False)
+    circuit_open = bool(items) and _breaker(next(iter(items.values()))).state == "open"
+    with _cache_lock:
+        for item, url in items.items():
+            key = _key(url, None)
+            entry = _cache.get(key)
+            if entry is None or revalidate or now - entry.fetched_at >= MAX_STALE:
+                missing[item] = url
+            elif now - entry.fetched_at >= _ttl(url) and not circuit_open and key not in _refreshing:
+                _refreshing.add(key)
+                stale[item] = url
+    if stale:
+        threading.Thread(target=_refresh_batch, args=(stale, batch_url, split, timeout, decode), daemon=True).start()
+    if missing:
+        _fetch_batch(missing, batch_url, split, timeout, decode)
+    return len(missing)
+
+
+def age(url, params=None):
+    # Seconds since the cached copy of this product was fetched, or None.
+    with _cache_lock:
+        entry = _cache.get(_key(url, params))
+    return None if entry is None else time.time() - entry.fetched_at
+
+
+def clear():
+    # Forget every cached response (cold-start benchmarks).
+    with _cache_lock:
+        _cache.clear()
+        _refreshing.clear()
+
+
+def stats():
+    s = _flight.stats()
+    with _cache_lock:
+        s.update(_counters)
+        s["cached"] = len(_cache)
+        s["circuits"] = {host: b.state for host, b in _breakers.items()}
+    return s
+
+
+if os.environ.get("AEROBRIEF_FIXTURES") or os.environ.get("AEROBRIEF_MOCK_URL"):
+    from fixtures import transport_from_env
+    set_transport(transport_from_env())
+
+
+if __name__ == "__main__":
+    # Load test: many sessions briefing the same hub at once against a slow
+    # stand-in for aviationweather.gov.
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow_get(url, params=None, timeout=None, headers=None):
+        time.sleep(0.2)
+
+        class Response:
+            status_code = 200
+            headers = {}
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return [{"icaoId": "KORD", "rawOb": "KORD 121851Z 27010KT 10SM FEW250 21/09 A3001"}]
+
+        return Response()
+
+    requests.get = slow_get
+    sessions = 200
+    urls = [f"https://aviationweather.gov/api/data/{product}?ids=KORD&format=json" for product in ("metar", "taf")]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        list(pool.map(lambda i: get_json(urls[i % len(urls)]), range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    s = stats()
+    print(f"{s['calls']} requests in {elapsed:.2f} s: {s['upstream_calls']} upstream calls, "
+          f"{s['coalesced']} coalesced, {s['fresh_hits']} served from cache")
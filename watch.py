@@ -0,0 +1,186 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from briefing import (
+    BriefingGraph,
+    airport_stage,
+    station_stage,
+    leg_stage,
+    node_label,
+    pirep_corridor_stage,
+    route_legs,
+    sigmet_stage,
+    summary_stage,
+)
+
+
+WATCH_INTERVAL = 120
+WATCH_WORKERS = 16
+
+
+def _diff_sets(old, new):
+    return {"added": sorted(new - old), "removed": sorted(old - new)}
+
+
+def _sigmet_ids(advisories):
+    return {str(a["id"]) for a in advisories or []}
+
+
+def _pirep_raws(pireps):
+    return {p["pirep_raw"] for p in pireps or []}
+
+
+def _weather_codes(warnings):
+    return {f"{w['point_index']}:{w.get('code')}" for w in warnings or [] if "error" not in w}
+
+
+# What to report for each kind of tracked node when its version moves.
+_describe = {
+    "category": lambda old, new: {"old": old, "new": new},
+    "metar": lambda old, new: {"new": new},
+    "taf": lambda old, new: {"new": new},
+    "sigmets": lambda old, new: _diff_sets(_sigmet_ids(old), _sigmet_ids(new)),
+    "leg_pireps": lambda old, new: _diff_sets(_pirep_raws(old), _pirep_raws(new)),
+    "route_weather": lambda old, new: _diff_sets(_weather_codes(old), _weather_codes(new)),
+    "summary": lambda old, new: {"new": new},
+}
+
+
+class RouteWatch:
+    # Re-briefs one filed route on every poll, keeping its BriefingGraph
+    # between polls. Products are refetched once they are older than the poll
+    # interval; unchanged products keep their node version, so only the
+    # affected waypoints and legs are recomputed, and the LLM summary only
+    # reruns when a flight category or hazard changed.
+
+    def __init__(self, flight_id, waypoints, interval=WATCH_INTERVAL):
+        self.flight_id = flight_id
+        self.waypoints = waypoints
+        self.graph = BriefingGraph(max_age=interval)
+        self.airports = []
+        self.polls = 0
+
+    def _tracked(self):
+        stations = tuple(dict.fromkeys(a["airport_id"] for a in self.airports if not a.get("error")))
+        keys = [("summary",), ("sigmets",) + stations]
+        for icao in stations:
+            keys += [("category", icao), ("metar", icao), ("taf", icao)]
+        for a, b, _ in route_legs(self.airports):
+            keys += [("leg_pireps", a, b), ("route_weather", a, b)]
+        return keys
+
+    def poll(self):
+        graph = self.graph
+        with graph.run_lock:
+            before = graph.snapshot(self._tracked())
+            graph.start()
+            try:
+                station_stage(self.waypoints)
+                self.airports = [airport_stage(graph, w) for w in self.waypoints]
+                corridor_key = pirep_corridor_stage(graph, self.airports)
+                for a, b, band in route_legs(self.airports):
+                    leg_stage(graph, a, b, band, corridor_key)
+                sigmet_stage(graph, self.airports)
+                summary_stage(graph, self.airports, hazards_only=True)
+            finally:
+                graph.finish()
+            after = graph.snapshot(self._tracked())
+
+        self.polls += 1
+        if not before:
+            return [self._event("briefing", ("summary",), {"new": after.get(("summary",), (None, None))[1]})]
+
+        events = []
+        for key, (version, value) in after.items():
+            old_version, old_value = before.get(key, (None, None))
+            if version == old_version:
+                continue
+            change = _describe[key[0]](old_value, value)
+            if change.get("added") == [] and change.get("removed") == []:
+                continue
+            events.append(self._event(key[0], key, change))
+        return events
+
+    def _event(self, kind, key, change):
+        return {
+            "flight": self.flight_id,
+            "kind": kind,
+            "node": node_label(key),
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **change,
+        }
+
+    def report(self):
+        return self.graph.report()
+
+
+class Watcher:
+    # Polls many RouteWatches on a shared pool. All of them go through the
+    # same upstream cache, so flights sharing stations or a SIGMET feed cost
+    # one fetch per product per interval, not one per flight.
+
+    def __init__(self, on_event=print, interval=WATCH_INTERVAL, workers=WATCH_WORKERS):
+        self.on_event = on_event
+        self.interval = interval
+        self.workers = workers
+        self.watches = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def add(self, flight_id, waypoints):
+        with self._lock:
+            self.watches[flight_id] = RouteWatch(flight_id, waypoints, self.interval)
+
+    def remove(self, flight_id):
+        with self._lock:
+            self.watches.pop(flight_id, None)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll(self, watch):
+        try:
+            return watch.poll()
+        except Exception as e:
+            return [watch._event("error", ("poll",), {"error": str(e)})]
+
+    def poll_all(self):
+        with self._lock:
+            watches = list(self.watches.values())
+        # Every watched station's METAR and TAF in one request each.
+        station_stage([w for watch in watches for w in watch.waypoints])
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for events in pool.map(self._poll, watches):
+                for event in events:
+                    self.on_event(event)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            self.poll_all()
+            self._stop.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+
+if __name__ == "__main__":
+    # python watch.py flights.json
+    # flights.json: {"N123AB": [{"airport_id": "KSFO", "altitude": "8500"}, ...], ...}
+    with open(sys.argv[1]) as f:
+        flights = json.load(f)
+    watcher = Watcher(on_event=lambda event: print(json.dumps(event), flush=True))
+    for flight_id, waypoints in flights.items():
+        watcher.add(flight_id, waypoints)
+    watcher.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        watcher.stop()